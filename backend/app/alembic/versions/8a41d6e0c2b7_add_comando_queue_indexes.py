@@ -0,0 +1,35 @@
+"""add comando queue indexes
+
+Revision ID: 8a41d6e0c2b7
+Revises: 3f7b2c9d1e4a
+Create Date: 2026-10-17 10:03:12.448190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '8a41d6e0c2b7'
+down_revision = '3f7b2c9d1e4a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction. It doesn't block
+    # writes to comando while it builds, so this can run against the live table.
+    with op.get_context().autocommit_block():
+        # A failed concurrent build leaves an INVALID index behind, drop it so
+        # the migration can simply be retried
+        op.drop_index('ix_comando_controlador_id_status_timestamp_criado', table_name='comando', postgresql_concurrently=True, if_exists=True)
+        op.create_index('ix_comando_controlador_id_status_timestamp_criado', 'comando', ['controlador_id', 'status', 'timestamp_criado'], unique=False, postgresql_concurrently=True)
+        op.drop_index('ix_comando_pendente', table_name='comando', postgresql_concurrently=True, if_exists=True)
+        op.create_index('ix_comando_pendente', 'comando', ['controlador_id', 'timestamp_criado'], unique=False, postgresql_where=sa.text("status = 'pendente'"), postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_comando_pendente', table_name='comando', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_comando_controlador_id_status_timestamp_criado', table_name='comando', postgresql_concurrently=True, if_exists=True)
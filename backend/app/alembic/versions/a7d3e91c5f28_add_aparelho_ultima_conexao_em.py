@@ -0,0 +1,94 @@
+"""add aparelho ultima_conexao_em
+
+Revision ID: a7d3e91c5f28
+Revises: f3b8d2a6c914
+Create Date: 2026-10-17 16:20:41.902315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3e91c5f28'
+down_revision = 'f3b8d2a6c914'
+branch_labels = None
+depends_on = None
+
+# Rows converted per transaction, each batch holds its row locks only briefly
+BATCH_SIZE = 5000
+
+
+def upgrade():
+    # Expand: a timestamptz next to the string column, kept in sync by a trigger
+    # while the backfill runs and until the next revision swaps them. Everything
+    # is idempotent, so an interrupted run can simply be run again
+    op.execute("ALTER TABLE aparelho ADD COLUMN IF NOT EXISTS ultima_conexao_em TIMESTAMP WITH TIME ZONE")
+    # Values that aren't a valid timestamp are left null instead of failing.
+    # STABLE, not IMMUTABLE: the cast depends on TimeZone (and DateStyle), so
+    # the function pins the zone strings without an offset were written in
+    op.execute("""
+        CREATE OR REPLACE FUNCTION aparelho_try_timestamptz(value text) RETURNS timestamptz AS $$
+        BEGIN
+            RETURN value::timestamptz;
+        EXCEPTION WHEN others THEN
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql STABLE SET TimeZone = 'UTC'
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION aparelho_sync_ultima_conexao() RETURNS trigger AS $$
+        BEGIN
+            NEW.ultima_conexao_em := aparelho_try_timestamptz(NEW.ultima_conexao);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("DROP TRIGGER IF EXISTS aparelho_sync_ultima_conexao ON aparelho")
+    op.execute("""
+        CREATE TRIGGER aparelho_sync_ultima_conexao
+        BEFORE INSERT OR UPDATE OF ultima_conexao ON aparelho
+        FOR EACH ROW EXECUTE FUNCTION aparelho_sync_ultima_conexao()
+    """)
+
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        # Strings without an offset were written in UTC
+        connection.execute(sa.text("SET TIME ZONE 'UTC'"))
+        # Keyset over the primary key: each batch is its own short transaction
+        # and skips rows already converted by an earlier (interrupted) run
+        last_id = None
+        while True:
+            last_id = connection.execute(
+                sa.text("""
+                    WITH batch AS (
+                        SELECT id FROM aparelho
+                        WHERE ultima_conexao IS NOT NULL
+                          AND ultima_conexao_em IS NULL
+                          AND (CAST(:last_id AS uuid) IS NULL OR id > CAST(:last_id AS uuid))
+                        ORDER BY id
+                        LIMIT :batch_size
+                    ), updated AS (
+                        UPDATE aparelho
+                        SET ultima_conexao_em = aparelho_try_timestamptz(aparelho.ultima_conexao)
+                        FROM batch
+                        WHERE aparelho.id = batch.id
+                    )
+                    SELECT max(id::text) FROM batch
+                """),
+                {"last_id": last_id, "batch_size": BATCH_SIZE},
+            ).scalar()
+            if last_id is None:
+                break
+
+        op.drop_index('ix_aparelho_ultima_conexao_em', table_name='aparelho', postgresql_concurrently=True, if_exists=True)
+        op.create_index('ix_aparelho_ultima_conexao_em', 'aparelho', ['ultima_conexao_em'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix_aparelho_ultima_conexao_em', table_name='aparelho', if_exists=True)
+    op.execute("DROP TRIGGER IF EXISTS aparelho_sync_ultima_conexao ON aparelho")
+    op.execute("DROP FUNCTION IF EXISTS aparelho_sync_ultima_conexao()")
+    op.execute("DROP FUNCTION IF EXISTS aparelho_try_timestamptz(text)")
+    op.drop_column('aparelho', 'ultima_conexao_em')
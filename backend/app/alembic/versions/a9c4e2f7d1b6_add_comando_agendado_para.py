@@ -0,0 +1,33 @@
+"""add comando agendado_para
+
+Revision ID: a9c4e2f7d1b6
+Revises: f1d5b9e3a7c2
+Create Date: 2026-10-17 20:31:47.915302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9c4e2f7d1b6'
+down_revision = 'f1d5b9e3a7c2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Nullable without a default, so no table rewrite; idempotent so a failed
+    # index build can just be retried
+    op.execute("ALTER TABLE comando ADD COLUMN IF NOT EXISTS agendado_para TIMESTAMP WITH TIME ZONE")
+
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_comando_agendado', table_name='comando', postgresql_concurrently=True, if_exists=True)
+        op.create_index('ix_comando_agendado', 'comando', ['agendado_para'], unique=False, postgresql_where=sa.text("status = 'agendado'"), postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_comando_agendado', table_name='comando', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('comando', 'agendado_para')
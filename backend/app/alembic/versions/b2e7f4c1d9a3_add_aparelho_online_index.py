@@ -0,0 +1,29 @@
+"""add aparelho online index
+
+Revision ID: b2e7f4c1d9a3
+Revises: d4c8b6a2e1f7
+Create Date: 2026-10-17 17:05:52.733019
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2e7f4c1d9a3'
+down_revision = 'd4c8b6a2e1f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built without blocking heartbeat writes, see 8a41d6e0c2b7
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_aparelho_online', table_name='aparelho', postgresql_concurrently=True, if_exists=True)
+        op.create_index('ix_aparelho_online', 'aparelho', ['ultima_conexao'], unique=False, postgresql_where=sa.text("status = 'online'"), postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_aparelho_online', table_name='aparelho', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,35 @@
+"""expire lapsed reservado comandos
+
+Revision ID: b4e8c2f6a1d3
+Revises: e9b3a7d5c1f4
+Create Date: 2026-10-17 23:41:19.204587
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e8c2f6a1d3'
+down_revision = 'e9b3a7d5c1f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built under a temporary name and swapped in, so the sweeper keeps an
+    # index to read while the new one is built
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_comando_expira_new', table_name='comando', postgresql_concurrently=True, if_exists=True)
+        op.create_index('ix_comando_expira_new', 'comando', ['expira_em'], unique=False, postgresql_where=sa.text("status IN ('pendente', 'agendado', 'reservado') AND expira_em IS NOT NULL"), postgresql_concurrently=True)
+        op.drop_index('ix_comando_expira', table_name='comando', postgresql_concurrently=True, if_exists=True)
+    op.execute("ALTER INDEX ix_comando_expira_new RENAME TO ix_comando_expira")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_comando_expira_old', table_name='comando', postgresql_concurrently=True, if_exists=True)
+        op.create_index('ix_comando_expira_old', 'comando', ['expira_em'], unique=False, postgresql_where=sa.text("status IN ('pendente', 'agendado') AND expira_em IS NOT NULL"), postgresql_concurrently=True)
+        op.drop_index('ix_comando_expira', table_name='comando', postgresql_concurrently=True, if_exists=True)
+    op.execute("ALTER INDEX ix_comando_expira_old RENAME TO ix_comando_expira")
@@ -0,0 +1,33 @@
+"""add comando expira_em
+
+Revision ID: c8f2d6a4e9b1
+Revises: a9c4e2f7d1b6
+Create Date: 2026-10-17 21:14:05.662819
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8f2d6a4e9b1'
+down_revision = 'a9c4e2f7d1b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Nullable without a default, so no table rewrite; idempotent so a failed
+    # index build can just be retried
+    op.execute("ALTER TABLE comando ADD COLUMN IF NOT EXISTS expira_em TIMESTAMP WITH TIME ZONE")
+
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_comando_expira', table_name='comando', postgresql_concurrently=True, if_exists=True)
+        op.create_index('ix_comando_expira', 'comando', ['expira_em'], unique=False, postgresql_where=sa.text("status IN ('pendente', 'agendado') AND expira_em IS NOT NULL"), postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_comando_expira', table_name='comando', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('comando', 'expira_em')
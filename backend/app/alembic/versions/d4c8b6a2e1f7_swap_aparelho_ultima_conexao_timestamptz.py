@@ -0,0 +1,40 @@
+"""swap aparelho ultima_conexao to timestamptz
+
+Revision ID: d4c8b6a2e1f7
+Revises: a7d3e91c5f28
+Create Date: 2026-10-17 16:34:09.118264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4c8b6a2e1f7'
+down_revision = 'a7d3e91c5f28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Contract: rows written after the backfill were kept in sync by the
+    # trigger, so the swap is a catalog-only change under a brief lock
+    op.execute("DROP TRIGGER IF EXISTS aparelho_sync_ultima_conexao ON aparelho")
+    op.execute("DROP FUNCTION IF EXISTS aparelho_sync_ultima_conexao()")
+    op.execute("DROP FUNCTION IF EXISTS aparelho_try_timestamptz(text)")
+    op.drop_column('aparelho', 'ultima_conexao')
+    op.alter_column('aparelho', 'ultima_conexao_em', new_column_name='ultima_conexao')
+    op.execute("ALTER INDEX ix_aparelho_ultima_conexao_em RENAME TO ix_aparelho_ultima_conexao")
+
+
+def downgrade():
+    op.drop_index('ix_aparelho_ultima_conexao', table_name='aparelho')
+    op.alter_column('aparelho', 'ultima_conexao', new_column_name='ultima_conexao_em')
+    op.add_column('aparelho', sa.Column('ultima_conexao', sqlmodel.sql.sqltypes.AutoString(length=50), nullable=True))
+    op.execute("""
+        UPDATE aparelho
+        SET ultima_conexao = to_char(ultima_conexao_em AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.US"+00:00"')
+        WHERE ultima_conexao_em IS NOT NULL
+    """)
+    op.drop_column('aparelho', 'ultima_conexao_em')
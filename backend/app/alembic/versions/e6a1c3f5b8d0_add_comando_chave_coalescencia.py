@@ -0,0 +1,95 @@
+"""add comando chave_coalescencia
+
+Revision ID: e6a1c3f5b8d0
+Revises: b2e7f4c1d9a3
+Create Date: 2026-10-17 18:02:26.550143
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a1c3f5b8d0'
+down_revision = 'b2e7f4c1d9a3'
+branch_labels = None
+depends_on = None
+
+# Default coalescing rules when this revision was written (COMANDOS_LAST_WRITE_WINS
+# and COMANDOS_NOT_COALESCED), not read from the settings so the migration
+# always does the same. The only effect of other configured rules is that
+# comandos queued before the upgrade don't coalesce as configured
+LAST_WRITE_WINS = ('setpoint',)
+# Rows updated or deleted per transaction, each batch holds its row locks only briefly
+BATCH_SIZE = 5000
+
+
+def upgrade():
+    # Idempotent like the rest, so a failed index build can just be retried
+    op.execute("ALTER TABLE comando ADD COLUMN IF NOT EXISTS chave_coalescencia VARCHAR(255)")
+
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        # Key the pending comandos as crud.coalescing_key does, in batches over
+        # the primary key, each its own short transaction
+        last_id = None
+        while True:
+            last_id = connection.execute(
+                sa.text("""
+                    WITH batch AS (
+                        SELECT id FROM comando
+                        WHERE status = 'pendente'
+                          AND chave_coalescencia IS NULL
+                          AND (CAST(:last_id AS uuid) IS NULL OR id > CAST(:last_id AS uuid))
+                        ORDER BY id
+                        LIMIT :batch_size
+                    ), updated AS (
+                        UPDATE comando
+                        SET chave_coalescencia = CASE
+                            WHEN comando.comando IN :last_write_wins THEN comando.comando
+                            ELSE comando.comando || chr(31) || comando.param
+                        END
+                        FROM batch
+                        WHERE comando.id = batch.id
+                    )
+                    SELECT max(id::text) FROM batch
+                """).bindparams(sa.bindparam('last_write_wins', expanding=True)),
+                {"last_id": last_id, "batch_size": BATCH_SIZE, "last_write_wins": list(LAST_WRITE_WINS)},
+            ).scalar()
+            if last_id is None:
+                break
+
+        # Keep only the newest pending comando of each key. Duplicates queued by
+        # the previous release in between make the build fail, and running the
+        # migration again clears them
+        while True:
+            deleted = connection.execute(
+                sa.text("""
+                    DELETE FROM comando
+                    WHERE id IN (
+                        SELECT id FROM (
+                            SELECT id, row_number() OVER (
+                                PARTITION BY controlador_id, chave_coalescencia
+                                ORDER BY timestamp_criado DESC, id DESC
+                            ) AS position
+                            FROM comando
+                            WHERE status = 'pendente' AND chave_coalescencia IS NOT NULL
+                        ) AS queued
+                        WHERE position > 1
+                        LIMIT :batch_size
+                    )
+                """),
+                {"batch_size": BATCH_SIZE},
+            ).rowcount
+            if deleted < BATCH_SIZE:
+                break
+
+        op.drop_index('ix_comando_coalescencia', table_name='comando', postgresql_concurrently=True, if_exists=True)
+        op.create_index('ix_comando_coalescencia', 'comando', ['controlador_id', 'chave_coalescencia'], unique=True, postgresql_where=sa.text("status = 'pendente' AND chave_coalescencia IS NOT NULL"), postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_comando_coalescencia', table_name='comando', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('comando', 'chave_coalescencia')
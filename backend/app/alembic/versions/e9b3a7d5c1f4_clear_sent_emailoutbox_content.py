@@ -0,0 +1,34 @@
+"""clear sent emailoutbox content
+
+Revision ID: e9b3a7d5c1f4
+Revises: c8f2d6a4e9b1
+Create Date: 2026-10-17 23:02:41.318526
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9b3a7d5c1f4'
+down_revision = 'c8f2d6a4e9b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Only drops the constraint, no table rewrite. The content of the rows sent
+    # so far is left to the purge, which deletes them after the retention
+    op.alter_column('emailoutbox', 'html_content', existing_type=sqlmodel.sql.sqltypes.AutoString(), nullable=True)
+
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_emailoutbox_enviado', table_name='emailoutbox', postgresql_concurrently=True, if_exists=True)
+        op.create_index('ix_emailoutbox_enviado', 'emailoutbox', ['sent_at'], unique=False, postgresql_where=sa.text("status = 'enviado'"), postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_emailoutbox_enviado', table_name='emailoutbox', postgresql_concurrently=True, if_exists=True)
+    op.execute("UPDATE emailoutbox SET html_content = '' WHERE html_content IS NULL")
+    op.alter_column('emailoutbox', 'html_content', existing_type=sqlmodel.sql.sqltypes.AutoString(), nullable=False)
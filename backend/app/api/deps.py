@@ -1,16 +1,21 @@
-from collections.abc import Generator
+import uuid
+from collections.abc import AsyncGenerator, Generator
 from typing import Annotated
 
 import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
+from sqlalchemy.orm import make_transient_to_detached
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.core import security
+from app.core import security, signing
+from app.core.cache import user_cache
 from app.core.config import settings
-from app.core.db import engine
+from app.core.db import async_engine, async_read_engine, engine
 from app.models import TokenPayload, User
 
 reusable_oauth2 = OAuth2PasswordBearer(
@@ -23,10 +28,56 @@ def get_db() -> Generator[Session, None, None]:
         yield session
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSession(async_engine) as session:
+        yield session
+
+
+def token_sub(request: Request) -> str | None:
+    """The sub of the request's bearer token, None without a valid one."""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
+        )
+    except InvalidTokenError:
+        return None
+    sub = payload.get("sub")
+    return sub if isinstance(sub, str) else None
+
+
+async def get_async_read_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Session for read-only handlers, on the replica when one is configured,
+    unless the caller wrote recently (see ReadYourWritesMiddleware).
+    """
+    sub = token_sub(request) if settings.POSTGRES_REPLICA_SERVER else None
+    async with AsyncSession(async_read_engine(sub)) as session:
+        yield session
+
+
 SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
+AsyncReadSessionDep = Annotated[AsyncSession, Depends(get_async_read_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
+def _get_user(session: Session, sub: str) -> User | None:
+    cached = user_cache.get(sub)
+    if cached is None:
+        user = session.get(User, sub)
+        if user is not None:
+            user_cache.set(sub, user.model_dump())
+        return user
+    # Attach the cached row to the session without a SELECT, so routes can still
+    # modify and commit the current user
+    user = User.model_validate(cached)
+    make_transient_to_detached(user)
+    return session.merge(user, load=False)
+
+
 def get_current_user(session: SessionDep, token: TokenDep) -> User:
     try:
         payload = jwt.decode(
@@ -38,7 +89,9 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = session.get(User, token_data.sub)
+    if token_data.sub is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    user = _get_user(session, token_data.sub)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
@@ -55,3 +108,51 @@ def get_current_active_superuser(current_user: CurrentUser) -> User:
             status_code=403, detail="The user doesn't have enough privileges"
         )
     return current_user
+
+
+async def get_current_controlador(request: Request) -> uuid.UUID:
+    """
+    Authenticate a controlador by its HMAC request signature (see app.core.signing).
+
+    Routes with a controlador_id path parameter only accept requests signed by
+    that controlador.
+    """
+    controlador_id = _parse_uuid(request.headers.get(signing.CONTROLADOR_HEADER, ""))
+    if controlador_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing signature"
+        )
+    keys = signing.key_cache.get(controlador_id)
+    if keys is None and not signing.key_cache.unknown(controlador_id):
+        keys = await run_in_threadpool(signing.key_cache.load, controlador_id)
+    try:
+        signing.verify(
+            keys,
+            controlador_id=str(controlador_id),
+            timestamp=request.headers.get(signing.TIMESTAMP_HEADER),
+            nonce=request.headers.get(signing.NONCE_HEADER),
+            signature=request.headers.get(signing.SIGNATURE_HEADER),
+            method=request.method,
+            path=request.url.path,
+            query=request.url.query,
+            body=await request.body(),
+        )
+    except signing.SignatureError as exc:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(exc))
+
+    path_id = request.path_params.get("controlador_id")
+    if path_id is not None and _parse_uuid(path_id) != controlador_id:
+        raise HTTPException(
+            status_code=403, detail="Request signed by another controlador"
+        )
+    return controlador_id
+
+
+def _parse_uuid(value: str) -> uuid.UUID | None:
+    try:
+        return uuid.UUID(value)
+    except ValueError:
+        return None
+
+
+CurrentControlador = Annotated[uuid.UUID, Depends(get_current_controlador)]
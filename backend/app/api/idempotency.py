@@ -0,0 +1,200 @@
+import hashlib
+import logging
+from collections.abc import Callable, Coroutine
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, APIRouter
+from fastapi.types import DecoratedCallable
+from psycopg import errors
+from sqlalchemy import exc, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core import metrics, signing
+from app.core.config import settings
+from app.core.db import async_engine
+from app.core.leader import lock_key
+from app.models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+Handler = Callable[[Request], Coroutine[Any, Any, Response]]
+
+
+class IdempotencyStats:
+    def __init__(self) -> None:
+        self.stored = 0
+        self.replayed = 0
+        self.mismatched = 0
+        self.lock_timeouts = 0
+
+    def snapshot(self) -> dict[str, int]:
+        return {
+            "stored": self.stored,
+            "replayed": self.replayed,
+            "mismatched": self.mismatched,
+            "lock_timeouts": self.lock_timeouts,
+        }
+
+
+stats = IdempotencyStats()
+metrics.register("idempotency", stats.snapshot)
+
+
+def key_hash(request: Request, key: str, request_hash: bytes) -> bytes:
+    """
+    Keys are scoped to who sent them to which route, so two clients picking the
+    same key never see each other's responses. Requests without credentials
+    (signup) are scoped to the client address and their body, so a replay only
+    ever returns the response to the very same request.
+    """
+    sender = (
+        request.headers.get("authorization", ""),
+        request.headers.get(signing.CONTROLADOR_HEADER, ""),
+    )
+    if not any(sender):
+        sender = (request.client.host if request.client else "", request_hash.hex())
+    digest = hashlib.sha256()
+    for part in (request.method, request.url.path, *sender, key):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.digest()
+
+
+async def _idempotent(request: Request, key: str, handler: Handler) -> Response:
+    if len(key) > MAX_KEY_LENGTH:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "detail": f"{IDEMPOTENCY_KEY_HEADER} is longer than "
+                f"{MAX_KEY_LENGTH} characters"
+            },
+        )
+    request_hash = hashlib.sha256(await request.body()).digest()
+    hashed = key_hash(request, key, request_hash)
+    # A connection of the async pool holds the lock while the handler runs on
+    # the sync pool, so waiters can't starve the handler of connections
+    async with AsyncSession(async_engine) as session, session.begin():
+        timeout_ms = int(settings.IDEMPOTENCY_LOCK_TIMEOUT_SECONDS * 1000)
+        await session.execute(
+            select(func.set_config("lock_timeout", f"{timeout_ms}ms", True))
+        )
+        try:
+            # Concurrent duplicates queue here until the first one committed
+            await session.execute(
+                select(func.pg_advisory_xact_lock(lock_key(hashed.hex())))
+            )
+        except exc.OperationalError as e:
+            if not isinstance(e.orig, errors.LockNotAvailable):
+                raise
+            stats.lock_timeouts += 1
+            return JSONResponse(
+                status_code=409,
+                content={"detail": "A request with this key is still in progress"},
+                headers={"Retry-After": "1"},
+            )
+
+        now = datetime.now(timezone.utc)
+        stored = await session.get(IdempotencyKey, hashed)
+        if stored is not None and stored.expires_at > now:
+            if stored.request_hash != request_hash:
+                stats.mismatched += 1
+                return JSONResponse(
+                    status_code=422,
+                    content={
+                        "detail": f"{IDEMPOTENCY_KEY_HEADER} was already used "
+                        "with another request"
+                    },
+                )
+            stats.replayed += 1
+            return Response(
+                content=stored.body,
+                status_code=stored.status_code,
+                media_type=stored.media_type,
+                headers={REPLAYED_HEADER: "true"},
+            )
+
+        response = await handler(request)
+        # Errors raised by the handler roll back and leave the key free; server
+        # errors and streamed bodies aren't stored either, a retry runs again
+        body = getattr(response, "body", None)
+        if response.status_code >= 500 or not isinstance(body, bytes):
+            return response
+        # Replaces the expired row, if any
+        statement = pg_insert(IdempotencyKey).values(
+            key_hash=hashed,
+            request_hash=request_hash,
+            status_code=response.status_code,
+            media_type=response.media_type,
+            body=body,
+            created_at=now,
+            expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS),
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["key_hash"],
+            set_={
+                "request_hash": statement.excluded.request_hash,
+                "status_code": statement.excluded.status_code,
+                "media_type": statement.excluded.media_type,
+                "body": statement.excluded.body,
+                "created_at": statement.excluded.created_at,
+                "expires_at": statement.excluded.expires_at,
+            },
+        )
+        await session.execute(statement)
+        stats.stored += 1
+        return response
+
+
+class IdempotentRoute(APIRoute):
+    """
+    Route class of the create endpoints, see idempotent_post(): a POST sent
+    with an Idempotency-Key header runs once, and retries of it get the stored
+    response (marked with Idempotent-Replayed) instead of running it again, for
+    IDEMPOTENCY_KEY_TTL_SECONDS. A retry arriving while the first request is
+    still running waits for it, up to IDEMPOTENCY_LOCK_TIMEOUT_SECONDS, then
+    gets a 409. Reusing a key with another body is a 422.
+
+    The write and its stored response are committed separately: a worker dying
+    in between leaves no response and the retry runs again.
+    """
+
+    def get_route_handler(self) -> Handler:
+        handler = super().get_route_handler()
+
+        async def idempotent_handler(request: Request) -> Response:
+            key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+            if key is None or request.method != "POST":
+                return await handler(request)
+            return await _idempotent(request, key, handler)
+
+        return idempotent_handler
+
+
+def idempotent_post(
+    router: APIRouter, path: str, **kwargs: Any
+) -> Callable[[DecoratedCallable], DecoratedCallable]:
+    """
+    router.post() for a create endpoint, which takes an Idempotency-Key. Only
+    those do: the other POSTs (claims, acks, heartbeats) are either idempotent
+    already or meant to run every time.
+    """
+
+    def decorator(func: DecoratedCallable) -> DecoratedCallable:
+        router.add_api_route(
+            path,
+            func,
+            methods=["POST"],
+            route_class_override=IdempotentRoute,
+            **kwargs,
+        )
+        return func
+
+    return decorator
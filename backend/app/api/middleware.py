@@ -0,0 +1,56 @@
+import logging
+
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.api.deps import token_sub
+from app.core import events
+from app.core.config import settings
+from app.core.db import recent_writers
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class ReadYourWritesMiddleware:
+    """
+    Keep the reads of a user that just wrote on the primary.
+
+    A successful write by an authenticated user puts the sub of their token in
+    recent_writers for READ_YOUR_WRITES_SECONDS, long enough for replication to
+    catch up, on this worker and, through the event bus, on the others. Their
+    reads skip the replica meanwhile (see get_async_read_db). Only done when a
+    replica is configured.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] in SAFE_METHODS
+            or not settings.POSTGRES_REPLICA_SERVER
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_after_recording(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                await record_writer(scope)
+            await send(message)
+
+        await self.app(scope, receive, send_after_recording)
+
+
+async def record_writer(scope: Scope) -> None:
+    sub = token_sub(Request(scope))
+    if sub is None:
+        return
+    recent_writers.set(sub, True)
+    # Before the response goes out, so the next read finds it on every worker
+    try:
+        await events.notify(events.WRITER, events.UPDATED, sub)
+    except Exception:
+        logger.warning("Could not announce the write of %s", sub, exc_info=True)
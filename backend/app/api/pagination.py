@@ -0,0 +1,162 @@
+import base64
+import binascii
+import threading
+import time
+import uuid
+from collections.abc import Sequence
+from typing import Any, Literal, TypeVar
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlmodel import col, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+# How the total row count of a list endpoint is computed:
+# - exact: COUNT(*), in the same query as the page
+# - estimated: planner statistics of the table (pg_class.reltuples), no scan
+# - cached: an exact count shared by the worker for COUNT_CACHE_TTL_SECONDS
+# - none: not computed, count is null
+CountMode = Literal["exact", "estimated", "cached", "none"]
+
+_count_cache: dict[str, tuple[float, int]] = {}
+_count_cache_lock = threading.Lock()
+
+
+def encode_cursor(last_id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(last_id.bytes).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> uuid.UUID:
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        return uuid.UUID(bytes=base64.urlsafe_b64decode(cursor + padding))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _count_statement(statement: SelectOfScalar[Any]) -> SelectOfScalar[int]:
+    return select(func.count()).select_from(statement.order_by(None).subquery())
+
+
+_ESTIMATE = text(
+    "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(quote_ident(:name))"
+)
+
+
+def _cached(table_name: str) -> int | None:
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(table_name)
+    if cached is not None and now - cached[0] < settings.COUNT_CACHE_TTL_SECONDS:
+        return cached[1]
+    return None
+
+
+def _cache(table_name: str, count: int) -> None:
+    with _count_cache_lock:
+        _count_cache[table_name] = (time.monotonic(), count)
+
+
+async def _exact_count(session: AsyncSession, statement: SelectOfScalar[Any]) -> int:
+    return (await session.exec(_count_statement(statement))).one()
+
+
+async def _estimated_count(
+    session: AsyncSession, statement: SelectOfScalar[Any], table_name: str
+) -> int:
+    estimate = (await session.execute(_ESTIMATE, {"name": table_name})).scalar()
+    # -1 (or no row) until the table has been vacuumed or analyzed once
+    if estimate is None or estimate < 0:
+        return await _exact_count(session, statement)
+    return int(estimate)
+
+
+async def _cached_count(
+    session: AsyncSession, statement: SelectOfScalar[Any], table_name: str
+) -> int:
+    count = _cached(table_name)
+    if count is None:
+        count = await _exact_count(session, statement)
+        _cache(table_name, count)
+    return count
+
+
+def _page_statement(
+    statement: SelectOfScalar[T],
+    key: Any,
+    *,
+    skip: int,
+    limit: int,
+    cursor: str | None,
+) -> SelectOfScalar[T]:
+    page = statement.order_by(col(key))
+    if cursor is not None:
+        page = page.where(col(key) > decode_cursor(cursor))
+    else:
+        page = page.offset(skip)
+    return page.limit(limit)
+
+
+def _with_count(page: SelectOfScalar[T], statement: SelectOfScalar[Any]) -> Any:
+    # Ride the count along with the page instead of a second round trip
+    total = _count_statement(statement).scalar_subquery()
+    return page.add_columns(total)
+
+
+def _next_cursor(rows: Sequence[Any], key: Any, limit: int) -> str | None:
+    if rows and len(rows) == limit:
+        return encode_cursor(getattr(rows[-1], col(key).key))
+    return None
+
+
+async def paginate_async(
+    session: AsyncSession,
+    statement: SelectOfScalar[T],
+    key: Any,
+    *,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count_mode: CountMode = "exact",
+) -> tuple[Sequence[T], int | None, str | None]:
+    """
+    Fetch one page of `statement` ordered by the primary key `key`.
+
+    Without a cursor this is plain offset pagination. With a cursor, `skip` is
+    ignored and the page starts right after the row the cursor points to, which
+    is an index range scan on the primary key: every page costs the same as the
+    first one and rows inserted or deleted meanwhile don't shift the pages.
+
+    `statement` is the whole, unfiltered list: the estimated and cached counts
+    are per table.
+
+    Returns the rows, the total count (see CountMode) and the cursor of the next
+    page, or None on the last page.
+    """
+    table_name = col(key).table.name
+    page = _page_statement(statement, key, skip=skip, limit=limit, cursor=cursor)
+
+    count: int | None = None
+    if count_mode == "exact":
+        results = (await session.execute(_with_count(page, statement))).all()
+        rows: Sequence[T] = [row[0] for row in results]
+        if results:
+            count = results[0][1]
+        elif cursor is None and skip == 0:
+            count = 0
+        else:
+            # Past the last row there is nothing to carry the count
+            count = await _exact_count(session, statement)
+    else:
+        rows = (await session.exec(page)).all()
+        if count_mode == "estimated":
+            count = await _estimated_count(session, statement, table_name)
+        elif count_mode == "cached":
+            count = await _cached_count(session, statement, table_name)
+
+    return rows, count, _next_cursor(rows, key, limit)
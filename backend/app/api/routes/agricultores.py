@@ -2,10 +2,19 @@ import uuid
 from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, col, delete, func, select
+from sqlmodel import Session, col, delete, select
 
 from app import crud
-from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
+from app.api.deps import (
+    AsyncReadSessionDep,
+    CurrentUser,
+    SessionDep,
+    get_current_active_superuser,
+)
+from app.api.idempotency import idempotent_post
+from app.api.pagination import CountMode, paginate_async
+from app.core import events
+from app.core.cache import entity_cache
 from app.core.config import settings
 from app.models import (
     Agricultor,
@@ -19,20 +28,28 @@ router = APIRouter(prefix="/agricultores", tags=["agricultores"])
 
 
 @router.get("/", response_model=AgricultoresPublic)
-def read_agricultores(
-    session: SessionDep, skip: int = 0, limit: int = 100
+async def read_agricultores(
+    session: AsyncReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count_mode: CountMode = "exact",
 ) -> Any:
     """Retrieve agricultores."""
-    count_statement = select(func.count()).select_from(Agricultor)
-    count = session.exec(count_statement).one()
-
-    statement = select(Agricultor).offset(skip).limit(limit)
-    agricultores = session.exec(statement).all()
+    agricultores, count, next_cursor = await paginate_async(
+        session,
+        select(Agricultor),
+        Agricultor.id,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        count_mode=count_mode,
+    )
 
-    return AgricultoresPublic(data=agricultores, count=count)
+    return AgricultoresPublic(data=agricultores, count=count, next_cursor=next_cursor)
 
 
-@router.post("/", response_model=AgricultorPublic)
+@idempotent_post(router, "/", response_model=AgricultorPublic)
 def create_agricultor(
     *, session: SessionDep, agricultor_in: AgricultorCreate, current_user: CurrentUser
 ) -> Any:
@@ -42,6 +59,7 @@ def create_agricultor(
         {**agricultor_in.model_dump(), "user_id": current_user.id}
     )
     session.add(agricultor)
+    events.publish(session, "agricultor", events.CREATED, agricultor.id)
     session.commit()
     session.refresh(agricultor)
     return agricultor
@@ -50,7 +68,12 @@ def create_agricultor(
 @router.get("/{agricultor_id}", response_model=AgricultorPublic)
 def read_agricultor(agricultor_id: uuid.UUID, session: SessionDep) -> Any:
     """Get a specific agricultor by id."""
-    agricultor = session.get(Agricultor, agricultor_id)
+    agricultor = entity_cache.get_or_load(
+        AgricultorPublic,
+        "agricultor",
+        agricultor_id,
+        lambda: session.get(Agricultor, agricultor_id),
+    )
     if not agricultor:
         raise HTTPException(status_code=404, detail="Agricultor not found")
     return agricultor
@@ -75,7 +98,9 @@ def update_agricultor(
     update_data = agricultor_in.model_dump(exclude_unset=True)
     agricultor.sqlmodel_update(update_data)
     session.add(agricultor)
+    events.publish(session, "agricultor", events.UPDATED, agricultor_id)
     session.commit()
+    entity_cache.invalidate("agricultor", agricultor_id)
     session.refresh(agricultor)
     return agricultor
 
@@ -91,5 +116,7 @@ def delete_agricultor(agricultor_id: uuid.UUID, session: SessionDep) -> dict:
         raise HTTPException(status_code=404, detail="Agricultor not found")
 
     session.delete(agricultor)
+    events.publish(session, "agricultor", events.DELETED, agricultor_id)
     session.commit()
+    entity_cache.invalidate("agricultor", agricultor_id)
     return {"message": "Agricultor deleted successfully"}
@@ -1,15 +1,23 @@
 import uuid
+from datetime import datetime, timedelta, timezone
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, col, delete, func, select
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlmodel import Session, col, delete, select
 
-from app.api.deps import SessionDep, get_current_active_superuser
+from app import crud
+from app.api.deps import AsyncReadSessionDep, SessionDep, get_current_active_superuser
+from app.api.idempotency import idempotent_post
+from app.api.pagination import CountMode, paginate_async
+from app.core import events, presence
+from app.core.cache import entity_cache
 from app.core.config import settings
 from app.models import (
     Aparelho,
     AparelhoCreate,
+    AparelhoPresenca,
     AparelhoPublic,
+    AparelhosOnline,
     AparelhosPublic,
     AparelhoUpdate,
 )
@@ -18,22 +26,63 @@ router = APIRouter(prefix="/aparelhos", tags=["aparelhos"])
 
 
 @router.get("/", response_model=AparelhosPublic)
-def read_aparelhos(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+async def read_aparelhos(
+    session: AsyncReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count_mode: CountMode = "exact",
+) -> Any:
     """Retrieve aparelhos."""
-    count_statement = select(func.count()).select_from(Aparelho)
-    count = session.exec(count_statement).one()
-
-    statement = select(Aparelho).offset(skip).limit(limit)
-    aparelhos = session.exec(statement).all()
+    aparelhos, count, next_cursor = await paginate_async(
+        session,
+        select(Aparelho),
+        Aparelho.id,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        count_mode=count_mode,
+    )
+
+    return AparelhosPublic(data=aparelhos, count=count, next_cursor=next_cursor)
+
+
+@router.get("/offline", response_model=AparelhosPublic)
+async def read_aparelhos_offline(
+    session: AsyncReadSessionDep,
+    seconds: int = Query(default=settings.APARELHO_OFFLINE_AFTER_SECONDS, gt=0),
+    skip: int = 0,
+    limit: int = 100,
+) -> Any:
+    """
+    Retrieve aparelhos without a heartbeat in the last `seconds`, longest silent
+    first. Aparelhos that never reported are not included.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=seconds)
+    count = (
+        await session.exec(crud.count_offline_aparelhos_statement(cutoff=cutoff))
+    ).one()
+    statement = crud.offline_aparelhos_statement(cutoff=cutoff, skip=skip, limit=limit)
+    aparelhos = (await session.exec(statement)).all()
 
     return AparelhosPublic(data=aparelhos, count=count)
 
 
-@router.post("/", response_model=AparelhoPublic)
+@router.get("/online", response_model=AparelhosOnline)
+async def read_aparelhos_online() -> Any:
+    """
+    Count the aparelhos with a heartbeat in the last
+    APARELHO_OFFLINE_AFTER_SECONDS, from the shared presence table.
+    """
+    return AparelhosOnline(count=presence.table.count())
+
+
+@idempotent_post(router, "/", response_model=AparelhoPublic)
 def create_aparelho(*, session: SessionDep, aparelho_in: AparelhoCreate) -> Any:
     """Create new aparelho."""
     aparelho = Aparelho.model_validate(aparelho_in)
     session.add(aparelho)
+    events.publish(session, "aparelho", events.CREATED, aparelho.id)
     session.commit()
     session.refresh(aparelho)
     return aparelho
@@ -42,12 +91,33 @@ def create_aparelho(*, session: SessionDep, aparelho_in: AparelhoCreate) -> Any:
 @router.get("/{aparelho_id}", response_model=AparelhoPublic)
 def read_aparelho(aparelho_id: uuid.UUID, session: SessionDep) -> Any:
     """Get a specific aparelho by id."""
-    aparelho = session.get(Aparelho, aparelho_id)
+    aparelho = entity_cache.get_or_load(
+        AparelhoPublic,
+        "aparelho",
+        aparelho_id,
+        lambda: session.get(Aparelho, aparelho_id),
+    )
     if not aparelho:
         raise HTTPException(status_code=404, detail="Aparelho not found")
     return aparelho
 
 
+@router.get("/{aparelho_id}/presenca", response_model=AparelhoPresenca)
+async def read_aparelho_presenca(aparelho_id: uuid.UUID) -> Any:
+    """
+    Whether an aparelho is online, from the shared presence table. Aparelhos
+    not heard from since the table was created are reported offline.
+    """
+    seen_at = presence.table.last_seen(aparelho_id)
+    return AparelhoPresenca(
+        id=aparelho_id,
+        online=presence.table.is_online(aparelho_id),
+        ultima_conexao=(
+            datetime.fromtimestamp(seen_at, timezone.utc) if seen_at else None
+        ),
+    )
+
+
 @router.patch(
     "/{aparelho_id}",
     dependencies=[Depends(get_current_active_superuser)],
@@ -67,7 +137,11 @@ def update_aparelho(
     update_data = aparelho_in.model_dump(exclude_unset=True)
     aparelho.sqlmodel_update(update_data)
     session.add(aparelho)
+    events.publish(session, "aparelho", events.UPDATED, aparelho_id)
     session.commit()
+    entity_cache.invalidate("aparelho", aparelho_id)
+    if aparelho_in.ultima_conexao is not None:
+        presence.table.touch(aparelho_id, aparelho_in.ultima_conexao.timestamp())
     session.refresh(aparelho)
     return aparelho
 
@@ -83,5 +157,7 @@ def delete_aparelho(aparelho_id: uuid.UUID, session: SessionDep) -> dict:
         raise HTTPException(status_code=404, detail="Aparelho not found")
 
     session.delete(aparelho)
+    events.publish(session, "aparelho", events.DELETED, aparelho_id)
     session.commit()
+    entity_cache.invalidate("aparelho", aparelho_id)
     return {"message": "Aparelho deleted successfully"}
@@ -1,13 +1,32 @@
+import asyncio
 import uuid
-from typing import Any
+from typing import Annotated, Any
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, col, delete, func, select
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from sqlmodel import col, delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.api.deps import SessionDep, get_current_active_superuser
+from app import crud
+from app.api.deps import (
+    AsyncReadSessionDep,
+    AsyncSessionDep,
+    CurrentControlador,
+    SessionDep,
+    get_current_active_superuser,
+    get_current_controlador,
+)
+from app.api.idempotency import idempotent_post
+from app.api.pagination import CountMode, paginate_async
+from app.core import events, scheduler
+from app.core.cache import entity_cache
 from app.core.config import settings
 from app.models import (
+    COMANDO_STATUS_AGENDADO,
     Comando,
+    ComandoAck,
+    ComandoAckResult,
+    ComandoAcksPublic,
+    ComandoBroadcast,
     ComandoCreate,
     ComandoPublic,
     ComandosPublic,
@@ -18,57 +37,258 @@ router = APIRouter(prefix="/comandos", tags=["comandos"])
 
 
 @router.get("/", response_model=ComandosPublic)
-def read_comandos(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+async def read_comandos(
+    session: AsyncReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count_mode: CountMode = "exact",
+) -> Any:
     """Retrieve comandos."""
-    count_statement = select(func.count()).select_from(Comando)
-    count = session.exec(count_statement).one()
-
-    statement = select(Comando).offset(skip).limit(limit)
-    comandos = session.exec(statement).all()
+    comandos, count, next_cursor = await paginate_async(
+        session,
+        select(Comando),
+        Comando.id,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        count_mode=count_mode,
+    )
 
-    return ComandosPublic(data=comandos, count=count)
+    return ComandosPublic(data=comandos, count=count, next_cursor=next_cursor)
 
 
-@router.post("/", response_model=ComandoPublic)
+@idempotent_post(router, "/", response_model=ComandoPublic)
 def create_comando(*, session: SessionDep, comando_in: ComandoCreate) -> Any:
-    """Create new comando."""
-    comando = Comando.model_validate(comando_in)
-    session.add(comando)
+    """
+    Create new comando.
+
+    A comando already pending for the controlador is returned instead of queueing
+    a duplicate; a last-write-wins comando (COMANDOS_LAST_WRITE_WINS) updates the
+    pending one with the new param.
+
+    With agendado_para in the future the comando is stored agendado and only
+    queued, and its controlador woken, once that time comes. One still waiting
+    at expira_em is set expirado instead of being executed late.
+    """
+    comando, created = crud.create_comando(session=session, comando_in=comando_in)
+    if comando.status == COMANDO_STATUS_AGENDADO:
+        assert comando.agendado_para is not None
+        scheduler.publish_scheduled(session, comando.id, comando.agendado_para)
+    elif created:
+        events.publish(
+            session, "comando", events.CREATED, comando.id, key=comando.controlador_id
+        )
+    else:
+        events.publish(session, "comando", events.UPDATED, comando.id)
     session.commit()
+    if not created:
+        entity_cache.invalidate("comando", comando.id)
     session.refresh(comando)
     return comando
 
 
+@idempotent_post(
+    router,
+    "/difundir",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=ComandosPublic,
+)
+def broadcast_comando(*, session: SessionDep, broadcast_in: ComandoBroadcast) -> Any:
+    """
+    Create the same comando for every controlador of a setor or of an agricultor.
+
+    All comandos are inserted with a single statement and their controladores
+    woken with another, in one transaction. Coalesced like POST /comandos: the
+    response holds the pending comando of every controlador, new or not. With
+    agendado_para in the future, they are all scheduled for that time instead.
+    """
+    if (broadcast_in.setor_id is None) == (broadcast_in.agricultor_id is None):
+        raise HTTPException(
+            status_code=400, detail="Provide either setor_id or agricultor_id"
+        )
+    queued = crud.broadcast_comando(
+        session=session,
+        comando=broadcast_in.comando,
+        param=broadcast_in.param,
+        setor_id=broadcast_in.setor_id,
+        agricultor_id=broadcast_in.agricultor_id,
+        agendado_para=broadcast_in.agendado_para,
+        expira_em=broadcast_in.expira_em,
+    )
+    scheduled = [
+        comando for comando, _ in queued if comando.status == COMANDO_STATUS_AGENDADO
+    ]
+    if scheduled and scheduled[0].agendado_para is not None:
+        # All due at the same time, one event is enough
+        scheduler.publish_scheduled(
+            session, scheduled[0].id, scheduled[0].agendado_para
+        )
+    events.publish_many(
+        session,
+        "comando",
+        events.CREATED,
+        [
+            (comando.id, comando.controlador_id)
+            for comando, created in queued
+            if created and comando.status != COMANDO_STATUS_AGENDADO
+        ],
+    )
+    coalesced = [comando.id for comando, created in queued if not created]
+    events.publish_many(
+        session, "comando", events.UPDATED, [(id, None) for id in coalesced]
+    )
+    session.commit()
+    for comando_id in coalesced:
+        entity_cache.invalidate("comando", comando_id)
+    comandos = [comando for comando, _ in queued]
+    return ComandosPublic(data=comandos, count=len(comandos))
+
+
 @router.get("/{comando_id}", response_model=ComandoPublic)
 def read_comando(comando_id: uuid.UUID, session: SessionDep) -> Any:
     """Get a specific comando by id."""
-    comando = session.get(Comando, comando_id)
+    comando = entity_cache.get_or_load(
+        ComandoPublic, "comando", comando_id, lambda: session.get(Comando, comando_id)
+    )
     if not comando:
         raise HTTPException(status_code=404, detail="Comando not found")
     return comando
 
 
 @router.get("/controlador/{controlador_id}", response_model=ComandosPublic)
-def read_comandos_por_controlador(
-    controlador_id: uuid.UUID, session: SessionDep, skip: int = 0, limit: int = 100
+async def read_comandos_por_controlador(
+    controlador_id: uuid.UUID,
+    session: AsyncSessionDep,
+    skip: int = 0,
+    limit: int = 100,
 ) -> Any:
     """Get all comandos for a specific controlador (pendentes ou não)."""
-    count_statement = select(func.count()).select_from(Comando).where(
-        Comando.controlador_id == controlador_id,
-        Comando.status == "pendente",
+    count_statement = crud.count_pending_comandos_statement(
+        controlador_id=controlador_id
     )
-    count = session.exec(count_statement).one()
+    count = (await session.exec(count_statement)).one()
 
-    statement = (
-        select(Comando)
-        .where(Comando.controlador_id == controlador_id , Comando.status == "pendente")
-        .offset(skip)
-        .limit(limit)
+    statement = crud.pending_comandos_statement(
+        controlador_id=controlador_id, skip=skip, limit=limit
     )
-    comandos = session.exec(statement).all()
+    comandos = (await session.exec(statement)).all()
 
     return ComandosPublic(data=comandos, count=count)
 
+
+async def _read_pending_and_release(
+    session: AsyncSession, controlador_id: uuid.UUID, limit: int
+) -> list[Comando]:
+    comandos = await crud.get_pending_comandos_async(
+        session=session, controlador_id=controlador_id, limit=limit
+    )
+    # Give the connection back to the pool, the caller may now wait for a while
+    await session.close()
+    return comandos
+
+
+@router.get(
+    "/controlador/{controlador_id}/aguardar",
+    dependencies=[Depends(get_current_controlador)],
+    response_model=ComandosPublic,
+)
+async def wait_comandos_por_controlador(
+    controlador_id: uuid.UUID,
+    session: AsyncSessionDep,
+    timeout: float = Query(
+        default=settings.COMANDO_LONG_POLL_TIMEOUT_SECONDS,
+        gt=0,
+        le=settings.COMANDO_LONG_POLL_MAX_TIMEOUT_SECONDS,
+    ),
+    limit: int = 100,
+) -> Any:
+    """
+    Long-poll the pending comandos of a controlador.
+
+    Returns right away if there are pending comandos, otherwise holds the request
+    until one is created (by any worker) or the timeout expires.
+    """
+    # Subscribe before reading so a comando created in between still wakes us up
+    with events.comando_waiters.subscribe(str(controlador_id)) as created:
+        comandos = await _read_pending_and_release(session, controlador_id, limit)
+        if not comandos:
+            try:
+                await asyncio.wait_for(created.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                comandos = await _read_pending_and_release(
+                    session, controlador_id, limit
+                )
+
+    return ComandosPublic(data=comandos, count=len(comandos))
+
+
+@router.post(
+    "/controlador/{controlador_id}/reservar",
+    dependencies=[Depends(get_current_controlador)],
+    response_model=ComandosPublic,
+)
+def claim_comandos_por_controlador(
+    controlador_id: uuid.UUID,
+    session: SessionDep,
+    limit: int = Query(default=10, gt=0, le=100),
+) -> Any:
+    """
+    Reserve pending comandos of a controlador for execution.
+
+    Reserved comandos are not handed to other pollers until their lease
+    (COMANDO_LEASE_SECONDS) expires without being acknowledged.
+    """
+    comandos = crud.claim_comandos(
+        session=session,
+        controlador_id=controlador_id,
+        limit=limit,
+        lease_seconds=settings.COMANDO_LEASE_SECONDS,
+    )
+    events.publish_many(
+        session,
+        "comando",
+        events.UPDATED,
+        [(comando.id, comando.controlador_id) for comando in comandos],
+    )
+    session.commit()
+    for comando in comandos:
+        entity_cache.invalidate("comando", comando.id)
+    return ComandosPublic(data=comandos, count=len(comandos))
+
+
+@router.post("/confirmar", response_model=ComandoAcksPublic)
+def acknowledge_comandos(
+    *,
+    session: SessionDep,
+    controlador_id: CurrentControlador,
+    acks: Annotated[list[ComandoAck], Body(max_length=500)],
+) -> Any:
+    """
+    Report the execution of a batch of comandos of the signing controlador.
+
+    All reports are applied with a single UPDATE; each item of the response says
+    whether its comando was found and updated.
+    """
+    updated = (
+        crud.acknowledge_comandos(
+            session=session, acks=acks, controlador_id=controlador_id
+        )
+        if acks
+        else set()
+    )
+    events.publish_many(
+        session, "comando", events.UPDATED, [(id, None) for id in updated]
+    )
+    session.commit()
+    for comando_id in updated:
+        entity_cache.invalidate("comando", comando_id)
+    results = [ComandoAckResult(id=ack.id, updated=ack.id in updated) for ack in acks]
+    return ComandoAcksPublic(data=results, count=len(updated))
+
+
 @router.patch(
     "/{comando_id}",
     dependencies=[Depends(get_current_active_superuser)],
@@ -88,7 +308,9 @@ def update_comando(
     update_data = comando_in.model_dump(exclude_unset=True)
     comando.sqlmodel_update(update_data)
     session.add(comando)
+    events.publish(session, "comando", events.UPDATED, comando_id)
     session.commit()
+    entity_cache.invalidate("comando", comando_id)
     session.refresh(comando)
     return comando
 
@@ -104,5 +326,7 @@ def delete_comando(comando_id: uuid.UUID, session: SessionDep) -> dict:
         raise HTTPException(status_code=404, detail="Comando not found")
 
     session.delete(comando)
+    events.publish(session, "comando", events.DELETED, comando_id)
     session.commit()
+    entity_cache.invalidate("comando", comando_id)
     return {"message": "Comando deleted successfully"}
@@ -1,50 +1,79 @@
 import uuid
+from datetime import datetime, timezone
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, col, delete, func, select
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlmodel import Session, col, delete, select
 
-from app.api.deps import SessionDep, get_current_active_superuser
+from app.api.deps import (
+    AsyncReadSessionDep,
+    CurrentControlador,
+    SessionDep,
+    get_current_active_superuser,
+)
+from app.api.idempotency import idempotent_post
+from app.api.pagination import CountMode, paginate_async
+from app.core import events, heartbeats
+from app.core.cache import entity_cache
 from app.core.config import settings
+from app.core.signing import key_cache
 from app.models import (
     Controlador,
     ControladorCreate,
     ControladorPublic,
     ControladoresPublic,
     ControladorUpdate,
+    Heartbeat,
 )
 
 router = APIRouter(prefix="/controladores", tags=["controladores"])
 
 
 @router.get("/", response_model=ControladoresPublic)
-def read_controladores(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+async def read_controladores(
+    session: AsyncReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count_mode: CountMode = "exact",
+) -> Any:
     """Retrieve controladores."""
-    count_statement = select(func.count()).select_from(Controlador)
-    count = session.exec(count_statement).one()
+    controladores, count, next_cursor = await paginate_async(
+        session,
+        select(Controlador),
+        Controlador.id,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        count_mode=count_mode,
+    )
 
-    statement = select(Controlador).offset(skip).limit(limit)
-    controladores = session.exec(statement).all()
+    return ControladoresPublic(data=controladores, count=count, next_cursor=next_cursor)
 
-    return ControladoresPublic(data=controladores, count=count)
 
-
-@router.post("/", response_model=ControladorPublic)
+@idempotent_post(router, "/", response_model=ControladorPublic)
 def create_controlador(
     *, session: SessionDep, controlador_in: ControladorCreate
 ) -> Any:
     """Create new controlador."""
     controlador = Controlador.model_validate(controlador_in)
     session.add(controlador)
+    events.publish(session, "controlador", events.CREATED, controlador.id)
     session.commit()
     session.refresh(controlador)
+    key_cache.put(controlador)
     return controlador
 
 
 @router.get("/{controlador_id}", response_model=ControladorPublic)
 def read_controlador(controlador_id: uuid.UUID, session: SessionDep) -> Any:
     """Get a specific controlador by id."""
-    controlador = session.get(Controlador, controlador_id)
+    controlador = entity_cache.get_or_load(
+        ControladorPublic,
+        "controlador",
+        controlador_id,
+        lambda: session.get(Controlador, controlador_id),
+    )
     if not controlador:
         raise HTTPException(status_code=404, detail="Controlador not found")
     return controlador
@@ -67,10 +96,19 @@ def update_controlador(
         raise HTTPException(status_code=404, detail="Controlador not found")
 
     update_data = controlador_in.model_dump(exclude_unset=True)
+    assinatura = update_data.get("assinatura")
+    if assinatura is not None and assinatura != controlador.assinatura:
+        # Key rotation: signatures with the old key stay valid for the grace
+        # period, so the device can pick up the new one meanwhile
+        update_data["assinatura_anterior"] = controlador.assinatura
+        update_data["assinatura_rotacionada_em"] = datetime.now(timezone.utc)
     controlador.sqlmodel_update(update_data)
     session.add(controlador)
+    events.publish(session, "controlador", events.UPDATED, controlador_id)
     session.commit()
+    entity_cache.invalidate("controlador", controlador_id)
     session.refresh(controlador)
+    key_cache.put(controlador)
     return controlador
 
 
@@ -85,5 +123,23 @@ def delete_controlador(controlador_id: uuid.UUID, session: SessionDep) -> dict:
         raise HTTPException(status_code=404, detail="Controlador not found")
 
     session.delete(controlador)
+    events.publish(session, "controlador", events.DELETED, controlador_id)
     session.commit()
+    entity_cache.invalidate("controlador", controlador_id)
+    key_cache.drop(controlador_id)
     return {"message": "Controlador deleted successfully"}
+
+
+@router.post("/{controlador_id}/heartbeat", status_code=204)
+async def heartbeat(
+    controlador_id: CurrentControlador, heartbeat_in: Heartbeat | None = None
+) -> Response:
+    """
+    Report that the controlador is alive.
+
+    Sets status and ultima_conexao of its aparelho. Buffered in memory and
+    written in bulk every few seconds (HEARTBEAT_FLUSH_SECONDS).
+    """
+    status = heartbeat_in.status if heartbeat_in is not None else Heartbeat().status
+    heartbeats.buffer.record(controlador_id, status)
+    return Response(status_code=204)
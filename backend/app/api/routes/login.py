@@ -2,39 +2,57 @@ from datetime import timedelta
 from typing import Annotated, Any
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlmodel import Session
 
 from app import crud
 from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
-from app.core import security
+from app.core import events, security
+from app.core.cache import user_cache
 from app.core.config import settings
 from app.core.security import get_password_hash
-from app.models import Message, NewPassword, Token, UserPublic
+from app.models import Message, NewPassword, Token, User, UserPublic
 from app.utils import (
     generate_password_reset_token,
     generate_reset_password_email,
-    send_email,
+    queue_email,
     verify_password_reset_token,
 )
 
 router = APIRouter(tags=["login"])
 
 
+def _store_password_hash(session: Session, user: User, hashed_password: str) -> None:
+    user.hashed_password = hashed_password
+    session.add(user)
+    session.commit()
+    user_cache.delete(str(user.id))
+
+
 @router.post("/login/access-token")
-def login_access_token(
+async def login_access_token(
     session: SessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
 ) -> Token:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = crud.authenticate(
-        session=session, email=form_data.username, password=form_data.password
+    # bcrypt runs on the password pool, this handler holds no thread meanwhile
+    user = await run_in_threadpool(
+        crud.get_user_by_email, session=session, email=form_data.username
     )
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
+    verified, new_hash = await security.verify_and_update_password(
+        form_data.password, user.hashed_password
+    )
+    if not verified:
+        raise HTTPException(status_code=400, detail="Incorrect email or password")
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+    if new_hash:
+        await run_in_threadpool(_store_password_hash, session, user, new_hash)
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     return Token(
         access_token=security.create_access_token(
@@ -67,7 +85,8 @@ def recover_password(email: str, session: SessionDep) -> Message:
     email_data = generate_reset_password_email(
         email_to=user.email, email=email, token=password_reset_token
     )
-    send_email(
+    queue_email(
+        session=session,
         email_to=user.email,
         subject=email_data.subject,
         html_content=email_data.html_content,
@@ -94,7 +113,9 @@ def reset_password(session: SessionDep, body: NewPassword) -> Message:
     hashed_password = get_password_hash(password=body.new_password)
     user.hashed_password = hashed_password
     session.add(user)
+    events.publish(session, "user", events.UPDATED, user.id)
     session.commit()
+    user_cache.delete(str(user.id))
     return Message(message="Password updated successfully")
 
 
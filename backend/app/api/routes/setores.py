@@ -2,9 +2,13 @@ import uuid
 from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, col, delete, func, select
+from sqlmodel import Session, col, delete, select
 
-from app.api.deps import SessionDep, get_current_active_superuser
+from app.api.deps import AsyncReadSessionDep, SessionDep, get_current_active_superuser
+from app.api.idempotency import idempotent_post
+from app.api.pagination import CountMode, paginate_async
+from app.core import events
+from app.core.cache import entity_cache
 from app.core.config import settings
 from app.models import (
     Setor,
@@ -18,22 +22,33 @@ router = APIRouter(prefix="/setores", tags=["setores"])
 
 
 @router.get("/", response_model=SetoresPublic)
-def read_setores(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+async def read_setores(
+    session: AsyncReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count_mode: CountMode = "exact",
+) -> Any:
     """Retrieve setores."""
-    count_statement = select(func.count()).select_from(Setor)
-    count = session.exec(count_statement).one()
-
-    statement = select(Setor).offset(skip).limit(limit)
-    setores = session.exec(statement).all()
+    setores, count, next_cursor = await paginate_async(
+        session,
+        select(Setor),
+        Setor.id,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        count_mode=count_mode,
+    )
 
-    return SetoresPublic(data=setores, count=count)
+    return SetoresPublic(data=setores, count=count, next_cursor=next_cursor)
 
 
-@router.post("/", response_model=SetorPublic)
+@idempotent_post(router, "/", response_model=SetorPublic)
 def create_setor(*, session: SessionDep, setor_in: SetorCreate) -> Any:
     """Create new setor."""
     setor = Setor.model_validate(setor_in)
     session.add(setor)
+    events.publish(session, "setor", events.CREATED, setor.id)
     session.commit()
     session.refresh(setor)
     return setor
@@ -42,7 +57,9 @@ def create_setor(*, session: SessionDep, setor_in: SetorCreate) -> Any:
 @router.get("/{setor_id}", response_model=SetorPublic)
 def read_setor(setor_id: uuid.UUID, session: SessionDep) -> Any:
     """Get a specific setor by id."""
-    setor = session.get(Setor, setor_id)
+    setor = entity_cache.get_or_load(
+        SetorPublic, "setor", setor_id, lambda: session.get(Setor, setor_id)
+    )
     if not setor:
         raise HTTPException(status_code=404, detail="Setor not found")
     return setor
@@ -67,7 +84,9 @@ def update_setor(
     update_data = setor_in.model_dump(exclude_unset=True)
     setor.sqlmodel_update(update_data)
     session.add(setor)
+    events.publish(session, "setor", events.UPDATED, setor_id)
     session.commit()
+    entity_cache.invalidate("setor", setor_id)
     session.refresh(setor)
     return setor
 
@@ -83,5 +102,7 @@ def delete_setor(setor_id: uuid.UUID, session: SessionDep) -> dict:
         raise HTTPException(status_code=404, detail="Setor not found")
 
     session.delete(setor)
+    events.publish(session, "setor", events.DELETED, setor_id)
     session.commit()
+    entity_cache.invalidate("setor", setor_id)
     return {"message": "Setor deleted successfully"}
@@ -2,14 +2,19 @@ import uuid
 from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import col, delete, func, select
+from sqlmodel import col, delete, select
 
 from app import crud
 from app.api.deps import (
+    AsyncReadSessionDep,
     CurrentUser,
     SessionDep,
     get_current_active_superuser,
 )
+from app.api.idempotency import idempotent_post
+from app.api.pagination import CountMode, paginate_async
+from app.core import events
+from app.core.cache import user_cache
 from app.core.config import settings
 from app.core.security import get_password_hash, verify_password
 from app.models import (
@@ -23,7 +28,7 @@ from app.models import (
     UserUpdate,
     UserUpdateMe,
 )
-from app.utils import generate_new_account_email, send_email
+from app.utils import generate_new_account_email, queue_email
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -33,22 +38,35 @@ router = APIRouter(prefix="/users", tags=["users"])
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UsersPublic,
 )
-def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+async def read_users(
+    session: AsyncReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    count_mode: CountMode = "exact",
+) -> Any:
     """
     Retrieve users.
     """
 
-    count_statement = select(func.count()).select_from(User)
-    count = session.exec(count_statement).one()
-
-    statement = select(User).offset(skip).limit(limit)
-    users = session.exec(statement).all()
+    users, count, next_cursor = await paginate_async(
+        session,
+        select(User),
+        User.id,
+        skip=skip,
+        limit=limit,
+        cursor=cursor,
+        count_mode=count_mode,
+    )
 
-    return UsersPublic(data=users, count=count)
+    return UsersPublic(data=users, count=count, next_cursor=next_cursor)
 
 
-@router.post(
-    "/", dependencies=[Depends(get_current_active_superuser)], response_model=UserPublic
+@idempotent_post(
+    router,
+    "/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=UserPublic,
 )
 def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
     """
@@ -66,7 +84,8 @@ def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
         email_data = generate_new_account_email(
             email_to=user_in.email, username=user_in.email, password=user_in.password
         )
-        send_email(
+        queue_email(
+            session=session,
             email_to=user_in.email,
             subject=email_data.subject,
             html_content=email_data.html_content,
@@ -91,7 +110,9 @@ def update_user_me(
     user_data = user_in.model_dump(exclude_unset=True)
     current_user.sqlmodel_update(user_data)
     session.add(current_user)
+    events.publish(session, "user", events.UPDATED, current_user.id)
     session.commit()
+    user_cache.delete(str(current_user.id))
     session.refresh(current_user)
     return current_user
 
@@ -112,7 +133,9 @@ def update_password_me(
     hashed_password = get_password_hash(body.new_password)
     current_user.hashed_password = hashed_password
     session.add(current_user)
+    events.publish(session, "user", events.UPDATED, current_user.id)
     session.commit()
+    user_cache.delete(str(current_user.id))
     return Message(message="Password updated successfully")
 
 
@@ -134,11 +157,13 @@ def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
     session.delete(current_user)
+    events.publish(session, "user", events.DELETED, current_user.id)
     session.commit()
+    user_cache.delete(str(current_user.id))
     return Message(message="User deleted successfully")
 
 
-@router.post("/signup", response_model=UserPublic)
+@idempotent_post(router, "/signup", response_model=UserPublic)
 def register_user(session: SessionDep, user_in: UserRegister) -> Any:
     """
     Create new user without the need to be logged in.
@@ -200,7 +225,10 @@ def update_user(
                 status_code=409, detail="User with this email already exists"
             )
 
+    # Queued on the transaction committed by crud.update_user
+    events.publish(session, "user", events.UPDATED, user_id)
     db_user = crud.update_user(session=session, db_user=db_user, user_in=user_in)
+    user_cache.delete(str(user_id))
     return db_user
 
 
@@ -219,5 +247,7 @@ def delete_user(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
     session.delete(user)
+    events.publish(session, "user", events.DELETED, user_id)
     session.commit()
+    user_cache.delete(str(user_id))
     return Message(message="User deleted successfully")
@@ -1,9 +1,12 @@
+from typing import Any
+
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
-from app.api.deps import get_current_active_superuser
+from app.api.deps import SessionDep, get_current_active_superuser
+from app.core import metrics
 from app.models import Message
-from app.utils import generate_test_email, send_email
+from app.utils import generate_test_email, queue_email
 
 router = APIRouter(prefix="/utils", tags=["utils"])
 
@@ -13,12 +16,13 @@ router = APIRouter(prefix="/utils", tags=["utils"])
     dependencies=[Depends(get_current_active_superuser)],
     status_code=201,
 )
-def test_email(email_to: EmailStr) -> Message:
+def test_email(session: SessionDep, email_to: EmailStr) -> Message:
     """
     Test emails.
     """
     email_data = generate_test_email(email_to=email_to)
-    send_email(
+    queue_email(
+        session=session,
         email_to=email_to,
         subject=email_data.subject,
         html_content=email_data.html_content,
@@ -26,6 +30,17 @@ def test_email(email_to: EmailStr) -> Message:
     return Message(message="Test email sent")
 
 
+@router.get(
+    "/metrics/",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+def read_metrics() -> dict[str, dict[str, Any]]:
+    """
+    Counters of the caches and background components of this worker.
+    """
+    return metrics.collect()
+
+
 @router.get("/health-check/")
 async def health_check() -> bool:
     return True
@@ -0,0 +1,239 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable, Sequence
+from typing import Any, Protocol, TypeVar, cast
+
+import redis
+from sqlmodel import SQLModel
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+P = TypeVar("P", bound=SQLModel)
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with a per-entry TTL.
+
+    Size and lifetime are both bounded: the least recently used entry is evicted
+    once `maxsize` is reached and entries older than `ttl` seconds are dropped
+    on access.
+    """
+
+    def __init__(self, *, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Any | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, value = entry
+            if expires <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def add(self, key: str, value: Any) -> bool:
+        """Set `key` only if absent (or expired), atomically. Returns whether it was set."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                return False
+            self._data[key] = (now + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class SharedBackend(Protocol):
+    """A cache shared by every worker, holding JSON strings."""
+
+    def get(self, key: str) -> str | None: ...
+
+    def set(self, key: str, value: str, ttl: float) -> None: ...
+
+    def delete(self, *keys: str) -> None: ...
+
+
+class RedisBackend:
+    def __init__(self, url: str) -> None:
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key: str) -> str | None:
+        # The sync client, its stubs also cover the async one
+        return cast(str | None, self._client.get(key))
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        self._client.set(key, value, px=int(ttl * 1000))
+
+    def delete(self, *keys: str) -> None:
+        self._client.delete(*keys)
+
+
+class EntityCache:
+    """
+    Read-through cache of the public representation of rows, by table and id.
+
+    Lookups go to the in-process LRU first, then to the optional shared backend
+    and finally to the loader (the database). Errors of the shared backend are
+    logged and treated as misses, so it can never take reads down.
+    """
+
+    def __init__(self, local: LRUCache, shared: SharedBackend | None = None) -> None:
+        self.local = local
+        self.shared = shared
+        self.shared_hits = 0
+        self.shared_errors = 0
+
+    @staticmethod
+    def key(table: str, id: uuid.UUID) -> str:
+        return f"{table}:{id}"
+
+    def get_or_load(
+        self,
+        public_model: type[P],
+        table: str,
+        id: uuid.UUID,
+        loader: Callable[[], SQLModel | None],
+    ) -> P | None:
+        key = self.key(table, id)
+        cached = self.local.get(key)
+        if cached is not None:
+            return cached  # type: ignore[no-any-return]
+
+        if self.shared is not None:
+            try:
+                raw = self.shared.get(key)
+            except Exception:
+                self.shared_errors += 1
+                logger.warning("Shared cache get failed for %s", key, exc_info=True)
+                raw = None
+            if raw is not None:
+                self.shared_hits += 1
+                value = public_model.model_validate_json(raw)
+                self.local.set(key, value)
+                return value
+
+        row = loader()
+        if row is None:
+            return None
+        value = public_model.model_validate(row)
+        self.local.set(key, value)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value.model_dump_json(), self.local.ttl)
+            except Exception:
+                self.shared_errors += 1
+                logger.warning("Shared cache set failed for %s", key, exc_info=True)
+        return value
+
+    def invalidate(self, table: str, id: uuid.UUID) -> None:
+        key = self.key(table, id)
+        self.local.delete(key)
+        if self.shared is not None:
+            try:
+                self.shared.delete(key)
+            except Exception:
+                self.shared_errors += 1
+                logger.warning("Shared cache delete failed for %s", key, exc_info=True)
+
+    def invalidate_many(self, table: str, ids: Sequence[uuid.UUID]) -> None:
+        """invalidate() for a batch of rows, with one delete on the shared backend."""
+        if not ids:
+            return
+        keys = [self.key(table, id) for id in ids]
+        for key in keys:
+            self.local.delete(key)
+        if self.shared is not None:
+            try:
+                self.shared.delete(*keys)
+            except Exception:
+                self.shared_errors += 1
+                logger.warning(
+                    "Shared cache delete failed for %d %s keys",
+                    len(keys),
+                    table,
+                    exc_info=True,
+                )
+
+    def invalidate_local(self, table: str, id: uuid.UUID) -> None:
+        """Drop only this worker's copy, the writer already cleared the shared one."""
+        self.local.delete(self.key(table, id))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            **self.local.stats(),
+            "shared": self.shared is not None,
+            "shared_hits": self.shared_hits,
+            "shared_errors": self.shared_errors,
+        }
+
+
+entity_cache = EntityCache(
+    LRUCache(
+        maxsize=settings.ENTITY_CACHE_MAX_SIZE,
+        ttl=settings.ENTITY_CACHE_TTL_SECONDS,
+    ),
+    RedisBackend(settings.ENTITY_CACHE_REDIS_URL)
+    if settings.ENTITY_CACHE_REDIS_URL
+    else None,
+)
+metrics.register("entity_cache", entity_cache.stats)
+
+# Column values of the users resolved from access tokens, by user id
+user_cache = LRUCache(
+    maxsize=settings.USER_CACHE_MAX_SIZE,
+    ttl=settings.USER_CACHE_TTL_SECONDS,
+)
+metrics.register("user_cache", user_cache.stats)
@@ -68,6 +68,140 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    # Connection pool of each engine (sync and async), per worker: at most
+    # POOL_SIZE + MAX_OVERFLOW connections; a checkout waits up to POOL_TIMEOUT
+    # for one to be returned. Connections older than POOL_RECYCLE are replaced
+    # (-1 never) and PRE_PING tests each one on checkout
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # POSTGRES_SERVER is a PgBouncer in transaction mode: don't use server-side
+    # prepared statements, consecutive transactions may run on other backends.
+    # LISTEN only works on a dedicated session, so the event bus connects to
+    # POSTGRES_DIRECT_SERVER/PORT (Postgres itself) when they are set
+    DB_PGBOUNCER: bool = False
+    POSTGRES_DIRECT_SERVER: str | None = None
+    POSTGRES_DIRECT_PORT: int | None = None
+
+    # Optional streaming replica serving the list endpoints of the dashboards.
+    # A user that wrote keeps reading from the primary for READ_YOUR_WRITES
+    # seconds, on every worker, so they don't miss their own write while the
+    # replica catches up
+    POSTGRES_REPLICA_SERVER: str | None = None
+    POSTGRES_REPLICA_PORT: int | None = None
+    READ_YOUR_WRITES_SECONDS: float = 5.0
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def SQLALCHEMY_REPLICA_DATABASE_URI(self) -> PostgresDsn | None:
+        if not self.POSTGRES_REPLICA_SERVER:
+            return None
+        return PostgresDsn.build(
+            scheme="postgresql+psycopg",
+            username=self.POSTGRES_USER,
+            password=self.POSTGRES_PASSWORD,
+            host=self.POSTGRES_REPLICA_SERVER,
+            port=self.POSTGRES_REPLICA_PORT or self.POSTGRES_PORT,
+            path=self.POSTGRES_DB,
+        )
+
+    # By-id reads of the domain routes, cached per worker (LRU + TTL) and, when
+    # a Redis URL is set, in a cache shared by all workers
+    ENTITY_CACHE_MAX_SIZE: int = 10_000
+    ENTITY_CACHE_TTL_SECONDS: float = 30.0
+    ENTITY_CACHE_REDIS_URL: str | None = None
+
+    # Users resolved from access tokens, cached per worker. Changes made through
+    # the API evict them right away, the TTL bounds how long a change made
+    # elsewhere (or missed by the event bus) can go unnoticed
+    USER_CACHE_MAX_SIZE: int = 1_000
+    USER_CACHE_TTL_SECONDS: float = 10.0
+
+    # Controladores sign their requests with HMAC-SHA256 keyed by assinatura.
+    # Signatures older (or newer) than MAX_AGE are rejected as replays; after a
+    # change of assinatura the previous key is accepted for the grace period
+    CONTROLADOR_SIGNATURE_MAX_AGE_SECONDS: int = 60
+    CONTROLADOR_KEY_ROTATION_GRACE_SECONDS: int = 3600
+    # Controlador ids found missing from the table are remembered for a while,
+    # so requests with forged ids are rejected without a query each
+    CONTROLADOR_UNKNOWN_CACHE_MAX_SIZE: int = 10_000
+    CONTROLADOR_UNKNOWN_CACHE_TTL_SECONDS: float = 30.0
+
+    # bcrypt cost factor. Hashes made with another one are rehashed on login
+    BCRYPT_ROUNDS: int = 12
+    # Password hashing runs on its own pool instead of the request threadpool;
+    # once all workers are busy and QUEUE_SIZE more are waiting, requests that
+    # need it fail fast with a 503
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_QUEUE_SIZE: int = 32
+
+    # Lifetime of the per-worker counts of list endpoints called with count_mode=cached
+    COUNT_CACHE_TTL_SECONDS: float = 30.0
+
+    # Long-poll for pending comandos: default and upper bound for ?timeout=
+    COMANDO_LONG_POLL_TIMEOUT_SECONDS: float = 25.0
+    COMANDO_LONG_POLL_MAX_TIMEOUT_SECONDS: float = 60.0
+    # How long a claimed comando stays reserved before it can be claimed again
+    COMANDO_LEASE_SECONDS: int = 60
+    # A new comando identical to a pending one of the same controlador is not
+    # queued again. For these comandos only the newest param counts: it replaces
+    # the param of the pending one (setpoints and the like)
+    COMANDOS_LAST_WRITE_WINS: Annotated[
+        list[str] | str, BeforeValidator(parse_cors)
+    ] = ["setpoint"]
+    # And these are always queued, every repetition counts
+    COMANDOS_NOT_COALESCED: Annotated[list[str] | str, BeforeValidator(parse_cors)] = []
+
+    # Heartbeats are buffered per worker and written every FLUSH_SECONDS, with
+    # one UPDATE per FLUSH_BATCH_SIZE controladores
+    HEARTBEAT_FLUSH_SECONDS: float = 5.0
+    HEARTBEAT_FLUSH_BATCH_SIZE: int = 5_000
+    # An aparelho is listed as offline once its last heartbeat is this old
+    APARELHO_OFFLINE_AFTER_SECONDS: int = 900
+
+    # The leader sweeps aparelhos silent for OFFLINE_AFTER_SECONDS to offline
+    # every SWEEP_SECONDS, at most SWEEP_BATCH_SIZE of them per sweep
+    APARELHO_SWEEP_SECONDS: float = 30.0
+    APARELHO_SWEEP_BATCH_SIZE: int = 10_000
+
+    # The leader keeps the due times of the agendado comandos of the next
+    # SCHEDULER_HORIZON_SECONDS in memory and queues them when they come due,
+    # at most SCHEDULER_BATCH_SIZE per UPDATE
+    COMANDO_SCHEDULER_HORIZON_SECONDS: int = 3600
+    COMANDO_SCHEDULER_BATCH_SIZE: int = 10_000
+
+    # The leader sets the waiting comandos past their expira_em expirado every
+    # EXPIRY_SWEEP_SECONDS, at most EXPIRY_BATCH_SIZE per UPDATE
+    COMANDO_EXPIRY_SWEEP_SECONDS: float = 10.0
+    COMANDO_EXPIRY_BATCH_SIZE: int = 10_000
+
+    # Responses to writes sent with an Idempotency-Key are replayed to retries
+    # for KEY_TTL_SECONDS. A retry waits up to LOCK_TIMEOUT_SECONDS for the
+    # request holding its key. The leader deletes expired keys every
+    # PURGE_SECONDS, at most PURGE_BATCH_SIZE of them at a time
+    IDEMPOTENCY_KEY_TTL_SECONDS: int = 86_400
+    IDEMPOTENCY_LOCK_TIMEOUT_SECONDS: float = 30.0
+    IDEMPOTENCY_PURGE_SECONDS: float = 300.0
+    IDEMPOTENCY_PURGE_BATCH_SIZE: int = 10_000
+
+    # One worker runs the singleton jobs, elected with an advisory lock; the
+    # others retry, and the leader checks its connection, every CHECK_SECONDS
+    LEADER_CHECK_SECONDS: float = 5.0
+
+    # Presence of the aparelhos (last heartbeat), shared by the workers of a host
+    # through this memory-mapped file; /dev/shm keeps it off the disk
+    PRESENCE_PATH: str = "/dev/shm/aparelho-presence"
+    # Copied here every SNAPSHOT_SECONDS so a restart comes up warm. Must be on
+    # a volume that outlives the container (docker-compose mounts one on
+    # /app/data), anywhere else every restart comes up cold. None disables
+    # snapshots
+    PRESENCE_SNAPSHOT_PATH: str | None = "/app/data/aparelho-presence.snapshot"
+    PRESENCE_SNAPSHOT_SECONDS: float = 60.0
+    # Size of the table, aparelhos beyond it are not tracked
+    PRESENCE_MAX_APARELHOS: int = 200_000
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
@@ -85,6 +219,21 @@ class Settings(BaseSettings):
 
     EMAIL_RESET_TOKEN_EXPIRE_HOURS: int = 48
 
+    # Endpoints only queue emails in the outbox table; a dispatcher per worker
+    # sends them in batches of BATCH_SIZE over one SMTP connection, closed after
+    # SMTP_IDLE_TIMEOUT of inactivity. A failed email is retried after
+    # RETRY_BASE * 2**(attempts - 1) seconds, until MAX_ATTEMPTS
+    EMAIL_OUTBOX_BATCH_SIZE: int = 50
+    EMAIL_OUTBOX_POLL_SECONDS: float = 2.0
+    EMAIL_OUTBOX_MAX_ATTEMPTS: int = 8
+    EMAIL_OUTBOX_RETRY_BASE_SECONDS: float = 30.0
+    SMTP_IDLE_TIMEOUT_SECONDS: float = 30.0
+    # The leader deletes the emails sent more than RETENTION_SECONDS ago every
+    # PURGE_SECONDS, at most PURGE_BATCH_SIZE of them at a time
+    EMAIL_OUTBOX_RETENTION_SECONDS: int = 7 * 86_400
+    EMAIL_OUTBOX_PURGE_SECONDS: float = 3600.0
+    EMAIL_OUTBOX_PURGE_BATCH_SIZE: int = 10_000
+
     @computed_field  # type: ignore[prop-decorator]
     @property
     def emails_enabled(self) -> bool:
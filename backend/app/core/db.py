@@ -1,10 +1,174 @@
+import threading
+import time
+from collections import deque
+from typing import Any
+
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
 from sqlmodel import Session, create_engine, select
 
 from app import crud
+from app.core import metrics
+from app.core.cache import LRUCache
 from app.core.config import settings
 from app.models import User, UserCreate
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+
+class CheckoutStats:
+    """How long checkouts from a pool waited, and how many gave up."""
+
+    def __init__(self, samples: int = 1_000) -> None:
+        self._waits: deque[float] = deque(maxlen=samples)
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record(self, seconds: float, *, timed_out: bool = False) -> None:
+        with self._lock:
+            self._waits.append(seconds)
+            self.wait_seconds_total += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            stats: dict[str, Any] = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": self.wait_seconds_total,
+                "max_wait_seconds": self.max_wait_seconds,
+            }
+        for name, p in (("p50", 0.5), ("p99", 0.99)):
+            stats[f"wait_seconds_{name}"] = (
+                waits[min(len(waits) - 1, int(len(waits) * p))] if waits else None
+            )
+        return stats
+
+
+class _TimedCheckout:
+    """Times every checkout of a queue pool, including the wait for a free slot."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats = CheckoutStats()
+
+    def _do_get(self) -> Any:
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()  # type: ignore[misc]
+        except exc.TimeoutError:
+            self.stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - start)
+        return connection
+
+    def recreate(self) -> Any:
+        # dispose() replaces the pool, keep counting on the same stats
+        pool = super().recreate()  # type: ignore[misc]
+        pool.stats = self.stats
+        return pool
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options() -> dict[str, Any]:
+    options: dict[str, Any] = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    if settings.DB_PGBOUNCER:
+        # psycopg prepares a statement after it ran prepare_threshold times on a
+        # connection; None never does
+        options["connect_args"] = {"prepare_threshold": None}
+    return options
+
+
+def pool_stats(pool: Pool) -> dict[str, Any]:
+    assert isinstance(pool, _TimedCheckout) and isinstance(pool, QueuePool)
+    capacity = pool.size() + pool._max_overflow
+    in_use = pool.checkedout()
+    return {
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "checked_out": in_use,
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "saturation": in_use / capacity if capacity > 0 else None,
+        **pool.stats.snapshot(),
+    }
+
+
+engine = create_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=TimedQueuePool,
+    **engine_options(),
+)
+# Same database through psycopg's async driver, for the async def routes. It has
+# its own pool, separate from the one of the sync engine
+async_engine = create_async_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=TimedAsyncQueuePool,
+    **engine_options(),
+)
+metrics.register("db_pool", lambda: pool_stats(engine.pool))
+metrics.register("db_pool_async", lambda: pool_stats(async_engine.sync_engine.pool))
+
+# Read-only engine of the list endpoints: the replica when one is configured,
+# otherwise the primary
+async_replica_engine = async_engine
+if settings.SQLALCHEMY_REPLICA_DATABASE_URI:
+    async_replica_engine = create_async_engine(
+        str(settings.SQLALCHEMY_REPLICA_DATABASE_URI),
+        poolclass=TimedAsyncQueuePool,
+        **engine_options(),
+    )
+    metrics.register(
+        "db_pool_replica", lambda: pool_stats(async_replica_engine.sync_engine.pool)
+    )
+
+
+def direct_conninfo() -> str:
+    """
+    libpq connection string of Postgres itself, for connections kept outside of
+    the pools that need session state (LISTEN, advisory locks): behind
+    PgBouncer in transaction mode that state would land on any server
+    connection.
+    """
+    url = engine.url.set(drivername="postgresql")
+    if settings.POSTGRES_DIRECT_SERVER:
+        url = url.set(host=settings.POSTGRES_DIRECT_SERVER)
+    if settings.POSTGRES_DIRECT_PORT:
+        url = url.set(port=settings.POSTGRES_DIRECT_PORT)
+    return url.render_as_string(hide_password=False)
+
+
+# Principals (the sub of their token) that wrote within READ_YOUR_WRITES_SECONDS
+# and still read from the primary. Set by ReadYourWritesMiddleware on the worker
+# that took the write and by the event bus on the others
+recent_writers = LRUCache(maxsize=100_000, ttl=settings.READ_YOUR_WRITES_SECONDS)
+
+
+def async_read_engine(sub: str | None) -> AsyncEngine:
+    """The replica, unless the principal wrote recently and still reads from the primary."""
+    if sub is not None and recent_writers.get(sub) is not None:
+        return async_engine
+    return async_replica_engine
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
@@ -0,0 +1,320 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import psycopg
+from psycopg import sql
+from sqlalchemy import column, values
+from sqlmodel import Session, String, func, select
+
+from app.core import metrics
+from app.core.cache import entity_cache, user_cache
+from app.core.db import async_engine, direct_conninfo, recent_writers
+from app.core.signing import key_cache
+
+logger = logging.getLogger(__name__)
+
+# Single channel for every write event, routed to subscribers by table
+CHANNEL = "api_irriga_eventos"
+
+CREATED = "c"
+UPDATED = "u"
+DELETED = "d"
+
+# Event table of the principals that just wrote, by the sub of their token
+WRITER = "escritor"
+
+# Tables whose rows are held in the entity cache
+CACHED_TABLES = ("agricultor", "setor", "aparelho", "controlador", "comando")
+
+
+@dataclass(frozen=True)
+class Event:
+    table: str
+    op: str
+    id: str
+    # Wall clock of the publisher, used to report the bus lag
+    ts: float
+    # Routing key, e.g. the controlador a new comando is for, or the unix time
+    # a scheduled one is due
+    key: str | None = None
+
+    def encode(self) -> str:
+        data = {"t": self.table, "o": self.op, "i": self.id, "s": round(self.ts, 3)}
+        if self.key is not None:
+            data["k"] = self.key
+        return json.dumps(data, separators=(",", ":"))
+
+    @classmethod
+    def decode(cls, payload: str) -> "Event":
+        data = json.loads(payload)
+        return cls(
+            table=data["t"], op=data["o"], id=data["i"], ts=data["s"], key=data.get("k")
+        )
+
+
+def publish(
+    session: Session,
+    table: str,
+    op: str,
+    id: uuid.UUID,
+    key: uuid.UUID | str | None = None,
+) -> None:
+    """
+    Queue an event on the session's transaction.
+
+    Postgres only delivers it when the transaction commits, so subscribers never
+    act on writes they can't see yet, and never on writes that rolled back.
+    """
+    publish_many(session, table, op, [(id, key)])
+
+
+def publish_many(
+    session: Session,
+    table: str,
+    op: str,
+    ids: Iterable[tuple[uuid.UUID, uuid.UUID | str | None]],
+) -> None:
+    """Queue one event per (id, key) pair with a single statement."""
+    now = time.time()
+    payloads = [
+        Event(
+            table=table,
+            op=op,
+            id=str(id),
+            ts=now,
+            key=str(key) if key is not None else None,
+        ).encode()
+        for id, key in ids
+    ]
+    if not payloads:
+        return
+    rows = values(column("payload", String), name="evento").data(
+        [(payload,) for payload in payloads]
+    )
+    session.exec(select(func.pg_notify(CHANNEL, rows.c.payload)).select_from(rows))
+
+
+async def notify(table: str, op: str, id: str) -> None:
+    """
+    Send an event right away, on a connection of the async pool and outside of
+    any transaction, for what isn't tied to a write of its own.
+    """
+    payload = Event(table=table, op=op, id=id, ts=time.time()).encode()
+    async with async_engine.connect() as connection:
+        await connection.execute(select(func.pg_notify(CHANNEL, payload)))
+        await connection.commit()
+
+
+class Waiters:
+    """
+    Asyncio events keyed by a string, woken from any thread.
+
+    Each uvicorn worker has its own instance; the EventBus below is what makes a
+    wakeup published by one worker reach the waiters of all the others.
+    """
+
+    def __init__(self) -> None:
+        self._events: dict[str, set[asyncio.Event]] = defaultdict(set)
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    @contextmanager
+    def subscribe(self, key: str) -> Iterator[asyncio.Event]:
+        event = asyncio.Event()
+        self._events[key].add(event)
+        try:
+            yield event
+        finally:
+            events = self._events.get(key)
+            if events is not None:
+                events.discard(event)
+                if not events:
+                    del self._events[key]
+
+    def wake(self, key: str) -> None:
+        for event in self._events.get(key, ()):
+            event.set()
+
+    def wake_all(self) -> None:
+        for events in self._events.values():
+            for event in events:
+                event.set()
+
+    def wake_threadsafe(self, key: str | None = None) -> None:
+        if self._loop is None or self._loop.is_closed():
+            return
+        if key is None:
+            self._loop.call_soon_threadsafe(self.wake_all)
+        else:
+            self._loop.call_soon_threadsafe(self.wake, key)
+
+
+class EventBus:
+    """
+    Background thread LISTENing on CHANNEL and dispatching events by table.
+
+    The connection is opened from the engine URL but outside of its pool, so a
+    worker keeps all of its pooled connections for requests. When it drops, the
+    bus reconnects with exponential backoff and then runs the reconnect hooks:
+    events published while it was away are lost, so subscribers holding state
+    derived from them (caches, waiters) must resynchronise there.
+    """
+
+    def __init__(
+        self,
+        *,
+        poll_seconds: float = 1.0,
+        retry_seconds: float = 0.5,
+        max_retry_seconds: float = 30.0,
+    ) -> None:
+        self._subscribers: dict[str, list[Callable[[Event], None]]] = defaultdict(list)
+        self._reconnect_hooks: list[Callable[[], None]] = []
+        self._poll_seconds = poll_seconds
+        self._retry_seconds = retry_seconds
+        self._max_retry_seconds = max_retry_seconds
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.ready = threading.Event()
+
+        self.connects = 0
+        self.received = 0
+        self.dispatch_errors = 0
+        self.last_lag_seconds: float | None = None
+        self.max_lag_seconds = 0.0
+        self.last_event_at: float | None = None
+
+    def subscribe(self, table: str, callback: Callable[[Event], None]) -> None:
+        self._subscribers[table].append(callback)
+
+    def on_reconnect(self, hook: Callable[[], None]) -> None:
+        self._reconnect_hooks.append(hook)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="event-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self._poll_seconds * 2)
+        self._thread = None
+        self.ready.clear()
+
+    def _run(self) -> None:
+        delay = self._retry_seconds
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(direct_conninfo(), autocommit=True) as conn:
+                    conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(CHANNEL)))
+                    self.connects += 1
+                    if self.connects > 1:
+                        self._run_reconnect_hooks()
+                    self.ready.set()
+                    delay = self._retry_seconds
+                    while not self._stop.is_set():
+                        for notification in conn.notifies(timeout=self._poll_seconds):
+                            self._dispatch(notification.payload)
+            except Exception:
+                logger.exception("Event bus connection failed, reconnecting")
+            self.ready.clear()
+            self._stop.wait(delay)
+            delay = min(delay * 2, self._max_retry_seconds)
+
+    def _run_reconnect_hooks(self) -> None:
+        for hook in self._reconnect_hooks:
+            try:
+                hook()
+            except Exception:
+                logger.exception("Error in event bus reconnect hook")
+
+    def _dispatch(self, payload: str) -> None:
+        try:
+            event = Event.decode(payload)
+        except (ValueError, KeyError):
+            logger.warning("Ignoring malformed event %r", payload)
+            return
+        now = time.time()
+        self.received += 1
+        self.last_event_at = now
+        self.last_lag_seconds = max(now - event.ts, 0.0)
+        self.max_lag_seconds = max(self.max_lag_seconds, self.last_lag_seconds)
+        for callback in self._subscribers.get(event.table, ()):
+            try:
+                callback(event)
+            except Exception:
+                self.dispatch_errors += 1
+                logger.exception("Error handling %s event", event.table)
+
+    def stats(self) -> dict[str, object]:
+        return {
+            "connected": self.ready.is_set(),
+            "connects": self.connects,
+            "received": self.received,
+            "dispatch_errors": self.dispatch_errors,
+            "last_lag_seconds": self.last_lag_seconds,
+            "max_lag_seconds": self.max_lag_seconds,
+            "seconds_since_last_event": (
+                time.time() - self.last_event_at
+                if self.last_event_at is not None
+                else None
+            ),
+        }
+
+
+bus = EventBus()
+comando_waiters = Waiters()
+metrics.register("event_bus", bus.stats)
+
+
+def _wake_comando_waiters(event: Event) -> None:
+    if event.op == CREATED and event.key is not None:
+        comando_waiters.wake_threadsafe(event.key)
+
+
+def _invalidate_entity(event: Event) -> None:
+    if event.op != CREATED:
+        entity_cache.invalidate_local(event.table, uuid.UUID(event.id))
+
+
+def _record_writer(event: Event) -> None:
+    recent_writers.set(event.id, True)
+
+
+def _invalidate_user(event: Event) -> None:
+    user_cache.delete(event.id)
+
+
+for table in CACHED_TABLES:
+    bus.subscribe(table, _invalidate_entity)
+
+
+def _refresh_controlador_key(event: Event) -> None:
+    if event.op == DELETED:
+        key_cache.drop(uuid.UUID(event.id))
+    else:
+        key_cache.load(uuid.UUID(event.id))
+
+
+bus.subscribe("user", _invalidate_user)
+bus.subscribe("controlador", _refresh_controlador_key)
+bus.subscribe("comando", _wake_comando_waiters)
+bus.subscribe(WRITER, _record_writer)
+# Events published while the bus was down are gone: drop everything that may
+# have been invalidated by them and let pollers re-read what they missed
+bus.on_reconnect(entity_cache.local.clear)
+bus.on_reconnect(user_cache.clear)
+bus.on_reconnect(key_cache.warm)
+bus.on_reconnect(comando_waiters.wake_threadsafe)
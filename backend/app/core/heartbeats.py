@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from sqlmodel import Session
+
+from app import crud
+from app.core import metrics, presence
+from app.core.cache import entity_cache
+from app.core.config import settings
+from app.core.db import engine
+
+logger = logging.getLogger(__name__)
+
+
+class HeartbeatBuffer:
+    """
+    Last heartbeat of each controlador, written to the database in bulk.
+
+    Recording a heartbeat only replaces an entry in memory; a background thread
+    flushes the entries every `flush_seconds` with one UPDATE per `batch_size`
+    controladores, so thousands of heartbeats per second cost a handful of
+    statements. A failed flush puts its entries back, unless a newer heartbeat
+    of the same controlador arrived meanwhile. Whatever is still buffered when
+    a worker stops is flushed on the way out.
+    """
+
+    def __init__(self, *, flush_seconds: float, batch_size: int) -> None:
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self._pending: dict[uuid.UUID, tuple[str, datetime]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        self.recorded = 0
+        self.flushes = 0
+        self.statements = 0
+        self.rows_updated = 0
+        self.flush_errors = 0
+        self.last_flush_seconds: float | None = None
+
+    def record(self, controlador_id: uuid.UUID, status: str) -> None:
+        ultima_conexao = datetime.now(timezone.utc)
+        with self._lock:
+            self._pending[controlador_id] = (status, ultima_conexao)
+            self.recorded += 1
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="heartbeats", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_seconds * 2)
+        self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Heartbeat flush failed")
+
+    def flush(self) -> int:
+        """Write out everything buffered so far. Returns the updated aparelhos."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            start = time.perf_counter()
+            heartbeats = [
+                (controlador_id, status, ultima_conexao)
+                for controlador_id, (status, ultima_conexao) in pending.items()
+            ]
+            updated: list[tuple[uuid.UUID, datetime]] = []
+            try:
+                with Session(engine) as session:
+                    for i in range(0, len(heartbeats), self.batch_size):
+                        updated += crud.record_heartbeats(
+                            session=session,
+                            heartbeats=heartbeats[i : i + self.batch_size],
+                        )
+                        self.statements += 1
+                    session.commit()
+            except Exception:
+                self.flush_errors += 1
+                with self._lock:
+                    # Newer heartbeats recorded during the flush win
+                    self._pending = {**pending, **self._pending}
+                raise
+            self.flushes += 1
+            self.rows_updated += len(updated)
+            self.last_flush_seconds = time.perf_counter() - start
+        presence.table.touch_many(
+            (aparelho_id, ultima_conexao.timestamp())
+            for aparelho_id, ultima_conexao in updated
+        )
+        # Cleared here and in the shared cache, so no worker reloads a stale
+        # copy from it. Other workers drop their local copy when
+        # ENTITY_CACHE_TTL_SECONDS expires; announcing every heartbeat on the
+        # event bus would cost more than it saves
+        entity_cache.invalidate_many(
+            "aparelho", [aparelho_id for aparelho_id, _ in updated]
+        )
+        return len(updated)
+
+    def stats(self) -> dict[str, object]:
+        return {
+            "pending": len(self._pending),
+            "recorded": self.recorded,
+            "flushes": self.flushes,
+            "statements": self.statements,
+            "rows_updated": self.rows_updated,
+            "flush_errors": self.flush_errors,
+            "last_flush_seconds": self.last_flush_seconds,
+        }
+
+
+buffer = HeartbeatBuffer(
+    flush_seconds=settings.HEARTBEAT_FLUSH_SECONDS,
+    batch_size=settings.HEARTBEAT_FLUSH_BATCH_SIZE,
+)
+metrics.register("heartbeats", buffer.stats)
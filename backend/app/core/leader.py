@@ -0,0 +1,205 @@
+import abc
+import hashlib
+import logging
+import threading
+import time
+
+import psycopg
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.db import direct_conninfo
+
+logger = logging.getLogger(__name__)
+
+
+def lock_key(name: str) -> int:
+    """Stable bigint key of an advisory lock, the same in every worker."""
+    digest = hashlib.blake2b(name.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class Leadership:
+    """
+    Elects one worker, among all the workers of all the hosts, to run the
+    singleton background jobs (sweepers, dispatchers).
+
+    A background thread keeps a connection of its own, outside of the pools,
+    and tries to take a session-level advisory lock named `name` every
+    `retry_seconds`. Whoever holds it is the leader until its connection goes
+    away, when Postgres releases the lock and another worker takes over. The
+    leader checks its connection every `check_seconds`, so for that long after
+    losing it a worker may still believe it leads: jobs must tolerate an
+    occasional overlapping run.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        retry_seconds: float = 5.0,
+        check_seconds: float = 5.0,
+    ) -> None:
+        self.name = name
+        self.key = lock_key(name)
+        self._retry_seconds = retry_seconds
+        self._check_seconds = check_seconds
+        self._leading = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        self.elected = 0
+        self.lost = 0
+        self.leading_since: float | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leading.is_set()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="leader", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(self._retry_seconds, self._check_seconds) * 2)
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(direct_conninfo(), autocommit=True) as conn:
+                    self._campaign(conn)
+            except Exception:
+                logger.exception("Leader election connection failed, reconnecting")
+            if self._leading.is_set():
+                self._leading.clear()
+                self.leading_since = None
+                self.lost += 1
+                logger.warning("Lost leadership of %s", self.name)
+            self._stop.wait(self._retry_seconds)
+
+    def _campaign(self, conn: psycopg.Connection) -> None:
+        while not self._stop.is_set():
+            if not self._leading.is_set():
+                row = conn.execute(
+                    "SELECT pg_try_advisory_lock(%s)", (self.key,)
+                ).fetchone()
+                if row and row[0]:
+                    self._leading.set()
+                    self.leading_since = time.time()
+                    self.elected += 1
+                    logger.info("Elected leader of %s", self.name)
+                else:
+                    self._stop.wait(self._retry_seconds)
+                    continue
+            # Fails, and ends the leadership, if the connection went away
+            conn.execute("SELECT 1")
+            self._stop.wait(self._check_seconds)
+        if self._leading.is_set():
+            conn.execute("SELECT pg_advisory_unlock(%s)", (self.key,))
+            self._leading.clear()
+            self.leading_since = None
+
+    def stats(self) -> dict[str, object]:
+        return {
+            "leader": self.is_leader,
+            "elected": self.elected,
+            "lost": self.lost,
+            "leading_seconds": (
+                time.time() - self.leading_since
+                if self.leading_since is not None
+                else None
+            ),
+        }
+
+
+class LeaderJob(abc.ABC):
+    """
+    Background thread calling `run_once` every `interval_seconds`, on the
+    leader only: every worker starts it, the others just wait their turn.
+
+    Subclasses implement run_once, returning how many rows it handled, and get
+    their counters reported by stats().
+    """
+
+    name = "leader-job"
+
+    def __init__(self, *, leadership: Leadership, interval_seconds: float) -> None:
+        self.leadership = leadership
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        self.runs = 0
+        self.processed = 0
+        self.last_processed: int | None = None
+        self.last_run_seconds: float | None = None
+        self.max_run_seconds = 0.0
+        self.errors = 0
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval_seconds * 2)
+        self._thread = None
+
+    def _wait(self) -> bool:
+        """Sleep until the next run. True once stopped."""
+        return self._stop.wait(self.interval_seconds)
+
+    def _run(self) -> None:
+        while not self._wait():
+            if not self.leadership.is_leader:
+                continue
+            try:
+                self.run()
+            except Exception:
+                self.errors += 1
+                logger.exception("%s failed", self.name)
+
+    def run(self) -> int:
+        """Run once now, leader or not. Returns how many rows were handled."""
+        start = time.perf_counter()
+        processed = self.run_once()
+        elapsed = time.perf_counter() - start
+        self.runs += 1
+        self.processed += processed
+        self.last_processed = processed
+        self.last_run_seconds = elapsed
+        self.max_run_seconds = max(self.max_run_seconds, elapsed)
+        return processed
+
+    @abc.abstractmethod
+    def run_once(self) -> int:
+        """Handle one batch of work. Returns how many rows were handled."""
+
+    def stats(self) -> dict[str, object]:
+        return {
+            "leader": self.leadership.is_leader,
+            "runs": self.runs,
+            "processed": self.processed,
+            "last_processed": self.last_processed,
+            "last_run_seconds": self.last_run_seconds,
+            "max_run_seconds": self.max_run_seconds,
+            "errors": self.errors,
+        }
+
+
+leader = Leadership(
+    "api-irriga-leader",
+    retry_seconds=settings.LEADER_CHECK_SECONDS,
+    check_seconds=settings.LEADER_CHECK_SECONDS,
+)
+metrics.register("leader", leader.stats)
@@ -0,0 +1,14 @@
+from collections.abc import Callable
+from typing import Any
+
+# Components register a callable returning a snapshot of their counters, the
+# utils metrics endpoint reports all of them
+_providers: dict[str, Callable[[], dict[str, Any]]] = {}
+
+
+def register(name: str, provider: Callable[[], dict[str, Any]]) -> None:
+    _providers[name] = provider
+
+
+def collect() -> dict[str, dict[str, Any]]:
+    return {name: provider() for name, provider in _providers.items()}
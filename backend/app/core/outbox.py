@@ -0,0 +1,231 @@
+import logging
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.utils import formataddr
+
+from sqlmodel import Session, col, select
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.db import engine
+from app.models import (
+    EMAIL_STATUS_ENVIADO,
+    EMAIL_STATUS_FALHOU,
+    EMAIL_STATUS_PENDENTE,
+    EmailOutbox,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class EmailDispatcher:
+    """
+    Background thread sending the emails queued in the outbox table.
+
+    Due emails are claimed in batches with SKIP LOCKED, so the dispatchers of
+    every worker share the queue without sending anything twice, and sent over
+    a single SMTP connection that is kept open between batches until it has
+    been idle for `idle_seconds`. A failed email is retried with exponential
+    backoff and marked as failed after `max_attempts`. The content of an email
+    is cleared once it is sent or given up on, and the sent rows themselves
+    are deleted by the leader's EmailOutboxPurger.
+    """
+
+    def __init__(
+        self,
+        *,
+        batch_size: int,
+        poll_seconds: float,
+        max_attempts: int,
+        retry_base_seconds: float,
+        idle_seconds: float,
+        timeout: float = 10.0,
+    ) -> None:
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.idle_seconds = idle_seconds
+        self.timeout = timeout
+        self._smtp: smtplib.SMTP | None = None
+        self._smtp_used_at = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.connections = 0
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="email-outbox", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout)
+        self._thread = None
+
+    def wake(self) -> None:
+        """Check the outbox now instead of at the next poll."""
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                claimed = self.dispatch()
+            except Exception:
+                logger.exception("Email outbox dispatch failed")
+                self.close()
+                claimed = 0
+            if claimed < self.batch_size:
+                self._close_idle()
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+        self.close()
+
+    def dispatch(self) -> int:
+        """Send one batch of due emails. Returns how many were claimed."""
+        now = datetime.now(timezone.utc)
+        statement = (
+            select(EmailOutbox)
+            .where(
+                EmailOutbox.status == EMAIL_STATUS_PENDENTE,
+                col(EmailOutbox.next_attempt_at) <= now,
+            )
+            .order_by(col(EmailOutbox.next_attempt_at))
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        with Session(engine) as session:
+            emails = session.exec(statement).all()
+            for index, email in enumerate(emails):
+                try:
+                    smtp = self._connection()
+                except (smtplib.SMTPException, OSError) as exc:
+                    # Nothing can be sent until the server is back
+                    logger.warning("Could not connect to the SMTP server: %s", exc)
+                    for pending in emails[index:]:
+                        self._retry_later(pending, exc)
+                    break
+                try:
+                    smtp.send_message(self._message(email))
+                except smtplib.SMTPServerDisconnected as exc:
+                    self.close()
+                    self._retry_later(email, exc)
+                except smtplib.SMTPException as exc:
+                    # Refused by the server, the connection is still usable
+                    self._retry_later(email, exc)
+                except OSError as exc:
+                    self.close()
+                    self._retry_later(email, exc)
+                else:
+                    self._smtp_used_at = time.monotonic()
+                    email.attempts += 1
+                    email.status = EMAIL_STATUS_ENVIADO
+                    email.sent_at = datetime.now(timezone.utc)
+                    email.last_error = None
+                    email.html_content = None
+                    self.sent += 1
+            session.add_all(emails)
+            session.commit()
+        return len(emails)
+
+    def _retry_later(self, email: EmailOutbox, exc: Exception) -> None:
+        email.attempts += 1
+        email.last_error = str(exc)[:1000]
+        if email.attempts >= self.max_attempts:
+            email.status = EMAIL_STATUS_FALHOU
+            email.html_content = None
+            self.failed += 1
+            logger.error(
+                "Giving up on email %s to %s: %s", email.id, email.email_to, exc
+            )
+            return
+        delay = self.retry_base_seconds * 2 ** (email.attempts - 1)
+        email.next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+        self.retried += 1
+
+    @staticmethod
+    def _message(email: EmailOutbox) -> EmailMessage:
+        message = EmailMessage()
+        message["Subject"] = email.subject
+        message["From"] = formataddr(
+            (settings.EMAILS_FROM_NAME or "", str(settings.EMAILS_FROM_EMAIL))
+        )
+        message["To"] = email.email_to
+        message.set_content(email.html_content or "", subtype="html")
+        return message
+
+    def _connection(self) -> smtplib.SMTP:
+        if self._smtp is not None:
+            return self._smtp
+        assert settings.SMTP_HOST, "no provided configuration for email variables"
+        smtp: smtplib.SMTP
+        if settings.SMTP_SSL:
+            smtp = smtplib.SMTP_SSL(
+                settings.SMTP_HOST, settings.SMTP_PORT, timeout=self.timeout
+            )
+        else:
+            smtp = smtplib.SMTP(
+                settings.SMTP_HOST, settings.SMTP_PORT, timeout=self.timeout
+            )
+        try:
+            if settings.SMTP_TLS and not settings.SMTP_SSL:
+                smtp.starttls()
+            if settings.SMTP_USER:
+                smtp.login(settings.SMTP_USER, settings.SMTP_PASSWORD or "")
+        except BaseException:
+            smtp.close()
+            raise
+        self.connections += 1
+        self._smtp = smtp
+        self._smtp_used_at = time.monotonic()
+        return smtp
+
+    def _close_idle(self) -> None:
+        if (
+            self._smtp is not None
+            and time.monotonic() - self._smtp_used_at > self.idle_seconds
+        ):
+            self.close()
+
+    def close(self) -> None:
+        smtp, self._smtp = self._smtp, None
+        if smtp is None:
+            return
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+    def stats(self) -> dict[str, object]:
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "connected": self._smtp is not None,
+            "connections": self.connections,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+dispatcher = EmailDispatcher(
+    batch_size=settings.EMAIL_OUTBOX_BATCH_SIZE,
+    poll_seconds=settings.EMAIL_OUTBOX_POLL_SECONDS,
+    max_attempts=settings.EMAIL_OUTBOX_MAX_ATTEMPTS,
+    retry_base_seconds=settings.EMAIL_OUTBOX_RETRY_BASE_SECONDS,
+    idle_seconds=settings.SMTP_IDLE_TIMEOUT_SECONDS,
+)
+metrics.register("email_outbox", dispatcher.stats)
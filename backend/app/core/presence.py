@@ -0,0 +1,360 @@
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"PRESENC1"
+# magic, capacity, wheel size, window seconds, then the mutable fields below
+_HEADER = struct.Struct("<8sQQQ")
+_HEADER_SIZE = 64
+_USED = 32
+_TOTAL = 40
+_ADVANCED_TO = 48
+_LAST_SNAPSHOT = 56
+_INT = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+_EMPTY = bytes(16)
+
+
+class PresenceTable:
+    """
+    Last time each aparelho was seen, shared by every worker of the host.
+
+    The table is a memory-mapped file: an open-addressing hash table of
+    `capacity` slots (aparelho id -> last seen, as a unix timestamp) plus a
+    timing wheel with one bucket per second of the `window_seconds` online
+    window. Each bucket counts the aparelhos last seen in its second and the
+    header keeps the running total, so the online count is read without
+    scanning the table; buckets falling out of the window are subtracted as
+    the wheel advances. Slots never move once assigned, so each worker caches
+    the slot of an id and a lookup is a dict hit plus one array read.
+
+    Writers serialize on flock() of the file (and a thread lock within the
+    worker); readers don't lock. The table is copied to `snapshot_path` every
+    `snapshot_seconds` by whichever worker gets there first, and a new table
+    is filled from the snapshot, so a restart comes up warm.
+    """
+
+    def __init__(
+        self,
+        *,
+        path: str,
+        snapshot_path: str | None,
+        max_aparelhos: int,
+        window_seconds: int,
+        snapshot_seconds: float,
+    ) -> None:
+        self.path = path
+        self.snapshot_path = snapshot_path
+        # At most half full keeps the probe sequences short
+        self.capacity = 1 << max(1, (2 * max_aparelhos - 1).bit_length())
+        self.max_aparelhos = max_aparelhos
+        self.window_seconds = window_seconds
+        self.wheel_size = window_seconds + 1
+        self.snapshot_seconds = snapshot_seconds
+        self._slots: dict[uuid.UUID, int] = {}
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._fd: int | None = None
+        self._map: mmap.mmap | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        self.full = 0
+        self.snapshots = 0
+
+    @property
+    def size(self) -> int:
+        return _HEADER_SIZE + self.wheel_size * 16 + self.capacity * 24
+
+    def open(self) -> None:
+        with self._open_lock:
+            if self._map is not None:
+                return
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                created = not self._is_current(fd)
+                if created:
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, self.size)
+                    header = _HEADER.pack(
+                        _MAGIC, self.capacity, self.wheel_size, self.window_seconds
+                    )
+                    os.pwrite(fd, header, 0)
+                self._map_file(fd)
+                if created and self.snapshot_path:
+                    self._restore(self.snapshot_path)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _map_file(self, fd: int) -> None:
+        self._fd = fd
+        self._map = mmap.mmap(fd, self.size)
+        view = memoryview(self._map)
+        stamps_end = _HEADER_SIZE + self.wheel_size * 8
+        counts_end = stamps_end + self.wheel_size * 8
+        seen_end = counts_end + self.capacity * 8
+        self._stamps = view[_HEADER_SIZE:stamps_end].cast("q")
+        self._counts = view[stamps_end:counts_end].cast("q")
+        self._seen = view[counts_end:seen_end].cast("d")
+        self._keys = view[seen_end:]
+
+    def close(self) -> None:
+        with self._open_lock:
+            if self._map is None:
+                return
+            # The memoryviews pin the map
+            for view in (self._stamps, self._counts, self._seen, self._keys):
+                view.release()
+            self._map.close()
+            assert self._fd is not None
+            os.close(self._fd)
+            self._map = None
+            self._fd = None
+            self._slots.clear()
+
+    def _is_current(self, fd: int) -> bool:
+        if os.fstat(fd).st_size != self.size:
+            return False
+        return _HEADER.unpack(os.pread(fd, _HEADER.size, 0)) == (
+            _MAGIC,
+            self.capacity,
+            self.wheel_size,
+            self.window_seconds,
+        )
+
+    def _restore(self, snapshot_path: str) -> None:
+        """Fill a new table from a snapshot, which may have another layout."""
+        try:
+            with open(snapshot_path, "rb") as snapshot:
+                data = snapshot.read()
+        except FileNotFoundError:
+            return
+        magic, capacity, wheel_size, _ = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            logger.warning("Ignoring presence snapshot %s", snapshot_path)
+            return
+        seen_start = _HEADER_SIZE + wheel_size * 16
+        keys_start = seen_start + capacity * 8
+        entries = [
+            (uuid.UUID(bytes=key), _FLOAT.unpack_from(data, seen_start + i * 8)[0])
+            for i in range(capacity)
+            if (key := data[keys_start + i * 16 : keys_start + i * 16 + 16]) != _EMPTY
+        ]
+        # Replayed, so slots and wheel follow this table's layout and clock
+        self._touch_many(entries, time.time())
+        logger.info("Restored %d aparelhos from the presence snapshot", len(entries))
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        assert self._fd is not None
+        # flock() doesn't exclude the threads sharing our descriptor
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _get(self, offset: int, field: struct.Struct = _INT) -> Any:
+        assert self._map is not None
+        return field.unpack_from(self._map, offset)[0]
+
+    def _set(self, offset: int, value: float, field: struct.Struct = _INT) -> None:
+        assert self._map is not None
+        field.pack_into(self._map, offset, value)
+
+    def _find(self, aparelho_id: uuid.UUID, *, insert: bool) -> int | None:
+        slot = self._slots.get(aparelho_id)
+        if slot is not None:
+            return slot
+        key = aparelho_id.bytes
+        mask = self.capacity - 1
+        slot = aparelho_id.int & mask
+        while True:
+            stored = self._keys[slot * 16 : slot * 16 + 16]
+            if stored == key:
+                self._slots[aparelho_id] = slot
+                return slot
+            if stored == _EMPTY:
+                break
+            slot = (slot + 1) & mask
+        if not insert:
+            return None
+        used = self._get(_USED)
+        if used >= self.max_aparelhos:
+            self.full += 1
+            return None
+        self._keys[slot * 16 : slot * 16 + 16] = key
+        self._set(_USED, used + 1)
+        self._slots[aparelho_id] = slot
+        return slot
+
+    def _advance(self, now: int) -> None:
+        """Drop the buckets that left the window since the last advance."""
+        advanced_to = self._get(_ADVANCED_TO)
+        if now <= advanced_to:
+            return
+        total = self._get(_TOTAL)
+        last = now - self.window_seconds
+        # One turn of the wheel at most, however long nobody looked
+        first = max(advanced_to - self.window_seconds + 1, last - self.wheel_size + 1)
+        for second in range(first, last + 1):
+            bucket = second % self.wheel_size
+            # Newer stamps in the bucket are still inside the window
+            if self._stamps[bucket] <= second:
+                total -= self._counts[bucket]
+                self._counts[bucket] = 0
+        self._set(_TOTAL, total)
+        self._set(_ADVANCED_TO, now)
+
+    def _touch_many(
+        self, entries: Iterable[tuple[uuid.UUID, float]], now: float
+    ) -> None:
+        second = int(now)
+        self._advance(second)
+        oldest = second - self.window_seconds
+        total = self._get(_TOTAL)
+        for aparelho_id, seen_at in entries:
+            slot = self._find(aparelho_id, insert=True)
+            if slot is None:
+                continue
+            # A clock slightly ahead of ours counts as now
+            seen_at = min(seen_at, now)
+            previous = self._seen[slot]
+            if seen_at <= previous:
+                continue
+            previous_second = int(previous)
+            bucket = previous_second % self.wheel_size
+            if (
+                previous
+                and previous_second > oldest
+                and self._stamps[bucket] == previous_second
+            ):
+                self._counts[bucket] -= 1
+                total -= 1
+            seen_second = int(seen_at)
+            if seen_second > oldest:
+                bucket = seen_second % self.wheel_size
+                if self._stamps[bucket] != seen_second:
+                    self._stamps[bucket] = seen_second
+                    self._counts[bucket] = 0
+                self._counts[bucket] += 1
+                total += 1
+            self._seen[slot] = seen_at
+        self._set(_TOTAL, total)
+
+    def touch_many(
+        self, entries: Iterable[tuple[uuid.UUID, float]], now: float | None = None
+    ) -> None:
+        """Record (aparelho_id, seen_at) pairs; older than stored is ignored."""
+        if self._map is None:
+            self.open()
+        with self._locked():
+            self._touch_many(entries, time.time() if now is None else now)
+
+    def touch(self, aparelho_id: uuid.UUID, seen_at: float | None = None) -> None:
+        now = time.time()
+        self.touch_many([(aparelho_id, now if seen_at is None else seen_at)], now)
+
+    def last_seen(self, aparelho_id: uuid.UUID) -> float | None:
+        if self._map is None:
+            self.open()
+        slot = self._find(aparelho_id, insert=False)
+        if slot is None:
+            return None
+        return self._seen[slot] or None
+
+    def is_online(self, aparelho_id: uuid.UUID, now: float | None = None) -> bool:
+        seen_at = self.last_seen(aparelho_id)
+        now = time.time() if now is None else now
+        return seen_at is not None and seen_at > now - self.window_seconds
+
+    def count(self, now: float | None = None) -> int:
+        """Aparelhos seen within the window, to the second."""
+        if self._map is None:
+            self.open()
+        second = int(time.time() if now is None else now)
+        if self._get(_ADVANCED_TO) < second:
+            with self._locked():
+                self._advance(second)
+        return int(self._get(_TOTAL))
+
+    def snapshot(self) -> None:
+        if not self.snapshot_path:
+            return
+        if self._map is None:
+            self.open()
+        assert self._map is not None
+        temporary = f"{self.snapshot_path}.tmp"
+        os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+        with self._locked():
+            with open(temporary, "wb") as snapshot:
+                snapshot.write(self._map)
+            self._set(_LAST_SNAPSHOT, time.time(), _FLOAT)
+        os.replace(temporary, self.snapshot_path)
+        self.snapshots += 1
+
+    def start(self) -> None:
+        if self._map is None:
+            self.open()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="presence", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
+        try:
+            self.snapshot()
+        except Exception:
+            logger.exception("Presence snapshot failed")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.snapshot_seconds):
+            # Any worker may take it, once per interval
+            if time.time() - self._get(_LAST_SNAPSHOT, _FLOAT) < self.snapshot_seconds:
+                continue
+            try:
+                self.snapshot()
+            except Exception:
+                logger.exception("Presence snapshot failed")
+
+    def stats(self) -> dict[str, object]:
+        if self._map is None:
+            return {"open": False}
+        return {
+            "open": True,
+            "capacity": self.max_aparelhos,
+            "used": self._get(_USED),
+            "online": self.count(),
+            "full": self.full,
+            "snapshots": self.snapshots,
+        }
+
+
+table = PresenceTable(
+    path=settings.PRESENCE_PATH,
+    snapshot_path=settings.PRESENCE_SNAPSHOT_PATH,
+    max_aparelhos=settings.PRESENCE_MAX_APARELHOS,
+    window_seconds=settings.APARELHO_OFFLINE_AFTER_SECONDS,
+    snapshot_seconds=settings.PRESENCE_SNAPSHOT_SECONDS,
+)
+metrics.register("presence", table.stats)
@@ -0,0 +1,217 @@
+import heapq
+import logging
+import math
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from sqlmodel import Session
+
+from app import crud
+from app.core import events, metrics
+from app.core.cache import entity_cache
+from app.core.config import settings
+from app.core.db import engine
+from app.core.leader import LeaderJob, Leadership, leader
+
+logger = logging.getLogger(__name__)
+
+# Event table of newly scheduled comandos, keyed by their due time
+SCHEDULED = "agendamento"
+
+
+def publish_scheduled(session: Session, comando_id: uuid.UUID, due: datetime) -> None:
+    """Tell the scheduler, on whichever worker leads, about a new due time."""
+    events.publish(
+        session, SCHEDULED, events.CREATED, comando_id, key=str(due.timestamp())
+    )
+
+
+class ComandoScheduler(LeaderJob):
+    """
+    Queues the agendado comandos when they come due.
+
+    The leader keeps a heap of the distinct seconds at which comandos come due
+    within the next `horizon_seconds`, loaded from ix_comando_agendado, and
+    sleeps until the earliest. Comandos due in the same second (a whole setor
+    irrigated at 06:00) share one entry, so memory follows the number of due
+    seconds in the horizon, never more than `horizon_seconds`, not the number of
+    scheduled comandos. When a second comes due, one UPDATE per `batch_size`
+    comandos queues everything due by then and wakes their controladores.
+
+    Comandos scheduled on any worker reach the heap through SCHEDULED events.
+    The heap is reloaded when its horizon runs out, after an election and when
+    the event bus reconnects, since events may have been lost. Stale entries
+    are harmless: their UPDATE finds nothing to queue.
+    """
+
+    name = "comando-scheduler"
+
+    def __init__(
+        self,
+        *,
+        leadership: Leadership,
+        interval_seconds: float,
+        horizon_seconds: float,
+        batch_size: int,
+    ) -> None:
+        super().__init__(leadership=leadership, interval_seconds=interval_seconds)
+        self.horizon_seconds = horizon_seconds
+        self.batch_size = batch_size
+        self._heap: list[int] = []
+        self._seconds: set[int] = set()
+        self._heap_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        # Unix time the heap is complete until, 0 to reload on the next run
+        self._loaded_until = 0.0
+        self._loaded_term = 0
+        # Seconds scheduled while a load runs, it may have queried before them
+        self._loading = False
+        self._pending: list[int] = []
+
+        self.reloads = 0
+
+    def schedule(self, due: float) -> None:
+        """Add a due time, from any thread. Ignored unless this worker leads."""
+        if not self.leadership.is_leader:
+            return
+        second = math.ceil(due)
+        with self._heap_lock:
+            if self._loading:
+                self._pending.append(second)
+                return
+            # Beyond the horizon it is loaded with the next one
+            if second >= self._loaded_until or second in self._seconds:
+                return
+            heapq.heappush(self._heap, second)
+            self._seconds.add(second)
+            earliest = self._heap[0] == second
+        if earliest:
+            self._wakeup.set()
+
+    def reload(self) -> None:
+        """Reload the heap from the database on the next run."""
+        with self._heap_lock:
+            self._loaded_until = 0.0
+        self._wakeup.set()
+
+    def _load(self, now: float) -> None:
+        until = now + self.horizon_seconds
+        with self._heap_lock:
+            self._loading = True
+        try:
+            with Session(engine) as session:
+                seconds = crud.get_scheduled_seconds(
+                    session=session, until=datetime.fromtimestamp(until, timezone.utc)
+                )
+        except BaseException:
+            # The next run loads again, and sees what was buffered
+            with self._heap_lock:
+                self._loading = False
+                self._pending.clear()
+            raise
+        with self._heap_lock:
+            # Merged rather than replaced, to keep what schedule() added before,
+            # with what it buffered while the query ran
+            for second in [*seconds, *self._pending]:
+                if second < until and second not in self._seconds:
+                    self._heap.append(second)
+                    self._seconds.add(second)
+            heapq.heapify(self._heap)
+            self._pending.clear()
+            self._loading = False
+            self._loaded_until = until
+            self._loaded_term = self.leadership.elected
+        self.reloads += 1
+
+    def _pop_due(self, now: float) -> bool:
+        due = False
+        with self._heap_lock:
+            while self._heap and self._heap[0] <= now:
+                self._seconds.discard(heapq.heappop(self._heap))
+                due = True
+        return due
+
+    def _wait(self) -> bool:
+        now = time.time()
+        timeout = self.interval_seconds
+        with self._heap_lock:
+            if self._heap:
+                timeout = min(timeout, self._heap[0] - now)
+            if self._loaded_until:
+                timeout = min(timeout, self._loaded_until - now)
+        self._wakeup.wait(max(timeout, 0.0))
+        self._wakeup.clear()
+        return self._stop.is_set()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        super().stop()
+
+    def run_once(self) -> int:
+        """Queue the comandos due so far. Returns how many were queued."""
+        now = time.time()
+        if now >= self._loaded_until or self._loaded_term != self.leadership.elected:
+            self._load(now)
+        if not self._pop_due(now):
+            return 0
+        queued = 0
+        with Session(engine) as session:
+            while True:
+                batch = crud.queue_due_comandos(
+                    session=session,
+                    now=datetime.fromtimestamp(now, timezone.utc),
+                    limit=self.batch_size,
+                )
+                # Wakes the long polls of their controladores on every worker,
+                # and drops the agendado copies they cached
+                events.publish_many(session, "comando", events.CREATED, batch)
+                events.publish_many(
+                    session,
+                    "comando",
+                    events.UPDATED,
+                    [(comando_id, None) for comando_id, _ in batch],
+                )
+                session.commit()
+                entity_cache.invalidate_many(
+                    "comando", [comando_id for comando_id, _ in batch]
+                )
+                queued += len(batch)
+                if len(batch) < self.batch_size:
+                    break
+        if queued:
+            logger.info("Queued %d scheduled comandos", queued)
+        return queued
+
+    def stats(self) -> dict[str, object]:
+        with self._heap_lock:
+            next_due = self._heap[0] if self._heap else None
+            heap_size = len(self._heap)
+        return {
+            **super().stats(),
+            "heap_size": heap_size,
+            "next_due_in_seconds": (
+                next_due - time.time() if next_due is not None else None
+            ),
+            "reloads": self.reloads,
+        }
+
+
+scheduler = ComandoScheduler(
+    leadership=leader,
+    interval_seconds=settings.LEADER_CHECK_SECONDS,
+    horizon_seconds=settings.COMANDO_SCHEDULER_HORIZON_SECONDS,
+    batch_size=settings.COMANDO_SCHEDULER_BATCH_SIZE,
+)
+metrics.register("comando_scheduler", scheduler.stats)
+
+
+def _schedule(event: events.Event) -> None:
+    if event.op == events.CREATED and event.key is not None:
+        scheduler.schedule(float(event.key))
+
+
+events.bus.subscribe(SCHEDULED, _schedule)
+events.bus.on_reconnect(scheduler.reload)
@@ -0,0 +1,226 @@
+import hashlib
+import hmac
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from sqlmodel import Session, col, select
+
+from app.core import metrics
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.db import engine
+from app.models import Controlador
+
+# Request headers of a signed controlador request
+CONTROLADOR_HEADER = "X-Controlador-Id"
+TIMESTAMP_HEADER = "X-Timestamp"
+NONCE_HEADER = "X-Nonce"
+SIGNATURE_HEADER = "X-Signature"
+
+
+class SignatureError(Exception):
+    pass
+
+
+def sign(
+    key: str,
+    *,
+    controlador_id: str,
+    timestamp: str,
+    nonce: str,
+    method: str,
+    path: str,
+    query: str = "",
+    body: bytes = b"",
+) -> str:
+    """
+    HMAC-SHA256, hex encoded, of a controlador request.
+
+    The message is the controlador id, the unix timestamp (seconds), a nonce
+    unique to the request, the HTTP method, the path and the query string as
+    sent (without the "?", empty if none), each followed by a newline, then the
+    raw body.
+    """
+    message = "".join(
+        f"{part}\n"
+        for part in (controlador_id, timestamp, nonce, method.upper(), path, query)
+    ).encode()
+    return hmac.new(key.encode(), message + body, hashlib.sha256).hexdigest()
+
+
+@dataclass(frozen=True)
+class ControladorKeys:
+    current: str
+    previous: str | None = None
+    # Unix time of the rotation that replaced `previous`
+    rotated_at: float = 0.0
+
+    @classmethod
+    def from_row(
+        cls,
+        assinatura: str,
+        assinatura_anterior: str | None,
+        assinatura_rotacionada_em: datetime | None,
+    ) -> "ControladorKeys":
+        if assinatura_anterior is None or assinatura_rotacionada_em is None:
+            return cls(current=assinatura)
+        if assinatura_rotacionada_em.tzinfo is None:
+            # Stored without time zone, always in UTC
+            assinatura_rotacionada_em = assinatura_rotacionada_em.replace(
+                tzinfo=timezone.utc
+            )
+        return cls(
+            current=assinatura,
+            previous=assinatura_anterior,
+            rotated_at=assinatura_rotacionada_em.timestamp(),
+        )
+
+    def accepted(self, now: float) -> list[str]:
+        grace_until = self.rotated_at + settings.CONTROLADOR_KEY_ROTATION_GRACE_SECONDS
+        if self.previous is not None and now <= grace_until:
+            return [self.current, self.previous]
+        return [self.current]
+
+
+class KeyCache:
+    """
+    Signing keys of every controlador, held in memory.
+
+    Warmed from the controlador table at startup and kept current by the event
+    bus, so verifying a request needs no query. A controlador missing from it
+    (created moments ago, not announced yet) is loaded on demand, and an id
+    not found in the table is remembered as unknown for a while.
+    """
+
+    def __init__(self) -> None:
+        self._keys: dict[uuid.UUID, ControladorKeys] = {}
+        self._lock = threading.Lock()
+        self._unknown = LRUCache(
+            maxsize=settings.CONTROLADOR_UNKNOWN_CACHE_MAX_SIZE,
+            ttl=settings.CONTROLADOR_UNKNOWN_CACHE_TTL_SECONDS,
+        )
+        self.loads = 0
+        self.warmed_at: float | None = None
+
+    def warm(self) -> None:
+        statement = select(
+            Controlador.id,
+            Controlador.assinatura,
+            Controlador.assinatura_anterior,
+            Controlador.assinatura_rotacionada_em,
+        )
+        with Session(engine) as session:
+            keys = {
+                row[0]: ControladorKeys.from_row(*row[1:])
+                for row in session.exec(statement).all()
+            }
+        with self._lock:
+            self._keys = keys
+        self.warmed_at = time.time()
+
+    def get(self, controlador_id: uuid.UUID) -> ControladorKeys | None:
+        return self._keys.get(controlador_id)
+
+    def unknown(self, controlador_id: uuid.UUID) -> bool:
+        """Whether a recent load found no controlador with this id."""
+        return self._unknown.get(str(controlador_id)) is not None
+
+    def load(self, controlador_id: uuid.UUID) -> ControladorKeys | None:
+        self.loads += 1
+        statement = select(
+            Controlador.assinatura,
+            Controlador.assinatura_anterior,
+            Controlador.assinatura_rotacionada_em,
+        ).where(col(Controlador.id) == controlador_id)
+        with Session(engine) as session:
+            row = session.exec(statement).first()
+        if row is None:
+            self.drop(controlador_id)
+            self._unknown.set(str(controlador_id), True)
+            return None
+        keys = ControladorKeys.from_row(*row)
+        with self._lock:
+            self._keys[controlador_id] = keys
+        self._unknown.delete(str(controlador_id))
+        return keys
+
+    def put(self, controlador: Controlador) -> None:
+        keys = ControladorKeys.from_row(
+            controlador.assinatura,
+            controlador.assinatura_anterior,
+            controlador.assinatura_rotacionada_em,
+        )
+        with self._lock:
+            self._keys[controlador.id] = keys
+        self._unknown.delete(str(controlador.id))
+
+    def drop(self, controlador_id: uuid.UUID) -> None:
+        with self._lock:
+            self._keys.pop(controlador_id, None)
+
+    def stats(self) -> dict[str, object]:
+        return {
+            "size": len(self._keys),
+            "loads": self.loads,
+            "unknown": self._unknown.stats(),
+            "warmed_at": self.warmed_at,
+        }
+
+
+key_cache = KeyCache()
+# Signatures seen within the replay window, the nonce makes each one unique. Per
+# worker: a replay sent to another worker is only bounded by the window
+seen_signatures = LRUCache(
+    maxsize=100_000, ttl=settings.CONTROLADOR_SIGNATURE_MAX_AGE_SECONDS * 2
+)
+metrics.register("controlador_keys", key_cache.stats)
+
+
+def verify(
+    keys: ControladorKeys | None,
+    *,
+    controlador_id: str,
+    timestamp: str | None,
+    nonce: str | None,
+    signature: str | None,
+    method: str,
+    path: str,
+    query: str,
+    body: bytes,
+) -> None:
+    """Raise SignatureError unless the request is signed by the controlador."""
+    if keys is None:
+        raise SignatureError("Unknown controlador")
+    if not timestamp or not nonce or not signature:
+        raise SignatureError("Missing signature")
+    if len(nonce) > 64:
+        raise SignatureError("Invalid nonce")
+    try:
+        signed_at = int(timestamp)
+    except ValueError:
+        raise SignatureError("Invalid timestamp")
+    now = time.time()
+    if abs(now - signed_at) > settings.CONTROLADOR_SIGNATURE_MAX_AGE_SECONDS:
+        raise SignatureError("Signature expired")
+
+    for key in keys.accepted(now):
+        expected = sign(
+            key,
+            controlador_id=controlador_id,
+            timestamp=timestamp,
+            nonce=nonce,
+            method=method,
+            path=path,
+            query=query,
+            body=body,
+        )
+        if hmac.compare_digest(expected, signature.lower()):
+            break
+    else:
+        raise SignatureError("Invalid signature")
+
+    if not seen_signatures.add(signature.lower(), True):
+        raise SignatureError("Signature already used")
@@ -0,0 +1,201 @@
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlmodel import Session
+
+from app import crud
+from app.core import events, metrics
+from app.core.cache import entity_cache
+from app.core.config import settings
+from app.core.db import engine
+from app.core.leader import LeaderJob, Leadership, leader
+
+logger = logging.getLogger(__name__)
+
+
+class OfflineSweeper(LeaderJob):
+    """
+    Sets aparelhos offline once they stop sending heartbeats.
+
+    Every `interval_seconds` the leader flips the online aparelhos silent for
+    `offline_after` seconds with a single UPDATE of at most `batch_size` rows,
+    found through the partial index of online aparelhos, so a sweep costs the
+    same with 1k or 100k aparelhos. A backlog larger than a batch is worked
+    through in the following sweeps.
+    """
+
+    name = "offline-sweeper"
+
+    def __init__(
+        self,
+        *,
+        leadership: Leadership,
+        interval_seconds: float,
+        offline_after: float,
+        batch_size: int,
+    ) -> None:
+        super().__init__(leadership=leadership, interval_seconds=interval_seconds)
+        self.offline_after = offline_after
+        self.batch_size = batch_size
+
+    def run_once(self) -> int:
+        """Run one sweep. Returns how many aparelhos went offline."""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.offline_after)
+        with Session(engine) as session:
+            offline = crud.mark_aparelhos_offline(
+                session=session, cutoff=cutoff, limit=self.batch_size
+            )
+            # Other workers drop the cached aparelhos when this commits
+            events.publish_many(
+                session,
+                "aparelho",
+                events.UPDATED,
+                [(aparelho_id, None) for aparelho_id in offline],
+            )
+            session.commit()
+        entity_cache.invalidate_many("aparelho", offline)
+        if offline:
+            logger.info("Offline sweep: %d aparelhos went offline", len(offline))
+        return len(offline)
+
+
+class ComandoExpirySweeper(LeaderJob):
+    """
+    Sets the comandos still waiting at their expira_em expirado, so they are
+    never executed late and leave the pendente indexes the polls scan.
+
+    Every `interval_seconds` the leader expires them with UPDATEs of at most
+    `batch_size` rows found through ix_comando_expira, which only holds waiting
+    comandos that can expire, as many as it takes to catch up.
+    """
+
+    name = "comando-expiry-sweeper"
+
+    def __init__(
+        self, *, leadership: Leadership, interval_seconds: float, batch_size: int
+    ) -> None:
+        super().__init__(leadership=leadership, interval_seconds=interval_seconds)
+        self.batch_size = batch_size
+
+    def run_once(self) -> int:
+        """Expire the comandos past expira_em. Returns how many were expired."""
+        now = datetime.now(timezone.utc)
+        expired = 0
+        with Session(engine) as session:
+            while True:
+                batch = crud.expire_comandos(
+                    session=session, now=now, limit=self.batch_size
+                )
+                # Other workers drop the cached comandos when this commits
+                events.publish_many(
+                    session,
+                    "comando",
+                    events.UPDATED,
+                    [(comando_id, None) for comando_id in batch],
+                )
+                session.commit()
+                entity_cache.invalidate_many("comando", batch)
+                expired += len(batch)
+                if len(batch) < self.batch_size:
+                    break
+        if expired:
+            logger.info("Expired %d comandos", expired)
+        return expired
+
+
+class IdempotencyKeyPurger(LeaderJob):
+    """
+    Deletes expired idempotency keys, at most `batch_size` per DELETE and as
+    many DELETEs as it takes, each committed on its own so the table is never
+    locked for long.
+    """
+
+    name = "idempotency-key-purger"
+
+    def __init__(
+        self, *, leadership: Leadership, interval_seconds: float, batch_size: int
+    ) -> None:
+        super().__init__(leadership=leadership, interval_seconds=interval_seconds)
+        self.batch_size = batch_size
+
+    def run_once(self) -> int:
+        """Purge the keys expired so far. Returns how many were deleted."""
+        now = datetime.now(timezone.utc)
+        purged = 0
+        with Session(engine) as session:
+            while True:
+                deleted = crud.delete_expired_idempotency_keys(
+                    session=session, now=now, limit=self.batch_size
+                )
+                session.commit()
+                purged += deleted
+                if deleted < self.batch_size:
+                    break
+        return purged
+
+
+class EmailOutboxPurger(LeaderJob):
+    """
+    Deletes the emails sent more than `retention_seconds` ago, at most
+    `batch_size` per DELETE, each committed on its own.
+    """
+
+    name = "email-outbox-purger"
+
+    def __init__(
+        self,
+        *,
+        leadership: Leadership,
+        interval_seconds: float,
+        retention_seconds: float,
+        batch_size: int,
+    ) -> None:
+        super().__init__(leadership=leadership, interval_seconds=interval_seconds)
+        self.retention_seconds = retention_seconds
+        self.batch_size = batch_size
+
+    def run_once(self) -> int:
+        """Purge the emails past the retention. Returns how many were deleted."""
+        before = datetime.now(timezone.utc) - timedelta(seconds=self.retention_seconds)
+        purged = 0
+        with Session(engine) as session:
+            while True:
+                deleted = crud.delete_sent_emails(
+                    session=session, before=before, limit=self.batch_size
+                )
+                session.commit()
+                purged += deleted
+                if deleted < self.batch_size:
+                    break
+        return purged
+
+
+offline_sweeper = OfflineSweeper(
+    leadership=leader,
+    interval_seconds=settings.APARELHO_SWEEP_SECONDS,
+    offline_after=settings.APARELHO_OFFLINE_AFTER_SECONDS,
+    batch_size=settings.APARELHO_SWEEP_BATCH_SIZE,
+)
+metrics.register("offline_sweeper", offline_sweeper.stats)
+
+comando_expiry_sweeper = ComandoExpirySweeper(
+    leadership=leader,
+    interval_seconds=settings.COMANDO_EXPIRY_SWEEP_SECONDS,
+    batch_size=settings.COMANDO_EXPIRY_BATCH_SIZE,
+)
+metrics.register("comando_expiry_sweeper", comando_expiry_sweeper.stats)
+
+idempotency_key_purger = IdempotencyKeyPurger(
+    leadership=leader,
+    interval_seconds=settings.IDEMPOTENCY_PURGE_SECONDS,
+    batch_size=settings.IDEMPOTENCY_PURGE_BATCH_SIZE,
+)
+metrics.register("idempotency_key_purger", idempotency_key_purger.stats)
+
+email_outbox_purger = EmailOutboxPurger(
+    leadership=leader,
+    interval_seconds=settings.EMAIL_OUTBOX_PURGE_SECONDS,
+    retention_seconds=settings.EMAIL_OUTBOX_RETENTION_SECONDS,
+    batch_size=settings.EMAIL_OUTBOX_PURGE_BATCH_SIZE,
+)
+metrics.register("email_outbox_purger", email_outbox_purger.stats)
@@ -1,10 +1,53 @@
 import uuid
+from datetime import datetime, timedelta, timezone
 from typing import Any
 
-from sqlmodel import Session, select
+from sqlalchemy import (
+    Boolean,
+    ColumnElement,
+    DateTime,
+    String,
+    Uuid,
+    and_,
+    cast,
+    column,
+    delete,
+    literal,
+    literal_column,
+    or_,
+    text,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import Insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, col, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
 
+from app.core.config import settings
 from app.core.security import get_password_hash, verify_password
-from app.models import User, UserCreate, UserUpdate
+from app.models import (
+    APARELHO_STATUS_OFFLINE,
+    APARELHO_STATUS_ONLINE,
+    COMANDO_COALESCENCIA_WHERE,
+    COMANDO_EXPIRAVEL_WHERE,
+    COMANDO_STATUS_AGENDADO,
+    COMANDO_STATUS_EXPIRADO,
+    COMANDO_STATUS_PENDENTE,
+    COMANDO_STATUS_RESERVADO,
+    EMAIL_STATUS_ENVIADO,
+    Aparelho,
+    Comando,
+    ComandoAck,
+    ComandoCreate,
+    Controlador,
+    EmailOutbox,
+    IdempotencyKey,
+    User,
+    UserCreate,
+    UserUpdate,
+)
 
 
 def create_user(*, session: Session, user_create: UserCreate) -> User:
@@ -44,3 +87,521 @@ def authenticate(*, session: Session, email: str, password: str) -> User | None:
     if not verify_password(password, db_user.hashed_password):
         return None
     return db_user
+
+
+def _not_expired(now: Any) -> ColumnElement[bool]:
+    """
+    Filter out the comandos past expira_em the expiry sweeper hasn't reached
+    yet; the ones it has are out of the pendente partial indexes already.
+    """
+    return or_(col(Comando.expira_em).is_(None), col(Comando.expira_em) > now)
+
+
+def pending_comandos_statement(
+    *, controlador_id: uuid.UUID, skip: int = 0, limit: int = 100
+) -> SelectOfScalar[Comando]:
+    # Matches ix_comando_pendente: equality on controlador_id, ordered by creation
+    return (
+        select(Comando)
+        .where(
+            Comando.controlador_id == controlador_id,
+            Comando.status == COMANDO_STATUS_PENDENTE,
+            _not_expired(func.now()),
+        )
+        .order_by(col(Comando.timestamp_criado))
+        .offset(skip)
+        .limit(limit)
+    )
+
+
+def count_pending_comandos_statement(
+    *, controlador_id: uuid.UUID
+) -> SelectOfScalar[int]:
+    return (
+        select(func.count())
+        .select_from(Comando)
+        .where(
+            Comando.controlador_id == controlador_id,
+            Comando.status == COMANDO_STATUS_PENDENTE,
+            _not_expired(func.now()),
+        )
+    )
+
+
+def get_pending_comandos(
+    *, session: Session, controlador_id: uuid.UUID, limit: int = 100
+) -> list[Comando]:
+    statement = pending_comandos_statement(controlador_id=controlador_id, limit=limit)
+    return list(session.exec(statement).all())
+
+
+async def get_pending_comandos_async(
+    *, session: AsyncSession, controlador_id: uuid.UUID, limit: int = 100
+) -> list[Comando]:
+    statement = pending_comandos_statement(controlador_id=controlador_id, limit=limit)
+    return list((await session.exec(statement)).all())
+
+
+# Separates comando and param in exact-duplicate keys; neither can contain it
+_KEY_SEPARATOR = "\x1f"
+
+# xmax of a row returned by INSERT ... ON CONFLICT is 0 when the row was
+# inserted, and the id of the upserting transaction when it already existed
+_INSERTED = literal_column("xmax = 0", Boolean).label("inserted")
+
+
+def coalescing_key(comando: str, param: str) -> str | None:
+    """
+    Key of a comando in its controlador's pending queue, None to always queue.
+
+    COMANDOS_LAST_WRITE_WINS are keyed by comando alone, so a new one takes the
+    place of the pending one; all others by comando and param, so only exact
+    duplicates collapse.
+    """
+    if comando in settings.COMANDOS_NOT_COALESCED:
+        return None
+    if comando in settings.COMANDOS_LAST_WRITE_WINS:
+        return comando
+    return f"{comando}{_KEY_SEPARATOR}{param}"
+
+
+def _coalesce(statement: Insert, comando: str) -> Insert:
+    """
+    Resolve a conflict on ix_comando_coalescencia: last-write-wins comandos take
+    the new param and go to the back of the queue, duplicates are dropped.
+    Either way the pending comando is returned, taking the expira_em of the new
+    one (DO NOTHING would return no row).
+    """
+    if comando in settings.COMANDOS_LAST_WRITE_WINS:
+        update_set = {
+            "param": statement.excluded.param,
+            "timestamp_criado": statement.excluded.timestamp_criado,
+            "expira_em": statement.excluded.expira_em,
+        }
+    else:
+        # Asked for again, so it expires as the new one would
+        update_set = {"expira_em": statement.excluded.expira_em}
+    return statement.on_conflict_do_update(
+        index_elements=["controlador_id", "chave_coalescencia"],
+        index_where=text(COMANDO_COALESCENCIA_WHERE),
+        set_=update_set,
+    )
+
+
+def scheduled_for(agendado_para: datetime | None) -> datetime | None:
+    """
+    The time a comando is scheduled for, None if it is due already. Times
+    without a timezone are taken as UTC.
+    """
+    if agendado_para is None:
+        return None
+    if agendado_para.tzinfo is None:
+        agendado_para = agendado_para.replace(tzinfo=timezone.utc)
+    if agendado_para <= datetime.now(timezone.utc):
+        return None
+    return agendado_para
+
+
+def create_comando(
+    *, session: Session, comando_in: ComandoCreate
+) -> tuple[Comando, bool]:
+    """
+    Queue a comando, coalesced with the pending ones of its controlador (see
+    coalescing_key) by an INSERT ... ON CONFLICT on ix_comando_coalescencia.
+
+    A comando with agendado_para in the future is stored agendado instead, and
+    queued by the scheduler when it comes due. Scheduled comandos are never
+    coalesced: each was planned for its own time.
+
+    Returns the comando and whether it is a new one; the caller commits.
+    """
+    comando = Comando.model_validate(comando_in)
+    due = scheduled_for(comando.agendado_para)
+    if due is not None:
+        comando.agendado_para = due
+        comando.status = COMANDO_STATUS_AGENDADO
+        session.add(comando)
+        session.flush()
+        return comando, True
+    comando.chave_coalescencia = coalescing_key(comando.comando, comando.param)
+    if comando.chave_coalescencia is None:
+        session.add(comando)
+        session.flush()
+        return comando, True
+    statement = _coalesce(
+        pg_insert(Comando).values(**comando.model_dump()), comando.comando
+    )
+    queued, inserted = session.execute(
+        statement.returning(Comando, _INSERTED),
+        execution_options={"populate_existing": True},
+    ).one()
+    return queued, inserted
+
+
+def broadcast_comando(
+    *,
+    session: Session,
+    comando: str,
+    param: str,
+    setor_id: uuid.UUID | None = None,
+    agricultor_id: uuid.UUID | None = None,
+    agendado_para: datetime | None = None,
+    expira_em: datetime | None = None,
+) -> list[tuple[Comando, bool]]:
+    """
+    Create the same pending comando for every controlador whose aparelho is in
+    the setor, or belongs to the agricultor, with one INSERT ... SELECT,
+    coalesced like create_comando, or scheduled like it.
+
+    Returns (comando, inserted) for every controlador; the caller commits.
+    """
+    due = scheduled_for(agendado_para)
+    if due is not None:
+        status, key = COMANDO_STATUS_AGENDADO, None
+    else:
+        status, key = COMANDO_STATUS_PENDENTE, coalescing_key(comando, param)
+    controladores = (
+        select(col(Controlador.id))
+        .add_columns(
+            func.gen_random_uuid(),
+            literal(datetime.now(timezone.utc), DateTime),
+            literal(comando, String),
+            literal(param, String),
+            literal(status, String),
+            literal(key, String),
+            literal(due or agendado_para, DateTime(timezone=True)),
+            literal(expira_em, DateTime(timezone=True)),
+        )
+        .join(Aparelho, col(Aparelho.id) == col(Controlador.aparelho_id))
+    )
+    if setor_id is not None:
+        controladores = controladores.where(col(Aparelho.setor_id) == setor_id)
+    if agricultor_id is not None:
+        controladores = controladores.where(
+            col(Aparelho.agricultor_id) == agricultor_id
+        )
+    statement = pg_insert(Comando).from_select(
+        [
+            "controlador_id",
+            "id",
+            "timestamp_criado",
+            "comando",
+            "param",
+            "status",
+            "chave_coalescencia",
+            "agendado_para",
+            "expira_em",
+        ],
+        controladores,
+    )
+    if key is not None:
+        statement = _coalesce(statement, comando)
+    rows = session.execute(
+        statement.returning(Comando, _INSERTED),
+        execution_options={"populate_existing": True},
+    )
+    return [(queued, inserted) for queued, inserted in rows]
+
+
+def get_scheduled_seconds(*, session: Session, until: datetime) -> list[int]:
+    """
+    The distinct due times, as unix seconds rounded up, of the agendado
+    comandos due before `until`, overdue ones included.
+    """
+    # Range scan on ix_comando_agendado
+    seconds = func.ceil(func.extract("epoch", col(Comando.agendado_para)))
+    statement = (
+        select(seconds)
+        .where(
+            Comando.status == COMANDO_STATUS_AGENDADO,
+            col(Comando.agendado_para) < until,
+        )
+        .distinct()
+    )
+    return [int(second) for second in session.execute(statement).scalars()]
+
+
+def queue_due_comandos(
+    *, session: Session, now: datetime, limit: int
+) -> list[tuple[uuid.UUID, uuid.UUID]]:
+    """
+    Set at most `limit` agendado comandos due by `now` pendente, the earliest
+    first, with one UPDATE.
+
+    Returns (id, controlador_id) of the queued comandos; the caller commits.
+    """
+    due = (
+        select(Comando.id)
+        .where(
+            Comando.status == COMANDO_STATUS_AGENDADO,
+            col(Comando.agendado_para) <= now,
+            # Left to the expiry sweeper
+            _not_expired(now),
+        )
+        .order_by(col(Comando.agendado_para))
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    statement = (
+        update(Comando)
+        .where(col(Comando.id).in_(due.scalar_subquery()))
+        .values(status=COMANDO_STATUS_PENDENTE)
+        .returning(col(Comando.id), col(Comando.controlador_id))
+        .execution_options(synchronize_session=False)
+    )
+    return [(id, controlador_id) for id, controlador_id in session.execute(statement)]
+
+
+def expire_comandos(*, session: Session, now: datetime, limit: int) -> list[uuid.UUID]:
+    """
+    Set at most `limit` pendente or agendado comandos past their expira_em to
+    expirado, the longest expired first, with one UPDATE through
+    ix_comando_expira. Reservado comandos are included once their lease has
+    lapsed as well, since no claim can pick them up again. Rows locked by a
+    claim or an ack are left for the next run.
+
+    Returns the ids of the expired comandos; the caller commits.
+    """
+    expired = (
+        select(Comando.id)
+        .where(
+            text(COMANDO_EXPIRAVEL_WHERE),
+            col(Comando.expira_em) <= now,
+            or_(
+                col(Comando.status) != COMANDO_STATUS_RESERVADO,
+                col(Comando.reserva_expira_em) <= now,
+            ),
+        )
+        .order_by(col(Comando.expira_em))
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    statement = (
+        update(Comando)
+        .where(col(Comando.id).in_(expired.scalar_subquery()))
+        .values(status=COMANDO_STATUS_EXPIRADO)
+        .returning(col(Comando.id))
+        .execution_options(synchronize_session=False)
+    )
+    return list(session.execute(statement).scalars().all())
+
+
+def claim_comandos(
+    *, session: Session, controlador_id: uuid.UUID, limit: int, lease_seconds: int
+) -> list[Comando]:
+    """
+    Reserve up to `limit` comandos of a controlador in a single UPDATE.
+
+    Pending comandos and reservations whose lease has expired are claimable. Rows
+    locked by a concurrent claim are skipped instead of waited on, so two pollers
+    never get the same comando and never block each other. The caller commits.
+    """
+    now = datetime.now(timezone.utc)
+    claimable = (
+        select(Comando.id)
+        .where(
+            Comando.controlador_id == controlador_id,
+            or_(
+                col(Comando.status) == COMANDO_STATUS_PENDENTE,
+                and_(
+                    col(Comando.status) == COMANDO_STATUS_RESERVADO,
+                    col(Comando.reserva_expira_em) < now,
+                ),
+            ),
+            _not_expired(now),
+        )
+        .order_by(col(Comando.timestamp_criado))
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    statement = (
+        update(Comando)
+        .where(col(Comando.id).in_(claimable.scalar_subquery()))
+        .values(
+            status=COMANDO_STATUS_RESERVADO,
+            reserva_expira_em=now + timedelta(seconds=lease_seconds),
+        )
+        .returning(Comando)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    comandos = session.execute(statement).scalars().all()
+    return sorted(comandos, key=lambda comando: comando.timestamp_criado)
+
+
+def acknowledge_comandos(
+    *,
+    session: Session,
+    acks: list[ComandoAck],
+    controlador_id: uuid.UUID | None = None,
+) -> set[uuid.UUID]:
+    """
+    Apply a batch of execution reports with one UPDATE ... FROM (VALUES ...).
+
+    A missing timestamp_executado keeps the stored one. Only comandos handed
+    out to the controlador, pendente or reservado, are updated: reports for
+    comandos already final, expired or not due yet are ignored, as are those
+    for comandos of other controladores with `controlador_id`. Returns the ids
+    that matched a comando; the caller commits.
+    """
+    # Postgres would update a row only once for repeated ids, keep the last report
+    latest = {ack.id: ack for ack in acks}
+    rows = values(
+        column("id", Uuid),
+        column("status", String),
+        column("timestamp_executado", DateTime(timezone=True)),
+        name="ack",
+    ).data([(a.id, a.status, a.timestamp_executado) for a in latest.values()])
+    statement = update(Comando).where(
+        col(Comando.id) == rows.c.id,
+        col(Comando.status).in_([COMANDO_STATUS_PENDENTE, COMANDO_STATUS_RESERVADO]),
+    )
+    if controlador_id is not None:
+        statement = statement.where(col(Comando.controlador_id) == controlador_id)
+    statement = (
+        statement.values(
+            status=rows.c.status,
+            timestamp_executado=func.coalesce(
+                cast(rows.c.timestamp_executado, DateTime),
+                Comando.timestamp_executado,
+            ),
+        )
+        .returning(col(Comando.id))
+        .execution_options(synchronize_session=False)
+    )
+    return set(session.execute(statement).scalars().all())
+
+
+def record_heartbeats(
+    *, session: Session, heartbeats: list[tuple[uuid.UUID, str, datetime]]
+) -> list[tuple[uuid.UUID, datetime]]:
+    """
+    Store the last heartbeat of many controladores with one UPDATE ... FROM (VALUES ...).
+
+    `heartbeats` are (controlador_id, status, ultima_conexao) with at most one
+    entry per controlador; each updates the aparelho of its controlador unless
+    that already has a later ultima_conexao (written by another worker).
+    Returns (id, ultima_conexao) of the updated aparelhos; the caller commits.
+    """
+    rows = values(
+        column("controlador_id", Uuid),
+        column("status", String),
+        column("ultima_conexao", DateTime(timezone=True)),
+        name="heartbeat",
+    ).data(heartbeats)
+    statement = (
+        update(Aparelho)
+        .where(
+            col(Controlador.id) == rows.c.controlador_id,
+            col(Aparelho.id) == col(Controlador.aparelho_id),
+            or_(
+                col(Aparelho.ultima_conexao).is_(None),
+                col(Aparelho.ultima_conexao) < rows.c.ultima_conexao,
+            ),
+        )
+        .values(status=rows.c.status, ultima_conexao=rows.c.ultima_conexao)
+        .returning(col(Aparelho.id), col(Aparelho.ultima_conexao))
+        .execution_options(synchronize_session=False)
+    )
+    return [(row.id, row.ultima_conexao) for row in session.execute(statement)]
+
+
+def offline_aparelhos_statement(
+    *, cutoff: datetime, skip: int = 0, limit: int = 100
+) -> SelectOfScalar[Aparelho]:
+    # Range scan on ix_aparelho_ultima_conexao, longest silent first. Aparelhos
+    # that never reported (ultima_conexao is null) are not offline, just unused
+    return (
+        select(Aparelho)
+        .where(col(Aparelho.ultima_conexao) < cutoff)
+        .order_by(col(Aparelho.ultima_conexao), col(Aparelho.id))
+        .offset(skip)
+        .limit(limit)
+    )
+
+
+def count_offline_aparelhos_statement(*, cutoff: datetime) -> SelectOfScalar[int]:
+    return (
+        select(func.count())
+        .select_from(Aparelho)
+        .where(col(Aparelho.ultima_conexao) < cutoff)
+    )
+
+
+def mark_aparelhos_offline(
+    *, session: Session, cutoff: datetime, limit: int
+) -> list[uuid.UUID]:
+    """
+    Set the online aparelhos silent since before `cutoff` to offline, with one
+    UPDATE. At most `limit` of them, the longest silent first; rows locked by a
+    concurrent heartbeat flush are left for the next sweep.
+
+    Returns the ids of the updated aparelhos; the caller commits.
+    """
+    # Range scan on ix_aparelho_online
+    silent = (
+        select(Aparelho.id)
+        .where(
+            Aparelho.status == APARELHO_STATUS_ONLINE,
+            col(Aparelho.ultima_conexao) < cutoff,
+        )
+        .order_by(col(Aparelho.ultima_conexao))
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    statement = (
+        update(Aparelho)
+        .where(col(Aparelho.id).in_(silent.scalar_subquery()))
+        .values(status=APARELHO_STATUS_OFFLINE)
+        .returning(col(Aparelho.id))
+        .execution_options(synchronize_session=False)
+    )
+    return list(session.execute(statement).scalars().all())
+
+
+def delete_expired_idempotency_keys(
+    *, session: Session, now: datetime, limit: int
+) -> int:
+    """
+    Delete at most `limit` idempotency keys expired before `now`, skipping the
+    rows a request is replaying or storing.
+
+    Returns how many were deleted; the caller commits.
+    """
+    expired = (
+        select(IdempotencyKey.key_hash)
+        .where(col(IdempotencyKey.expires_at) < now)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    statement = (
+        delete(IdempotencyKey)
+        .where(col(IdempotencyKey.key_hash).in_(expired.scalar_subquery()))
+        .returning(col(IdempotencyKey.key_hash))
+        .execution_options(synchronize_session=False)
+    )
+    return len(session.execute(statement).scalars().all())
+
+
+def delete_sent_emails(*, session: Session, before: datetime, limit: int) -> int:
+    """
+    Delete at most `limit` emails of the outbox sent before `before`, oldest
+    first.
+
+    Returns how many were deleted; the caller commits.
+    """
+    sent = (
+        select(EmailOutbox.id)
+        .where(
+            EmailOutbox.status == EMAIL_STATUS_ENVIADO,
+            col(EmailOutbox.sent_at) < before,
+        )
+        .order_by(col(EmailOutbox.sent_at))
+        .limit(limit)
+    )
+    statement = (
+        delete(EmailOutbox)
+        .where(col(EmailOutbox.id).in_(sent.scalar_subquery()))
+        .returning(col(EmailOutbox.id))
+        .execution_options(synchronize_session=False)
+    )
+    return len(session.execute(statement).scalars().all())
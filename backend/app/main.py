@@ -1,10 +1,29 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 import sentry_sdk
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from fastapi.routing import APIRoute
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.main import api_router
+from app.api.middleware import ReadYourWritesMiddleware
+from app.core import (
+    events,
+    heartbeats,
+    leader,
+    outbox,
+    presence,
+    scheduler,
+    security,
+    signing,
+    sweeper,
+)
 from app.core.config import settings
+from app.core.db import async_engine, async_replica_engine
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -14,12 +33,48 @@ def custom_generate_unique_id(route: APIRoute) -> str:
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
     sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
 
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    events.comando_waiters.bind(asyncio.get_running_loop())
+    await run_in_threadpool(signing.key_cache.warm)
+    events.bus.start()
+    await run_in_threadpool(presence.table.start)
+    heartbeats.buffer.start()
+    leader.leader.start()
+    sweeper.offline_sweeper.start()
+    sweeper.comando_expiry_sweeper.start()
+    sweeper.idempotency_key_purger.start()
+    sweeper.email_outbox_purger.start()
+    scheduler.scheduler.start()
+    if settings.emails_enabled:
+        outbox.dispatcher.start()
+    yield
+    outbox.dispatcher.stop()
+    await run_in_threadpool(scheduler.scheduler.stop)
+    await run_in_threadpool(sweeper.email_outbox_purger.stop)
+    await run_in_threadpool(sweeper.idempotency_key_purger.stop)
+    await run_in_threadpool(sweeper.comando_expiry_sweeper.stop)
+    await run_in_threadpool(sweeper.offline_sweeper.stop)
+    await run_in_threadpool(leader.leader.stop)
+    await run_in_threadpool(heartbeats.buffer.stop)
+    await run_in_threadpool(presence.table.stop)
+    events.bus.stop()
+    # Their connections belong to this event loop
+    await async_engine.dispose()
+    if async_replica_engine is not async_engine:
+        await async_replica_engine.dispose()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    lifespan=lifespan,
 )
 
+app.add_middleware(ReadYourWritesMiddleware)
+
 # Set all CORS enabled origins
 if settings.all_cors_origins:
     app.add_middleware(
@@ -30,4 +85,16 @@ if settings.all_cors_origins:
         allow_headers=["*"],
     )
 
+
+@app.exception_handler(security.PasswordPoolFull)
+async def password_pool_full_handler(
+    _request: Request, _exc: security.PasswordPoolFull
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many password requests, try again shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
@@ -2,9 +2,10 @@ from __future__ import annotations
 
 import uuid
 from datetime import datetime, timezone
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Literal
 
 from pydantic import EmailStr
+from sqlalchemy import DateTime, Index, text
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlmodel import Field, Relationship, SQLModel
 
@@ -60,7 +61,8 @@ class UserPublic(UserBase):
 
 class UsersPublic(SQLModel):
     data: list[UserPublic]
-    count: int
+    count: int | None
+    next_cursor: str | None = None
 
 
 # Generic message
@@ -105,7 +107,8 @@ class AgricultorPublic(AgricultorBase):
 
 class AgricultoresPublic(SQLModel):
     data: list[AgricultorPublic]
-    count: int
+    count: int | None
+    next_cursor: str | None = None
 
 class AgricultorUpdate(SQLModel):
     nome: str | None = Field(default=None, max_length=255)
@@ -130,7 +133,8 @@ class SetorPublic(SetorBase):
 
 class SetoresPublic(SQLModel):
     data: list[SetorPublic]
-    count: int
+    count: int | None
+    next_cursor: str | None = None
 
 class SetorUpdate(SQLModel):
     nome: str | None = Field(default=None, max_length=255)
@@ -138,17 +142,33 @@ class SetorUpdate(SQLModel):
 
 # Aparelhos model
 
+APARELHO_STATUS_ONLINE = "online"
+# Set by the offline sweeper once an online aparelho stops sending heartbeats
+APARELHO_STATUS_OFFLINE = "offline"
+
 class AparelhoBase(SQLModel):
     setor_id: uuid.UUID = Field(foreign_key="setor.id")
     modelo: str | None = Field(default=None, max_length=255)
     agricultor_id: uuid.UUID = Field(foreign_key="agricultor.id")
     status: str | None = Field(default=None, max_length=50)
-    ultima_conexao: str | None = Field(default=None, max_length=50)
+    ultima_conexao: datetime | None = Field(
+        default=None, sa_type=DateTime(timezone=True), index=True
+    )
 
 class AparelhoCreate(AparelhoBase):
     pass
 
 class Aparelho(AparelhoBase, table=True):
+    __table_args__ = (
+        # Only the rows the offline sweeper looks at, its cost follows the
+        # transitions instead of the fleet
+        Index(
+            "ix_aparelho_online",
+            "ultima_conexao",
+            postgresql_where=text("status = 'online'"),
+        ),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
 
 class AparelhoPublic(AparelhoBase):
@@ -156,12 +176,21 @@ class AparelhoPublic(AparelhoBase):
 
 class AparelhosPublic(SQLModel):
     data: list[AparelhoPublic]
-    count: int
+    count: int | None
+    next_cursor: str | None = None
 
 class AparelhoUpdate(SQLModel):
     modelo: str | None = Field(default=None, max_length=255)
     status: str | None = Field(default=None, max_length=50)
-    ultima_conexao: str | None = Field(default=None, max_length=50)
+    ultima_conexao: datetime | None = Field(default=None)
+
+class AparelhoPresenca(SQLModel):
+    id: uuid.UUID
+    online: bool
+    ultima_conexao: datetime | None = None
+
+class AparelhosOnline(SQLModel):
+    count: int
 
 # Controladores model
 
@@ -169,26 +198,37 @@ class ControladoresBase(SQLModel):
     aparelho_id: uuid.UUID = Field(foreign_key="aparelho.id", unique=True, index=True)
     total_relays: int | None = Field(default=None)
     info_relays: str | None = Field(default=None, max_length=100)
-    assinatura: str = Field(max_length=100)
 
+# assinatura is the controlador's HMAC key: accepted on create and update but
+# never returned, so it stays out of the public models and the entity cache
 class ControladorCreate(ControladoresBase):
-    pass
+    assinatura: str = Field(max_length=100)
 
 class Controlador(ControladoresBase, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    assinatura: str = Field(max_length=100)
+    # Key replaced by the last change of assinatura, still accepted for request
+    # signatures during CONTROLADOR_KEY_ROTATION_GRACE_SECONDS after the change
+    assinatura_anterior: str | None = Field(default=None, max_length=100)
+    assinatura_rotacionada_em: datetime | None = Field(default=None)
 
 class ControladorPublic(ControladoresBase):
     id: uuid.UUID
 
 class ControladoresPublic(SQLModel):
     data: list[ControladorPublic]
-    count: int
+    count: int | None
+    next_cursor: str | None = None
 
 class ControladorUpdate(SQLModel):
     total_relays: int | None = Field(default=None)
     info_relays: str | None = Field(default=None, max_length=100)
     assinatura: str | None = Field(default=None, max_length=100)
 
+# Liveness report of a controlador, applied to its aparelho
+class Heartbeat(SQLModel):
+    status: str = Field(default=APARELHO_STATUS_ONLINE, max_length=50)
+
 # Emissor models
 
 class EmissorBase(AparelhoBase):
@@ -197,6 +237,26 @@ class EmissorBase(AparelhoBase):
 
 # Comandos model
 
+# Status a controlador polls for; the queue queries filter on this exact value
+COMANDO_STATUS_PENDENTE = "pendente"
+# Claimed by a controlador; claimable again once reserva_expira_em has passed
+COMANDO_STATUS_RESERVADO = "reservado"
+# Waiting for agendado_para; the scheduler sets it pendente when it comes due
+COMANDO_STATUS_AGENDADO = "agendado"
+# Not executed before expira_em; set by the expiry sweeper, never polled again
+COMANDO_STATUS_EXPIRADO = "expirado"
+# Reported by the controlador through an ack, final
+COMANDO_STATUS_EXECUTADO = "executado"
+COMANDO_STATUS_FALHOU = "falhou"
+# Rows of ix_comando_expira, the comandos the expiry sweeper looks at; reservado
+# ones only expire once their lease has lapsed too, see crud.expire_comandos
+COMANDO_EXPIRAVEL_WHERE = (
+    "status IN ('pendente', 'agendado', 'reservado') AND expira_em IS NOT NULL"
+)
+# Rows of ix_comando_coalescencia, also the conflict target of the upserts
+COMANDO_COALESCENCIA_WHERE = "status = 'pendente' AND chave_coalescencia IS NOT NULL"
+
+
 class ComandoBase(SQLModel):
     controlador_id: uuid.UUID = Field(foreign_key="controlador.id")
     timestamp_criado: datetime = Field(
@@ -205,25 +265,150 @@ class ComandoBase(SQLModel):
     timestamp_executado: datetime | None = Field(default=None)
     comando: str = Field(max_length=100)
     param: str = Field(max_length=100)
-    status: str = Field(default="Pendente", max_length=50)
- 
+    status: str = Field(default=COMANDO_STATUS_PENDENTE, max_length=50)
+    # Queued for the controlador at this time instead of right away
+    agendado_para: datetime | None = Field(
+        default=None, sa_type=DateTime(timezone=True)
+    )
+    # Dropped, instead of executed late, if still waiting by then
+    expira_em: datetime | None = Field(default=None, sa_type=DateTime(timezone=True))
+
 class ComandoCreate(ComandoBase):
     pass
 
 class Comando(ComandoBase, table=True):
+    __table_args__ = (
+        Index(
+            "ix_comando_controlador_id_status_timestamp_criado",
+            "controlador_id",
+            "status",
+            "timestamp_criado",
+        ),
+        # Only the rows controladores poll for, so it stays small as history grows
+        Index(
+            "ix_comando_pendente",
+            "controlador_id",
+            "timestamp_criado",
+            postgresql_where=text("status = 'pendente'"),
+        ),
+        # At most one pending comando per coalescing key and controlador
+        Index(
+            "ix_comando_coalescencia",
+            "controlador_id",
+            "chave_coalescencia",
+            unique=True,
+            postgresql_where=text(COMANDO_COALESCENCIA_WHERE),
+        ),
+        # Upcoming comandos by due time, read by the scheduler
+        Index(
+            "ix_comando_agendado",
+            "agendado_para",
+            postgresql_where=text("status = 'agendado'"),
+        ),
+        # Waiting comandos that can expire, by expiry, read by the sweeper
+        Index(
+            "ix_comando_expira",
+            "expira_em",
+            postgresql_where=text(COMANDO_EXPIRAVEL_WHERE),
+        ),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    reserva_expira_em: datetime | None = Field(default=None)
+    # Set from comando and param when queued, see crud.coalescing_key
+    chave_coalescencia: str | None = Field(default=None, max_length=255)
 
 class ComandoPublic(ComandoBase):
     id: uuid.UUID
+    reserva_expira_em: datetime | None = None
 
 
 class ComandosPublic(SQLModel):
     data: list[ComandoPublic]
-    count: int
+    count: int | None
+    next_cursor: str | None = None
 
 class ComandoUpdate(SQLModel):
     timestamp_executado: datetime | None = Field(default=None)
     status: str | None = Field(default=None, max_length=50)
 
+# Same comando for every controlador of a setor, or of an agricultor
+class ComandoBroadcast(SQLModel):
+    setor_id: uuid.UUID | None = Field(default=None)
+    agricultor_id: uuid.UUID | None = Field(default=None)
+    comando: str = Field(max_length=100)
+    param: str = Field(max_length=100)
+    agendado_para: datetime | None = Field(default=None)
+    expira_em: datetime | None = Field(default=None)
+
+# Execution report for one comando, sent in batches by the controlador
+class ComandoAck(SQLModel):
+    id: uuid.UUID
+    # COMANDO_STATUS_EXECUTADO or COMANDO_STATUS_FALHOU
+    status: Literal["executado", "falhou"]
+    timestamp_executado: datetime | None = Field(default=None)
+
+class ComandoAckResult(SQLModel):
+    id: uuid.UUID
+    updated: bool
+
+class ComandoAcksPublic(SQLModel):
+    data: list[ComandoAckResult]
+    count: int
+
 
+# Email outbox
+
+# Waiting to be sent, or to be retried once next_attempt_at has passed
+EMAIL_STATUS_PENDENTE = "pendente"
+EMAIL_STATUS_ENVIADO = "enviado"
+# Gave up after EMAIL_OUTBOX_MAX_ATTEMPTS
+EMAIL_STATUS_FALHOU = "falhou"
+
+
+class EmailOutbox(SQLModel, table=True):
+    __table_args__ = (
+        # Only the rows the dispatcher polls for, sent mail does not grow it
+        Index(
+            "ix_emailoutbox_pendente",
+            "next_attempt_at",
+            postgresql_where=text("status = 'pendente'"),
+        ),
+        # Sent mail, in the order the purge deletes it
+        Index(
+            "ix_emailoutbox_enviado",
+            "sent_at",
+            postgresql_where=text("status = 'enviado'"),
+        ),
+    )
 
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    email_to: str = Field(max_length=255)
+    subject: str = Field(max_length=1000)
+    # Cleared once the email is sent or given up on: it may hold passwords and
+    # reset tokens
+    html_content: str | None = Field(default=None)
+    status: str = Field(default=EMAIL_STATUS_PENDENTE, max_length=50)
+    attempts: int = 0
+    last_error: str | None = Field(default=None, max_length=1000)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    next_attempt_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc)
+    )
+    sent_at: datetime | None = Field(default=None)
+
+# Response of a write sent with an Idempotency-Key header, replayed to retries
+# of the same request until expires_at
+class IdempotencyKey(SQLModel, table=True):
+    # sha256 of the key and who sent it to which route, see app.api.idempotency
+    key_hash: bytes = Field(primary_key=True)
+    # sha256 of the request body, a retry must send the same one
+    request_hash: bytes
+    status_code: int
+    media_type: str | None = Field(default=None, max_length=255)
+    body: bytes
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_type=DateTime(timezone=True),
+    )
+    expires_at: datetime = Field(sa_type=DateTime(timezone=True), index=True)
@@ -0,0 +1,170 @@
+"""
+Compare per-item PATCH against the bulk /comandos/confirmar endpoint.
+
+Creates one controlador with batches of pending comandos on a running API and
+acknowledges each batch both ways, reporting the time per batch.
+
+    python scripts/benchmarks/comandos_ack.py --url http://localhost:8000 \\
+        --batch 20 --batch 50 --rounds 50
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import time
+import uuid
+
+import httpx
+
+from app.core import signing
+from app.core.config import settings
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+
+async def login(client: httpx.AsyncClient) -> dict[str, str]:
+    r = await client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={
+            "username": settings.FIRST_SUPERUSER,
+            "password": settings.FIRST_SUPERUSER_PASSWORD,
+        },
+    )
+    r.raise_for_status()
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def signed_headers(
+    controlador_id: str, key: str, method: str, path: str, body: bytes
+) -> dict[str, str]:
+    timestamp = str(int(time.time()))
+    nonce = uuid.uuid4().hex
+    return {
+        "Content-Type": "application/json",
+        signing.CONTROLADOR_HEADER: controlador_id,
+        signing.TIMESTAMP_HEADER: timestamp,
+        signing.NONCE_HEADER: nonce,
+        signing.SIGNATURE_HEADER: signing.sign(
+            key,
+            controlador_id=controlador_id,
+            timestamp=timestamp,
+            nonce=nonce,
+            method=method,
+            path=path,
+            body=body,
+        ),
+    }
+
+
+async def create_controlador(
+    client: httpx.AsyncClient, headers: dict[str, str]
+) -> tuple[str, str]:
+    """Returns the id and signing key of a new controlador."""
+    r = await client.post(
+        f"{settings.API_V1_STR}/agricultores/",
+        headers=headers,
+        json={"nome": "bench", "cpf": uuid.uuid4().hex[:14]},
+    )
+    r.raise_for_status()
+    agricultor_id = r.json()["id"]
+    r = await client.post(
+        f"{settings.API_V1_STR}/setores/",
+        json={"nome": "bench", "agricultor_id": agricultor_id},
+    )
+    r.raise_for_status()
+    r = await client.post(
+        f"{settings.API_V1_STR}/aparelhos/",
+        json={"setor_id": r.json()["id"], "agricultor_id": agricultor_id},
+    )
+    r.raise_for_status()
+    key = uuid.uuid4().hex
+    r = await client.post(
+        f"{settings.API_V1_STR}/controladores/",
+        json={"aparelho_id": r.json()["id"], "assinatura": key},
+    )
+    r.raise_for_status()
+    return str(r.json()["id"]), key
+
+
+async def create_batch(
+    client: httpx.AsyncClient, controlador_id: str, size: int
+) -> list[str]:
+    ids = []
+    for i in range(size):
+        r = await client.post(
+            f"{settings.API_V1_STR}/comandos/",
+            json={"controlador_id": controlador_id, "comando": "rele", "param": str(i)},
+        )
+        r.raise_for_status()
+        ids.append(r.json()["id"])
+    return ids
+
+
+async def ack_per_item(
+    client: httpx.AsyncClient,
+    headers: dict[str, str],
+    _controlador: tuple[str, str],
+    ids: list[str],
+) -> None:
+    for comando_id in ids:
+        r = await client.patch(
+            f"{settings.API_V1_STR}/comandos/{comando_id}",
+            headers=headers,
+            json={"status": "executado"},
+        )
+        r.raise_for_status()
+
+
+async def ack_bulk(
+    client: httpx.AsyncClient,
+    _headers: dict[str, str],
+    controlador: tuple[str, str],
+    ids: list[str],
+) -> None:
+    # Signed by the controlador, as the devices do
+    path = f"{settings.API_V1_STR}/comandos/confirmar"
+    body = json.dumps([{"id": id, "status": "executado"} for id in ids]).encode()
+    r = await client.post(
+        path,
+        headers=signed_headers(*controlador, "POST", path, body),
+        content=body,
+    )
+    r.raise_for_status()
+
+
+async def run(args: argparse.Namespace) -> None:
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        headers = await login(client)
+        controlador = await create_controlador(client, headers)
+        for size in args.batch:
+            for name, ack in (("per-item PATCH", ack_per_item), ("bulk", ack_bulk)):
+                timings = []
+                for _ in range(args.rounds):
+                    ids = await create_batch(client, controlador[0], size)
+                    start = time.perf_counter()
+                    await ack(client, headers, controlador, ids)
+                    timings.append(time.perf_counter() - start)
+                logger.info(
+                    "batch %3d  %-15s median %7.1fms  max %7.1fms",
+                    size,
+                    name,
+                    statistics.median(timings) * 1000,
+                    max(timings) * 1000,
+                )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--batch", type=int, action="append")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    args.batch = args.batch or [20, 50]
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
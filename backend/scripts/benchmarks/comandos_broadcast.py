@@ -0,0 +1,192 @@
+"""
+Measure sending one comando to every controlador of a farm.
+
+Inserts a setor with `--controladores` controladores straight into the
+database, then creates the same comando for all of them through a single
+POST /comandos/difundir and, for comparison, through one POST /comandos per
+controlador with `--concurrency` clients, and reports the time of each. The
+farm and its comandos are deleted at the end unless `--keep` is given.
+
+    python scripts/benchmarks/comandos_broadcast.py --url http://localhost:8000 \\
+        --controladores 5000 --rounds 5
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+import uuid
+
+import httpx
+from sqlalchemy import insert
+from sqlmodel import Session, col, delete, select
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.models import Agricultor, Aparelho, Comando, Controlador, Setor
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+
+def create_farm(count: int) -> tuple[uuid.UUID, uuid.UUID, list[str]]:
+    with Session(engine) as session:
+        user = crud.get_user_by_email(session=session, email=settings.FIRST_SUPERUSER)
+        assert user, "run the initial data script first"
+        agricultor = Agricultor(
+            nome="benchmark", cpf=uuid.uuid4().hex[:14], user_id=user.id
+        )
+        session.add(agricultor)
+        session.flush()
+        setor = Setor(nome="benchmark", agricultor_id=agricultor.id)
+        session.add(setor)
+        session.flush()
+        devices = [(uuid.uuid4(), uuid.uuid4()) for _ in range(count)]
+        session.execute(
+            insert(Aparelho),
+            [
+                {
+                    "id": aparelho_id,
+                    "setor_id": setor.id,
+                    "agricultor_id": agricultor.id,
+                }
+                for _, aparelho_id in devices
+            ],
+        )
+        session.execute(
+            insert(Controlador),
+            [
+                {
+                    "id": controlador_id,
+                    "aparelho_id": aparelho_id,
+                    "assinatura": uuid.uuid4().hex,
+                }
+                for controlador_id, aparelho_id in devices
+            ],
+        )
+        session.commit()
+        return agricultor.id, setor.id, [str(c) for c, _ in devices]
+
+
+def delete_farm(agricultor_id: uuid.UUID) -> None:
+    aparelhos = select(Aparelho.id).where(Aparelho.agricultor_id == agricultor_id)
+    controladores = select(Controlador.id).where(
+        col(Controlador.aparelho_id).in_(aparelhos)
+    )
+    with Session(engine) as session:
+        session.execute(
+            delete(Comando).where(col(Comando.controlador_id).in_(controladores))
+        )
+        session.execute(
+            delete(Controlador).where(col(Controlador.aparelho_id).in_(aparelhos))
+        )
+        session.execute(delete(Aparelho).where(col(Aparelho.id).in_(aparelhos)))
+        session.execute(delete(Setor).where(col(Setor.agricultor_id) == agricultor_id))
+        session.execute(delete(Agricultor).where(col(Agricultor.id) == agricultor_id))
+        session.commit()
+
+
+async def login(client: httpx.AsyncClient) -> dict[str, str]:
+    r = await client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={
+            "username": settings.FIRST_SUPERUSER,
+            "password": settings.FIRST_SUPERUSER_PASSWORD,
+        },
+    )
+    r.raise_for_status()
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+async def broadcast(
+    client: httpx.AsyncClient,
+    headers: dict[str, str],
+    setor_id: uuid.UUID,
+    param: str,
+) -> int:
+    r = await client.post(
+        f"{settings.API_V1_STR}/comandos/difundir",
+        headers=headers,
+        json={"setor_id": str(setor_id), "comando": "fechar", "param": param},
+    )
+    r.raise_for_status()
+    return int(r.json()["count"])
+
+
+async def one_by_one(
+    client: httpx.AsyncClient,
+    headers: dict[str, str],
+    controladores: list[str],
+    concurrency: int,
+    param: str,
+) -> int:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def create(controlador_id: str) -> None:
+        async with semaphore:
+            r = await client.post(
+                f"{settings.API_V1_STR}/comandos/",
+                headers=headers,
+                json={
+                    "controlador_id": controlador_id,
+                    "comando": "fechar",
+                    "param": param,
+                },
+            )
+            r.raise_for_status()
+
+    await asyncio.gather(*(create(c) for c in controladores))
+    return len(controladores)
+
+
+async def run(
+    args: argparse.Namespace, setor_id: uuid.UUID, controladores: list[str]
+) -> None:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.url, timeout=120, limits=limits
+    ) as client:
+        headers = await login(client)
+        for mode in ("broadcast", "one-by-one"):
+            timings = []
+            for n in range(args.rounds):
+                # A new param each round, identical pending comandos are coalesced
+                param = f"{mode}-{n}"
+                start = time.perf_counter()
+                if mode == "broadcast":
+                    created = await broadcast(client, headers, setor_id, param)
+                else:
+                    created = await one_by_one(
+                        client, headers, controladores, args.concurrency, param
+                    )
+                timings.append(time.perf_counter() - start)
+            logger.info(
+                "%-10s %d comandos  median %8.1fms  min %8.1fms",
+                mode,
+                created,
+                statistics.median(timings) * 1000,
+                min(timings) * 1000,
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--controladores", type=int, default=5_000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    agricultor_id, setor_id, controladores = create_farm(args.controladores)
+    try:
+        asyncio.run(run(args, setor_id, controladores))
+    finally:
+        if not args.keep:
+            delete_farm(agricultor_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Load test for the comandos long-poll endpoint against a running API.
+
+Simulates a fleet of controladores that keep a long-poll open while a producer
+creates comandos for random controladores, then reports how long each comando
+took to reach its controlador and how many poll requests the fleet made.
+
+    python scripts/benchmarks/comandos_long_poll.py --url http://localhost:8000 \\
+        --controladores 2000 --comandos 5000 --rate 200
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+import uuid
+from urllib.parse import urlencode
+
+import httpx
+
+from app.core import signing
+from app.core.config import settings
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+
+async def login(client: httpx.AsyncClient) -> dict[str, str]:
+    r = await client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={
+            "username": settings.FIRST_SUPERUSER,
+            "password": settings.FIRST_SUPERUSER_PASSWORD,
+        },
+    )
+    r.raise_for_status()
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def signed_headers(
+    controlador_id: str, key: str, method: str, path: str, query: str = ""
+) -> dict[str, str]:
+    timestamp = str(int(time.time()))
+    nonce = uuid.uuid4().hex
+    return {
+        signing.CONTROLADOR_HEADER: controlador_id,
+        signing.TIMESTAMP_HEADER: timestamp,
+        signing.NONCE_HEADER: nonce,
+        signing.SIGNATURE_HEADER: signing.sign(
+            key,
+            controlador_id=controlador_id,
+            timestamp=timestamp,
+            nonce=nonce,
+            method=method,
+            path=path,
+            query=query,
+        ),
+    }
+
+
+async def create_fleet(client: httpx.AsyncClient, size: int) -> dict[str, str]:
+    """Create `size` controladores, returns their signing keys by id."""
+    headers = await login(client)
+    r = await client.post(
+        f"{settings.API_V1_STR}/agricultores/",
+        headers=headers,
+        json={"nome": "bench", "cpf": uuid.uuid4().hex[:14]},
+    )
+    r.raise_for_status()
+    agricultor_id = r.json()["id"]
+    r = await client.post(
+        f"{settings.API_V1_STR}/setores/",
+        json={"nome": "bench", "agricultor_id": agricultor_id},
+    )
+    r.raise_for_status()
+    setor_id = r.json()["id"]
+
+    async def create_controlador() -> tuple[str, str]:
+        r = await client.post(
+            f"{settings.API_V1_STR}/aparelhos/",
+            json={"setor_id": setor_id, "agricultor_id": agricultor_id},
+        )
+        r.raise_for_status()
+        key = uuid.uuid4().hex
+        r = await client.post(
+            f"{settings.API_V1_STR}/controladores/",
+            json={"aparelho_id": r.json()["id"], "assinatura": key},
+        )
+        r.raise_for_status()
+        return str(r.json()["id"]), key
+
+    return dict(await asyncio.gather(*(create_controlador() for _ in range(size))))
+
+
+async def run(args: argparse.Namespace) -> None:
+    limits = httpx.Limits(max_connections=args.controladores + 50)
+    async with httpx.AsyncClient(
+        base_url=args.url, limits=limits, timeout=args.timeout + 30
+    ) as client:
+        fleet = await create_fleet(client, args.controladores)
+        logger.info("Created %d controladores", len(fleet))
+
+        sent_at: dict[str, float] = {}
+        latencies: list[float] = []
+        polls = 0
+        done = asyncio.Event()
+
+        async def controlador(controlador_id: str, key: str) -> None:
+            nonlocal polls
+            path = (
+                f"{settings.API_V1_STR}/comandos/controlador/{controlador_id}/aguardar"
+            )
+            query = urlencode({"timeout": args.timeout})
+            while not done.is_set():
+                r = await client.get(
+                    f"{path}?{query}",
+                    headers=signed_headers(controlador_id, key, "GET", path, query),
+                )
+                polls += 1
+                now = time.perf_counter()
+                for comando in r.json()["data"]:
+                    started = sent_at.pop(comando["param"], None)
+                    if started is None:
+                        continue
+                    latencies.append(now - started)
+                    # Mark it as executed so the next poll waits again
+                    await client.patch(
+                        f"{settings.API_V1_STR}/comandos/{comando['id']}",
+                        headers=headers,
+                        json={"status": "executado"},
+                    )
+                if len(latencies) >= args.comandos:
+                    done.set()
+
+        async def producer() -> None:
+            for _ in range(args.comandos):
+                marker = uuid.uuid4().hex
+                sent_at[marker] = time.perf_counter()
+                await client.post(
+                    f"{settings.API_V1_STR}/comandos/",
+                    json={
+                        "controlador_id": random.choice(controlador_ids),
+                        "comando": "bench",
+                        "param": marker,
+                    },
+                )
+                await asyncio.sleep(1 / args.rate)
+
+        headers = await login(client)
+        controlador_ids = list(fleet)
+        started = time.perf_counter()
+        pollers = [asyncio.create_task(controlador(c, k)) for c, k in fleet.items()]
+        await producer()
+        try:
+            await asyncio.wait_for(done.wait(), timeout=args.timeout * 2)
+        except asyncio.TimeoutError:
+            logger.warning("Not every comando was delivered before the deadline")
+        done.set()
+        elapsed = time.perf_counter() - started
+        for task in pollers:
+            task.cancel()
+        await asyncio.gather(*pollers, return_exceptions=True)
+
+    if latencies:
+        latencies.sort()
+        logger.info("Delivered %d comandos in %.1fs", len(latencies), elapsed)
+        logger.info("Latency p50 %.1fms", statistics.median(latencies) * 1000)
+        logger.info(
+            "Latency p99 %.1fms", latencies[int(len(latencies) * 0.99) - 1] * 1000
+        )
+    logger.info("Poll requests: %d (%.1f/s)", polls, polls / elapsed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--controladores", type=int, default=500)
+    parser.add_argument("--comandos", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=100, help="comandos per second")
+    parser.add_argument("--timeout", type=float, default=25, help="long-poll timeout")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
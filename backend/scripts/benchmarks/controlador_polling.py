@@ -0,0 +1,107 @@
+"""
+Measure polling latency with thousands of concurrent controladores.
+
+Opens `--concurrency` connections, one per simulated controlador, each polling
+its comandos every `--interval` seconds for `--duration` seconds, and reports
+the median and tail latency. Pass `--baseline-url` to run the same load against
+a second API, e.g. a build from before the polling and list endpoints moved to
+the async engine, and compare both.
+
+    python scripts/benchmarks/controlador_polling.py --url http://localhost:8000 \\
+        --baseline-url http://localhost:8001 --concurrency 2000 --duration 30
+
+Raise the open files limit first (ulimit -n) for thousands of connections.
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+import uuid
+
+import httpx
+
+from app.core.config import settings
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+
+def percentile(timings: list[float], p: float) -> float:
+    if not timings:
+        return 0.0
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def poll_loop(
+    client: httpx.AsyncClient,
+    deadline: float,
+    interval: float,
+    timings: list[float],
+    errors: list[int],
+) -> None:
+    url = f"{settings.API_V1_STR}/comandos/controlador/{uuid.uuid4()}"
+    # Spread the first polls so the fleet doesn't arrive in lockstep
+    await asyncio.sleep(random.uniform(0, interval))
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            r = await client.get(url)
+            r.raise_for_status()
+        except httpx.HTTPError:
+            errors[0] += 1
+        else:
+            timings.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+
+
+async def measure(url: str, args: argparse.Namespace) -> None:
+    limits = httpx.Limits(
+        max_connections=args.concurrency, max_keepalive_connections=args.concurrency
+    )
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        timings: list[float] = []
+        errors = [0]
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            *(
+                poll_loop(client, deadline, args.interval, timings, errors)
+                for _ in range(args.concurrency)
+            )
+        )
+
+    if not timings:
+        logger.info("%s: no successful polls, %d errors", url, errors[0])
+        return
+    logger.info(
+        "%s: %d polls (%.0f/s), %d errors  median %7.1fms  p99 %7.1fms  max %7.1fms",
+        url,
+        len(timings),
+        len(timings) / args.duration,
+        errors[0],
+        statistics.median(timings) * 1000,
+        percentile(timings, 0.99) * 1000,
+        max(timings) * 1000,
+    )
+
+
+async def run(args: argparse.Namespace) -> None:
+    for url in filter(None, (args.baseline_url, args.url)):
+        await measure(url, args)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--baseline-url")
+    parser.add_argument("--concurrency", type=int, default=2000)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--interval", type=float, default=1.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
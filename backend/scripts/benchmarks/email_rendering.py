@@ -0,0 +1,92 @@
+"""
+Measure rendering of reset-password and new-account emails in bulk.
+
+Renders `--count` emails of each kind, as a bulk invite of a cooperative would,
+through the cached template environment used by the app and, for comparison,
+by reading and compiling the template on every call. Runs in process, no API
+or database needed.
+
+    python scripts/benchmarks/email_rendering.py --count 500 --rounds 5
+"""
+
+import argparse
+import logging
+import statistics
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from jinja2 import Template
+
+from app import utils
+from app.core.config import settings
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+TEMPLATES = Path(utils.__file__).parent / "email-templates" / "build"
+
+
+def compile_per_call(*, template_name: str, context: dict[str, Any]) -> str:
+    template_str = (TEMPLATES / template_name).read_text()
+    html_content: str = Template(template_str).render(context)
+    return html_content
+
+
+def render_bulk(render: Callable[..., str], count: int) -> None:
+    for n in range(count):
+        email = f"agricultor{n}@example.com"
+        render(
+            template_name="reset_password.html",
+            context={
+                "project_name": settings.PROJECT_NAME,
+                "username": email,
+                "email": email,
+                "valid_hours": settings.EMAIL_RESET_TOKEN_EXPIRE_HOURS,
+                "link": f"{settings.FRONTEND_HOST}/reset-password?token={n}",
+            },
+        )
+        render(
+            template_name="new_account.html",
+            context={
+                "project_name": settings.PROJECT_NAME,
+                "username": email,
+                "password": f"senha-{n}",
+                "email": email,
+                "link": settings.FRONTEND_HOST,
+            },
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    logger.info(
+        "%d emails per round, auto_reload=%s",
+        args.count * 2,
+        utils.email_templates.auto_reload,
+    )
+    for name, render in (
+        ("compiled per call", compile_per_call),
+        ("cached environment", utils.render_email_template),
+    ):
+        timings = []
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            render_bulk(render, args.count)
+            timings.append(time.perf_counter() - start)
+        median = statistics.median(timings)
+        logger.info(
+            "%-20s median %8.1fms per round  %6.1fus per email",
+            name,
+            median * 1000,
+            median / (args.count * 2) * 1_000_000,
+        )
+
+
+if __name__ == "__main__":
+    main()
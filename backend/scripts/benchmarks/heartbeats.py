@@ -0,0 +1,235 @@
+"""
+Measure heartbeat ingestion with a large fleet of simulated devices.
+
+Inserts `--devices` aparelhos with their controladores straight into the
+database, then has `--concurrency` clients send heartbeats on their behalf for
+`--duration` seconds against a running API, and reports requests per second,
+latency and the heartbeat counters of the worker that served the metrics
+request (statements written vs heartbeats recorded). With `--mode patch` the
+same load goes through PATCH /aparelhos/{id} instead, for comparison. The
+fleet is deleted at the end unless `--keep` is given.
+
+    python scripts/benchmarks/heartbeats.py --url http://localhost:8000 \\
+        --devices 50000 --concurrency 500 --duration 30
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+import uuid
+from datetime import datetime, timezone
+
+import httpx
+from sqlalchemy import insert
+from sqlmodel import Session, col, delete, select
+
+from app import crud
+from app.core import signing
+from app.core.config import settings
+from app.core.db import engine
+from app.models import Agricultor, Aparelho, Controlador, Setor
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+# (controlador id, key, aparelho id)
+Device = tuple[str, str, str]
+
+
+def percentile(timings: list[float], p: float) -> float:
+    if not timings:
+        return 0.0
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def create_fleet(count: int) -> tuple[uuid.UUID, list[Device]]:
+    with Session(engine) as session:
+        user = crud.get_user_by_email(session=session, email=settings.FIRST_SUPERUSER)
+        assert user, "run the initial data script first"
+        agricultor = Agricultor(
+            nome="benchmark", cpf=uuid.uuid4().hex[:14], user_id=user.id
+        )
+        session.add(agricultor)
+        session.flush()
+        setor = Setor(nome="benchmark", agricultor_id=agricultor.id)
+        session.add(setor)
+        session.flush()
+        devices = [(uuid.uuid4(), uuid.uuid4().hex, uuid.uuid4()) for _ in range(count)]
+        session.execute(
+            insert(Aparelho),
+            [
+                {
+                    "id": aparelho_id,
+                    "setor_id": setor.id,
+                    "agricultor_id": agricultor.id,
+                }
+                for _, _, aparelho_id in devices
+            ],
+        )
+        session.execute(
+            insert(Controlador),
+            [
+                {"id": controlador_id, "aparelho_id": aparelho_id, "assinatura": key}
+                for controlador_id, key, aparelho_id in devices
+            ],
+        )
+        session.commit()
+        return agricultor.id, [(str(c), k, str(a)) for c, k, a in devices]
+
+
+def delete_fleet(agricultor_id: uuid.UUID) -> None:
+    aparelhos = select(Aparelho.id).where(Aparelho.agricultor_id == agricultor_id)
+    with Session(engine) as session:
+        session.execute(
+            delete(Controlador).where(col(Controlador.aparelho_id).in_(aparelhos))
+        )
+        session.execute(delete(Aparelho).where(col(Aparelho.id).in_(aparelhos)))
+        session.execute(delete(Setor).where(col(Setor.agricultor_id) == agricultor_id))
+        session.execute(delete(Agricultor).where(col(Agricultor.id) == agricultor_id))
+        session.commit()
+
+
+def signed_headers(controlador_id: str, key: str, path: str) -> dict[str, str]:
+    timestamp = str(int(time.time()))
+    nonce = uuid.uuid4().hex
+    return {
+        signing.CONTROLADOR_HEADER: controlador_id,
+        signing.TIMESTAMP_HEADER: timestamp,
+        signing.NONCE_HEADER: nonce,
+        signing.SIGNATURE_HEADER: signing.sign(
+            key,
+            controlador_id=controlador_id,
+            timestamp=timestamp,
+            nonce=nonce,
+            method="POST",
+            path=path,
+        ),
+    }
+
+
+async def login(client: httpx.AsyncClient) -> dict[str, str]:
+    r = await client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={
+            "username": settings.FIRST_SUPERUSER,
+            "password": settings.FIRST_SUPERUSER_PASSWORD,
+        },
+    )
+    r.raise_for_status()
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+async def send_loop(
+    client: httpx.AsyncClient,
+    devices: list[Device],
+    mode: str,
+    token_headers: dict[str, str],
+    deadline: float,
+    timings: list[float],
+    errors: list[int],
+) -> None:
+    n = 0
+    while time.perf_counter() < deadline:
+        controlador_id, key, aparelho_id = devices[n % len(devices)]
+        n += 1
+        start = time.perf_counter()
+        if mode == "heartbeat":
+            path = f"{settings.API_V1_STR}/controladores/{controlador_id}/heartbeat"
+            r = await client.post(
+                path, headers=signed_headers(controlador_id, key, path)
+            )
+        else:
+            r = await client.patch(
+                f"{settings.API_V1_STR}/aparelhos/{aparelho_id}",
+                headers=token_headers,
+                json={
+                    "status": "online",
+                    "ultima_conexao": datetime.now(timezone.utc).isoformat(),
+                },
+            )
+        if r.is_success:
+            timings.append(time.perf_counter() - start)
+        else:
+            errors[0] += 1
+
+
+async def run(args: argparse.Namespace, devices: list[Device]) -> None:
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.url, timeout=60, limits=limits
+    ) as client:
+        token_headers = await login(client)
+        timings: list[float] = []
+        errors = [0]
+        deadline = time.perf_counter() + args.duration
+        # Each client cycles through its own share of the fleet
+        await asyncio.gather(
+            *(
+                send_loop(
+                    client,
+                    devices[i :: args.concurrency],
+                    args.mode,
+                    token_headers,
+                    deadline,
+                    timings,
+                    errors,
+                )
+                for i in range(min(args.concurrency, len(devices)))
+            )
+        )
+        if args.mode == "heartbeat":
+            # Let the buffers flush before reading their counters
+            await asyncio.sleep(settings.HEARTBEAT_FLUSH_SECONDS + 1)
+        r = await client.get(
+            f"{settings.API_V1_STR}/utils/metrics/", headers=token_headers
+        )
+        stats = r.json().get("heartbeats") if r.is_success else None
+
+    logger.info(
+        "%s: %d requests (%.0f/s), %d errors  median %6.1fms  p99 %6.1fms",
+        args.mode,
+        len(timings),
+        len(timings) / args.duration,
+        errors[0],
+        statistics.median(timings) * 1000 if timings else 0.0,
+        percentile(timings, 0.99) * 1000,
+    )
+    if stats:
+        logger.info(
+            "one worker: %d heartbeats recorded, %d flushes, %d statements, "
+            "%d rows updated, last flush %.3fs",
+            stats["recorded"],
+            stats["flushes"],
+            stats["statements"],
+            stats["rows_updated"],
+            stats["last_flush_seconds"] or 0.0,
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--devices", type=int, default=50_000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--mode", choices=["heartbeat", "patch"], default="heartbeat")
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    agricultor_id, devices = create_fleet(args.devices)
+    logger.info(
+        "created %d devices in %.1fs", len(devices), time.perf_counter() - start
+    )
+    try:
+        asyncio.run(run(args, devices))
+    finally:
+        if not args.keep:
+            delete_fleet(agricultor_id)
+
+
+if __name__ == "__main__":
+    main()
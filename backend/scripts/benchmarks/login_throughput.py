@@ -0,0 +1,114 @@
+"""
+Measure login throughput and its impact on unrelated endpoints.
+
+Runs `--concurrency` clients logging in back to back for `--duration` seconds
+against a running API while a single client keeps polling the comandos of a
+controlador (a sync endpoint, served by the request threadpool). Reports
+logins per second, rejected (503) logins and the polling latency.
+
+    python scripts/benchmarks/login_throughput.py --url http://localhost:8000 \\
+        --concurrency 50 --duration 20
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+import uuid
+
+import httpx
+
+from app.core.config import settings
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+
+def percentile(timings: list[float], p: float) -> float:
+    if not timings:
+        return 0.0
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def login_loop(
+    client: httpx.AsyncClient,
+    deadline: float,
+    timings: list[float],
+    statuses: dict[int, int],
+) -> None:
+    data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        r = await client.post(f"{settings.API_V1_STR}/login/access-token", data=data)
+        statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+        if r.status_code == 200:
+            timings.append(time.perf_counter() - start)
+        elif r.status_code == 503:
+            await asyncio.sleep(float(r.headers.get("Retry-After", "1")))
+
+
+async def poll_loop(
+    client: httpx.AsyncClient, deadline: float, timings: list[float]
+) -> None:
+    url = f"{settings.API_V1_STR}/comandos/controlador/{uuid.uuid4()}"
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        r = await client.get(url)
+        r.raise_for_status()
+        timings.append(time.perf_counter() - start)
+        await asyncio.sleep(0.05)
+
+
+async def run(args: argparse.Namespace) -> None:
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(
+        base_url=args.url, timeout=60, limits=limits
+    ) as client:
+        login_timings: list[float] = []
+        poll_timings: list[float] = []
+        statuses: dict[int, int] = {}
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            poll_loop(client, deadline, poll_timings),
+            *(
+                login_loop(client, deadline, login_timings, statuses)
+                for _ in range(args.concurrency)
+            ),
+        )
+
+    logger.info(
+        "logins: %d ok (%.1f/s), %d rejected, statuses %s",
+        len(login_timings),
+        len(login_timings) / args.duration,
+        statuses.get(503, 0),
+        statuses,
+    )
+    if login_timings:
+        logger.info(
+            "login latency   median %7.1fms  p99 %7.1fms",
+            statistics.median(login_timings) * 1000,
+            percentile(login_timings, 0.99) * 1000,
+        )
+    if poll_timings:
+        logger.info(
+            "polling latency median %7.1fms  p99 %7.1fms",
+            statistics.median(poll_timings) * 1000,
+            percentile(poll_timings, 0.99) * 1000,
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
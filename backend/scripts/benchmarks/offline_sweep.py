@@ -0,0 +1,122 @@
+"""
+Measure offline sweeps against a large fleet.
+
+Inserts `--devices` online aparelhos straight into the database, `--silent` of
+them with a last heartbeat older than the offline threshold, then runs sweeps
+until none is left to flip and reports the time and transitions of each. Run it
+with different `--devices` and the same `--silent`: the sweep time should not
+follow the fleet size. The fleet is deleted at the end unless `--keep` is given.
+
+    python scripts/benchmarks/offline_sweep.py --devices 100000 --silent 2000
+"""
+
+import argparse
+import logging
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, text
+from sqlmodel import Session, col, delete
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.core.leader import Leadership
+from app.core.sweeper import OfflineSweeper
+from app.models import APARELHO_STATUS_ONLINE, Agricultor, Aparelho, Setor
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+
+def create_fleet(devices: int, silent: int, offline_after: int) -> uuid.UUID:
+    now = datetime.now(timezone.utc)
+    with Session(engine) as session:
+        user = crud.get_user_by_email(session=session, email=settings.FIRST_SUPERUSER)
+        assert user, "run the initial data script first"
+        agricultor = Agricultor(
+            nome="benchmark", cpf=uuid.uuid4().hex[:14], user_id=user.id
+        )
+        session.add(agricultor)
+        session.flush()
+        setor = Setor(nome="benchmark", agricultor_id=agricultor.id)
+        session.add(setor)
+        session.flush()
+        rows = [
+            {
+                "id": uuid.uuid4(),
+                "setor_id": setor.id,
+                "agricultor_id": agricultor.id,
+                "status": APARELHO_STATUS_ONLINE,
+                "ultima_conexao": now
+                - timedelta(
+                    seconds=offline_after + random.uniform(1, 600)
+                    if i < silent
+                    else random.uniform(0, offline_after / 2)
+                ),
+            }
+            for i in range(devices)
+        ]
+        for i in range(0, len(rows), 10_000):
+            session.execute(insert(Aparelho), rows[i : i + 10_000])
+        # Fresh statistics, or the planner may not pick the partial index
+        session.execute(text("ANALYZE aparelho"))
+        session.commit()
+        return agricultor.id
+
+
+def delete_fleet(agricultor_id: uuid.UUID) -> None:
+    with Session(engine) as session:
+        session.execute(
+            delete(Aparelho).where(col(Aparelho.agricultor_id) == agricultor_id)
+        )
+        session.execute(delete(Setor).where(col(Setor.agricultor_id) == agricultor_id))
+        session.execute(delete(Agricultor).where(col(Agricultor.id) == agricultor_id))
+        session.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--devices", type=int, default=100_000)
+    parser.add_argument("--silent", type=int, default=2_000)
+    parser.add_argument("--batch", type=int, default=settings.APARELHO_SWEEP_BATCH_SIZE)
+    parser.add_argument(
+        "--offline-after", type=int, default=settings.APARELHO_OFFLINE_AFTER_SECONDS
+    )
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    agricultor_id = create_fleet(args.devices, args.silent, args.offline_after)
+    logger.info(
+        "created %d aparelhos (%d silent) in %.1fs",
+        args.devices,
+        args.silent,
+        time.perf_counter() - start,
+    )
+    sweeper = OfflineSweeper(
+        leadership=Leadership("benchmark"),
+        interval_seconds=0,
+        offline_after=args.offline_after,
+        batch_size=args.batch,
+    )
+    try:
+        while True:
+            transitions = sweeper.run()
+            logger.info(
+                "sweep %d: %6d transitions in %7.1fms",
+                sweeper.runs,
+                transitions,
+                (sweeper.last_run_seconds or 0.0) * 1000,
+            )
+            if transitions == 0:
+                break
+    finally:
+        if not args.keep:
+            delete_fleet(agricultor_id)
+
+
+if __name__ == "__main__":
+    main()
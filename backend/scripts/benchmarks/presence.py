@@ -0,0 +1,86 @@
+"""
+Measure the shared presence table against its own scratch file.
+
+Records heartbeats of `--devices` aparelhos in batches of `--batch` (as the
+heartbeat flush does), then times `--lookups` presence lookups of random
+aparelhos and online counts, and reports the time per operation. Runs in
+process, no API or database needed.
+
+    python scripts/benchmarks/presence.py --devices 200000 --lookups 1000000
+"""
+
+import argparse
+import logging
+import random
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from app.core.presence import PresenceTable
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--devices", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=5_000)
+    parser.add_argument("--lookups", type=int, default=1_000_000)
+    parser.add_argument("--window", type=int, default=900)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        table = PresenceTable(
+            path=str(Path(directory) / "presence"),
+            snapshot_path=str(Path(directory) / "presence.snapshot"),
+            max_aparelhos=args.devices,
+            window_seconds=args.window,
+            snapshot_seconds=60.0,
+        )
+        ids = [uuid.uuid4() for _ in range(args.devices)]
+
+        start = time.perf_counter()
+        for i in range(0, len(ids), args.batch):
+            now = time.time()
+            table.touch_many(
+                [(aparelho_id, now) for aparelho_id in ids[i : i + args.batch]]
+            )
+        elapsed = time.perf_counter() - start
+        logger.info(
+            "touch:     %8.0fns per aparelho (%d in batches of %d)",
+            elapsed / len(ids) * 1e9,
+            len(ids),
+            args.batch,
+        )
+
+        sample = random.choices(ids, k=args.lookups)
+        start = time.perf_counter()
+        for aparelho_id in sample:
+            table.last_seen(aparelho_id)
+        elapsed = time.perf_counter() - start
+        logger.info("lookup:    %8.0fns", elapsed / args.lookups * 1e9)
+
+        start = time.perf_counter()
+        for aparelho_id in sample:
+            table.is_online(aparelho_id)
+        elapsed = time.perf_counter() - start
+        logger.info("is_online: %8.0fns", elapsed / args.lookups * 1e9)
+
+        start = time.perf_counter()
+        for _ in range(args.lookups):
+            online = table.count()
+        elapsed = time.perf_counter() - start
+        logger.info(
+            "count:     %8.0fns (%d online)", elapsed / args.lookups * 1e9, online
+        )
+
+        start = time.perf_counter()
+        table.snapshot()
+        logger.info("snapshot:  %8.1fms", (time.perf_counter() - start) * 1000)
+        table.close()
+
+
+if __name__ == "__main__":
+    main()
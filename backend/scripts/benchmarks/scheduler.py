@@ -0,0 +1,184 @@
+"""
+Measure the comando scheduler against a large number of scheduled comandos.
+
+Inserts `--comandos` agendado comandos straight into the database for
+`--controladores` controladores, due on whole minutes spread over the next
+`--days` days as irrigation schedules are, plus `--due` already overdue. Then
+runs the scheduler once, which loads its heap and queues the overdue ones,
+and reports the load and dispatch times, the heap size and the memory the
+scheduler allocated. Memory follows the due seconds within the horizon, not
+the scheduled comandos. Everything is deleted at the end unless `--keep` is
+given.
+
+    python scripts/benchmarks/scheduler.py --comandos 1000000 --due 20000
+"""
+
+import argparse
+import logging
+import random
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, text
+from sqlmodel import Session, col, delete, select
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.core.leader import Leadership
+from app.core.scheduler import ComandoScheduler
+from app.models import (
+    COMANDO_STATUS_AGENDADO,
+    Agricultor,
+    Aparelho,
+    Comando,
+    Controlador,
+    Setor,
+)
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+
+def create_schedule(
+    controladores: int, comandos: int, due: int, days: float
+) -> uuid.UUID:
+    now = datetime.now(timezone.utc)
+    first_minute = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    minutes = int(days * 24 * 60)
+    with Session(engine) as session:
+        user = crud.get_user_by_email(session=session, email=settings.FIRST_SUPERUSER)
+        assert user, "run the initial data script first"
+        agricultor = Agricultor(
+            nome="benchmark", cpf=uuid.uuid4().hex[:14], user_id=user.id
+        )
+        session.add(agricultor)
+        session.flush()
+        setor = Setor(nome="benchmark", agricultor_id=agricultor.id)
+        session.add(setor)
+        session.flush()
+        devices = [(uuid.uuid4(), uuid.uuid4()) for _ in range(controladores)]
+        session.execute(
+            insert(Aparelho),
+            [
+                {
+                    "id": aparelho_id,
+                    "setor_id": setor.id,
+                    "agricultor_id": agricultor.id,
+                }
+                for _, aparelho_id in devices
+            ],
+        )
+        session.execute(
+            insert(Controlador),
+            [
+                {
+                    "id": controlador_id,
+                    "aparelho_id": aparelho_id,
+                    "assinatura": uuid.uuid4().hex,
+                }
+                for controlador_id, aparelho_id in devices
+            ],
+        )
+        rows = [
+            {
+                "id": uuid.uuid4(),
+                "controlador_id": devices[i % controladores][0],
+                "timestamp_criado": now,
+                "comando": "abrir_valvula",
+                "param": str(i),
+                "status": COMANDO_STATUS_AGENDADO,
+                "agendado_para": (
+                    now - timedelta(seconds=random.uniform(1, 60))
+                    if i < due
+                    else first_minute + timedelta(minutes=random.randrange(minutes))
+                ),
+            }
+            for i in range(comandos + due)
+        ]
+        for i in range(0, len(rows), 10_000):
+            session.execute(insert(Comando), rows[i : i + 10_000])
+        # Fresh statistics, or the planner may not pick the partial index
+        session.execute(text("ANALYZE comando"))
+        session.commit()
+        return agricultor.id
+
+
+def delete_schedule(agricultor_id: uuid.UUID) -> None:
+    aparelhos = select(Aparelho.id).where(Aparelho.agricultor_id == agricultor_id)
+    controladores = select(Controlador.id).where(
+        col(Controlador.aparelho_id).in_(aparelhos)
+    )
+    with Session(engine) as session:
+        session.execute(
+            delete(Comando).where(col(Comando.controlador_id).in_(controladores))
+        )
+        session.execute(
+            delete(Controlador).where(col(Controlador.aparelho_id).in_(aparelhos))
+        )
+        session.execute(delete(Aparelho).where(col(Aparelho.id).in_(aparelhos)))
+        session.execute(delete(Setor).where(col(Setor.agricultor_id) == agricultor_id))
+        session.execute(delete(Agricultor).where(col(Agricultor.id) == agricultor_id))
+        session.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--controladores", type=int, default=10_000)
+    parser.add_argument("--comandos", type=int, default=1_000_000)
+    parser.add_argument("--due", type=int, default=20_000)
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument(
+        "--horizon", type=int, default=settings.COMANDO_SCHEDULER_HORIZON_SECONDS
+    )
+    parser.add_argument(
+        "--batch", type=int, default=settings.COMANDO_SCHEDULER_BATCH_SIZE
+    )
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    agricultor_id = create_schedule(
+        args.controladores, args.comandos, args.due, args.days
+    )
+    logger.info(
+        "scheduled %d comandos (%d overdue) in %.1fs",
+        args.comandos + args.due,
+        args.due,
+        time.perf_counter() - start,
+    )
+    scheduler = ComandoScheduler(
+        leadership=Leadership("benchmark"),
+        interval_seconds=0,
+        horizon_seconds=args.horizon,
+        batch_size=args.batch,
+    )
+    try:
+        tracemalloc.start()
+        queued = scheduler.run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats = scheduler.stats()
+        logger.info(
+            "load and dispatch: %d queued in %.1fms, heap of %s due seconds, "
+            "%.1fKiB allocated at peak",
+            queued,
+            (scheduler.last_run_seconds or 0.0) * 1000,
+            stats["heap_size"],
+            peak / 1024,
+        )
+        queued = scheduler.run()
+        logger.info(
+            "idle run: %d queued in %.1fms",
+            queued,
+            (scheduler.last_run_seconds or 0.0) * 1000,
+        )
+    finally:
+        if not args.keep:
+            delete_schedule(agricultor_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.core import heartbeats
+from app.core.config import settings
+from app.models import Aparelho
+from tests.utils.comando import controlador_auth_headers, create_random_controlador
+
+
+def create_aparelho_seen_at(db: Session, ultima_conexao: datetime | None) -> Aparelho:
+    controlador = create_random_controlador(db)
+    aparelho = db.get(Aparelho, controlador.aparelho_id)
+    assert aparelho
+    aparelho.ultima_conexao = ultima_conexao
+    db.add(aparelho)
+    db.commit()
+    db.refresh(aparelho)
+    return aparelho
+
+
+def test_read_aparelhos_offline(client: TestClient, db: Session) -> None:
+    now = datetime.now(timezone.utc)
+    silent = create_aparelho_seen_at(db, now - timedelta(days=30))
+    online = create_aparelho_seen_at(db, now - timedelta(minutes=1))
+    never = create_aparelho_seen_at(db, None)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/aparelhos/offline",
+        params={"seconds": 24 * 3600, "limit": 1000},
+    )
+    assert r.status_code == 200
+    content = r.json()
+    ids = [aparelho["id"] for aparelho in content["data"]]
+    assert str(silent.id) in ids
+    assert str(online.id) not in ids
+    assert str(never.id) not in ids
+    assert content["count"] >= 1
+    ultimas = [aparelho["ultima_conexao"] for aparelho in content["data"]]
+    assert ultimas == sorted(ultimas, key=datetime.fromisoformat)
+
+
+def test_update_aparelho_ultima_conexao(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    aparelho = create_aparelho_seen_at(db, None)
+    r = client.patch(
+        f"{settings.API_V1_STR}/aparelhos/{aparelho.id}",
+        headers=superuser_token_headers,
+        json={"ultima_conexao": "2026-01-01T09:00:00-03:00"},
+    )
+    assert r.status_code == 200
+    assert datetime.fromisoformat(r.json()["ultima_conexao"]) == datetime(
+        2026, 1, 1, 12, tzinfo=timezone.utc
+    )
+
+
+def test_heartbeat_marks_aparelho_present(client: TestClient, db: Session) -> None:
+    controlador = create_random_controlador(db)
+    url = f"{settings.API_V1_STR}/aparelhos/{controlador.aparelho_id}/presenca"
+    r = client.get(url)
+    assert r.status_code == 200
+    assert r.json()["online"] is False
+
+    heartbeat = f"{settings.API_V1_STR}/controladores/{controlador.id}/heartbeat"
+    r = client.post(
+        heartbeat, headers=controlador_auth_headers(controlador, "POST", heartbeat)
+    )
+    assert r.status_code == 204
+    heartbeats.buffer.flush()
+
+    r = client.get(url)
+    assert r.json()["online"] is True
+    assert r.json()["ultima_conexao"] is not None
+    r = client.get(f"{settings.API_V1_STR}/aparelhos/online")
+    assert r.json()["count"] >= 1
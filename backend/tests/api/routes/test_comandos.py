@@ -0,0 +1,529 @@
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from unittest.mock import patch
+from urllib.parse import urlencode
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app import crud
+from app.core import events, signing
+from app.core.config import settings
+from app.core.db import engine
+from app.models import Controlador, Setor
+from tests.utils.comando import (
+    controlador_auth_headers,
+    create_random_comando,
+    create_random_controlador,
+    create_random_setor,
+)
+
+
+def wait_url(controlador: Controlador) -> str:
+    return f"{settings.API_V1_STR}/comandos/controlador/{controlador.id}/aguardar"
+
+
+def claim_url(controlador: Controlador) -> str:
+    return f"{settings.API_V1_STR}/comandos/controlador/{controlador.id}/reservar"
+
+
+ACK_URL = f"{settings.API_V1_STR}/comandos/confirmar"
+
+
+def with_query(url: str, query: str) -> str:
+    return f"{url}?{query}" if query else url
+
+
+def signed_get(
+    client: TestClient,
+    controlador: Controlador,
+    url: str,
+    params: dict[str, Any] | None = None,
+    **kwargs: Any,
+) -> Any:
+    query = urlencode(params or {})
+    headers = controlador_auth_headers(controlador, "GET", url, query=query)
+    return client.get(with_query(url, query), headers=headers, **kwargs)
+
+
+def signed_post(
+    client: TestClient,
+    controlador: Controlador,
+    url: str,
+    payload: Any = None,
+    params: dict[str, Any] | None = None,
+    headers: dict[str, str] | None = None,
+    **kwargs: Any,
+) -> Any:
+    query = urlencode(params or {})
+    body = json.dumps(payload).encode() if payload is not None else b""
+    headers = {
+        **(headers or {}),
+        **controlador_auth_headers(controlador, "POST", url, body, query=query),
+    }
+    if payload is not None:
+        headers["Content-Type"] = "application/json"
+    return client.post(with_query(url, query), headers=headers, content=body, **kwargs)
+
+
+def test_read_comandos_por_controlador(client: TestClient, db: Session) -> None:
+    controlador = create_random_controlador(db)
+    first = create_random_comando(db, controlador)
+    second = create_random_comando(db, controlador)
+    r = client.get(
+        f"{settings.API_V1_STR}/comandos/controlador/{controlador.id}",
+        params={"limit": 1},
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert content["count"] == 2
+    assert [c["id"] for c in content["data"]] == [str(first.id)]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/comandos/controlador/{controlador.id}",
+        params={"skip": 1},
+    )
+    assert [c["id"] for c in r.json()["data"]] == [str(second.id)]
+
+
+def test_wait_comandos_returns_pending_immediately(
+    client: TestClient, db: Session
+) -> None:
+    controlador = create_random_controlador(db)
+    comando = create_random_comando(db, controlador)
+    r = signed_get(client, controlador, wait_url(controlador), params={"timeout": 5})
+    assert r.status_code == 200
+    content = r.json()
+    assert content["count"] == 1
+    assert content["data"][0]["id"] == str(comando.id)
+
+
+def test_wait_comandos_times_out_empty(client: TestClient, db: Session) -> None:
+    controlador = create_random_controlador(db)
+    r = signed_get(client, controlador, wait_url(controlador), params={"timeout": 0.2})
+    assert r.status_code == 200
+    assert r.json() == {"data": [], "count": 0, "next_cursor": None}
+
+
+def test_wait_comandos_wakes_up_on_create(client: TestClient, db: Session) -> None:
+    controlador = create_random_controlador(db)
+    assert events.bus.ready.wait(timeout=5)
+
+    def create_later() -> None:
+        time.sleep(0.3)
+        client.post(
+            f"{settings.API_V1_STR}/comandos/",
+            json={
+                "controlador_id": str(controlador.id),
+                "comando": "abrir_valvula",
+                "param": "1",
+            },
+        )
+
+    producer = threading.Thread(target=create_later)
+    producer.start()
+    start = time.monotonic()
+    r = signed_get(client, controlador, wait_url(controlador), params={"timeout": 10})
+    elapsed = time.monotonic() - start
+    producer.join()
+    assert r.status_code == 200
+    content = r.json()
+    assert content["count"] == 1
+    assert content["data"][0]["comando"] == "abrir_valvula"
+    assert content["data"][0]["status"] == "pendente"
+    assert elapsed < 5
+
+
+def test_wait_comandos_rejects_timeout_above_max(
+    client: TestClient, db: Session
+) -> None:
+    controlador = create_random_controlador(db)
+    r = signed_get(
+        client,
+        controlador,
+        wait_url(controlador),
+        params={"timeout": settings.COMANDO_LONG_POLL_MAX_TIMEOUT_SECONDS + 1},
+    )
+    assert r.status_code == 422
+
+
+def test_wait_comandos_requires_signature(client: TestClient, db: Session) -> None:
+    controlador = create_random_controlador(db)
+    r = client.get(wait_url(controlador), params={"timeout": 0.2})
+    assert r.status_code == 401
+    assert r.json()["detail"] == "Missing signature"
+
+
+def test_signature_with_wrong_key_is_rejected(client: TestClient, db: Session) -> None:
+    controlador = create_random_controlador(db)
+    url = wait_url(controlador)
+    headers = controlador_auth_headers(controlador, "GET", url, key="wrong")
+    r = client.get(url, headers=headers, params={"timeout": 0.2})
+    assert r.status_code == 401
+    assert r.json()["detail"] == "Invalid signature"
+
+
+def test_unknown_controlador_is_only_loaded_once(client: TestClient) -> None:
+    forged = Controlador(
+        id=uuid.uuid4(), aparelho_id=uuid.uuid4(), assinatura="forjada"
+    )
+    url = claim_url(forged)
+    loads = signing.key_cache.loads
+    for _ in range(3):
+        r = client.post(url, headers=controlador_auth_headers(forged, "POST", url))
+        assert r.status_code == 401
+        assert r.json()["detail"] == "Unknown controlador"
+    assert signing.key_cache.loads == loads + 1
+
+
+def test_replayed_signature_is_rejected(client: TestClient, db: Session) -> None:
+    controlador = create_random_controlador(db)
+    url = claim_url(controlador)
+    headers = controlador_auth_headers(controlador, "POST", url)
+    r = client.post(url, headers=headers)
+    assert r.status_code == 200
+    r = client.post(url, headers=headers)
+    assert r.status_code == 401
+    assert r.json()["detail"] == "Signature already used"
+
+
+def test_expired_signature_is_rejected(client: TestClient, db: Session) -> None:
+    controlador = create_random_controlador(db)
+    url = claim_url(controlador)
+    headers = controlador_auth_headers(
+        controlador,
+        "POST",
+        url,
+        timestamp=int(time.time()) - settings.CONTROLADOR_SIGNATURE_MAX_AGE_SECONDS - 5,
+    )
+    r = client.post(url, headers=headers)
+    assert r.status_code == 401
+    assert r.json()["detail"] == "Signature expired"
+
+
+def test_signature_of_another_controlador_is_forbidden(
+    client: TestClient, db: Session
+) -> None:
+    controlador = create_random_controlador(db)
+    other = create_random_controlador(db)
+    url = claim_url(controlador)
+    r = client.post(url, headers=controlador_auth_headers(other, "POST", url))
+    assert r.status_code == 403
+
+
+def test_previous_key_is_accepted_during_rotation_grace(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    controlador = create_random_controlador(db)
+    old_key = controlador.assinatura
+    r = client.patch(
+        f"{settings.API_V1_STR}/controladores/{controlador.id}",
+        headers=superuser_token_headers,
+        json={"assinatura": "nova-assinatura"},
+    )
+    assert r.status_code == 200
+
+    url = claim_url(controlador)
+    for key in (old_key, "nova-assinatura"):
+        headers = controlador_auth_headers(controlador, "POST", url, key=key)
+        r = client.post(url, headers=headers)
+        assert r.status_code == 200
+
+    headers = controlador_auth_headers(controlador, "POST", url, key=old_key)
+    with patch("app.core.config.settings.CONTROLADOR_KEY_ROTATION_GRACE_SECONDS", -1):
+        r = client.post(url, headers=headers)
+    assert r.status_code == 401
+
+
+def test_claim_comandos(client: TestClient, db: Session) -> None:
+    controlador = create_random_controlador(db)
+    first = create_random_comando(db, controlador)
+    second = create_random_comando(db, controlador)
+    r = signed_post(client, controlador, claim_url(controlador), params={"limit": 1})
+    assert r.status_code == 200
+    content = r.json()
+    assert content["count"] == 1
+    assert content["data"][0]["id"] == str(first.id)
+    assert content["data"][0]["status"] == "reservado"
+    assert content["data"][0]["reserva_expira_em"]
+
+    r = signed_post(client, controlador, claim_url(controlador), params={"limit": 10})
+    content = r.json()
+    assert [c["id"] for c in content["data"]] == [str(second.id)]
+
+    r = signed_post(client, controlador, claim_url(controlador))
+    assert r.json() == {"data": [], "count": 0, "next_cursor": None}
+
+
+def test_claim_comandos_ignores_idempotency_key(
+    client: TestClient, db: Session
+) -> None:
+    controlador = create_random_controlador(db)
+    first = create_random_comando(db, controlador)
+    second = create_random_comando(db, controlador)
+    headers = {"Idempotency-Key": "reservar"}
+    params = {"limit": 1}
+
+    claims = [
+        signed_post(
+            client, controlador, claim_url(controlador), params=params, headers=headers
+        )
+        for _ in range(2)
+    ]
+    assert all("idempotent-replayed" not in r.headers for r in claims)
+    assert [r.json()["data"][0]["id"] for r in claims] == [
+        str(first.id),
+        str(second.id),
+    ]
+
+
+def test_claim_comandos_rejects_altered_query(client: TestClient, db: Session) -> None:
+    controlador = create_random_controlador(db)
+    url = claim_url(controlador)
+    headers = controlador_auth_headers(controlador, "POST", url, query="limit=1")
+    r = client.post(with_query(url, "limit=100"), headers=headers)
+    assert r.status_code == 401
+
+
+def test_claim_comandos_expired_lease_is_claimable_again(
+    client: TestClient, db: Session
+) -> None:
+    controlador = create_random_controlador(db)
+    comando = create_random_comando(db, controlador)
+    with patch("app.core.config.settings.COMANDO_LEASE_SECONDS", -1):
+        r = signed_post(client, controlador, claim_url(controlador))
+    assert r.json()["count"] == 1
+
+    r = signed_post(client, controlador, claim_url(controlador))
+    content = r.json()
+    assert content["count"] == 1
+    assert content["data"][0]["id"] == str(comando.id)
+
+
+def test_claim_comandos_skips_locked_rows(db: Session) -> None:
+    controlador = create_random_controlador(db)
+    for _ in range(4):
+        create_random_comando(db, controlador)
+
+    with Session(engine) as first, Session(engine) as second:
+        claimed_first = crud.claim_comandos(
+            session=first, controlador_id=controlador.id, limit=2, lease_seconds=60
+        )
+        # The first claim is still uncommitted; the second must not block on it
+        claimed_second = crud.claim_comandos(
+            session=second, controlador_id=controlador.id, limit=4, lease_seconds=60
+        )
+        first.commit()
+        second.commit()
+
+    assert len(claimed_first) == 2
+    assert len(claimed_second) == 2
+    assert not {c.id for c in claimed_first} & {c.id for c in claimed_second}
+
+
+def test_acknowledge_comandos(client: TestClient, db: Session) -> None:
+    controlador = create_random_controlador(db)
+    executed = create_random_comando(db, controlador)
+    failed = create_random_comando(db, controlador)
+    missing = uuid.uuid4()
+    r = signed_post(
+        client,
+        controlador,
+        ACK_URL,
+        [
+            {
+                "id": str(executed.id),
+                "status": "executado",
+                "timestamp_executado": "2026-01-01T12:00:00Z",
+            },
+            {"id": str(failed.id), "status": "falhou"},
+            {"id": str(missing), "status": "executado"},
+        ],
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert content["count"] == 2
+    assert content["data"] == [
+        {"id": str(executed.id), "updated": True},
+        {"id": str(failed.id), "updated": True},
+        {"id": str(missing), "updated": False},
+    ]
+
+    db.refresh(executed)
+    db.refresh(failed)
+    assert executed.status == "executado"
+    assert executed.timestamp_executado is not None
+    assert failed.status == "falhou"
+    assert failed.timestamp_executado is None
+
+
+def test_acknowledge_comandos_of_another_controlador(
+    client: TestClient, db: Session
+) -> None:
+    controlador = create_random_controlador(db)
+    other = create_random_controlador(db)
+    comando = create_random_comando(db, other)
+    r = signed_post(
+        client,
+        controlador,
+        ACK_URL,
+        [{"id": str(comando.id), "status": "executado"}],
+    )
+    assert r.status_code == 200
+    assert r.json()["data"] == [{"id": str(comando.id), "updated": False}]
+
+    db.refresh(comando)
+    assert comando.status == "pendente"
+
+
+def test_acknowledge_comandos_only_updates_waiting_comandos(
+    client: TestClient, db: Session
+) -> None:
+    controlador = create_random_controlador(db)
+    expired = create_random_comando(db, controlador)
+    expired.status = "expirado"
+    db.add(expired)
+    db.commit()
+    r = signed_post(
+        client,
+        controlador,
+        ACK_URL,
+        [{"id": str(expired.id), "status": "executado"}],
+    )
+    assert r.status_code == 200
+    assert r.json()["data"] == [{"id": str(expired.id), "updated": False}]
+    db.refresh(expired)
+    assert expired.status == "expirado"
+
+    # Only final statuses can be reported
+    r = signed_post(
+        client,
+        controlador,
+        ACK_URL,
+        [{"id": str(expired.id), "status": "pendente"}],
+    )
+    assert r.status_code == 422
+
+
+def test_acknowledge_comandos_requires_signature(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        ACK_URL,
+        headers=superuser_token_headers,
+        json=[{"id": str(uuid.uuid4()), "status": "executado"}],
+    )
+    assert r.status_code == 401
+
+
+BROADCAST_URL = f"{settings.API_V1_STR}/comandos/difundir"
+
+
+def test_broadcast_comando_to_setor(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    setor = create_random_setor(db)
+    controladores = [create_random_controlador(db, setor) for _ in range(3)]
+    elsewhere = create_random_controlador(db)
+
+    r = client.post(
+        BROADCAST_URL,
+        headers=superuser_token_headers,
+        json={"setor_id": str(setor.id), "comando": "fechar", "param": "todas"},
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert content["count"] == 3
+    assert {c["controlador_id"] for c in content["data"]} == {
+        str(controlador.id) for controlador in controladores
+    }
+    assert all(c["status"] == "pendente" for c in content["data"])
+    assert crud.get_pending_comandos(session=db, controlador_id=elsewhere.id) == []
+    pending = crud.get_pending_comandos(session=db, controlador_id=controladores[0].id)
+    assert [comando.comando for comando in pending] == ["fechar"]
+
+
+def test_broadcast_comando_to_agricultor(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    setor = create_random_setor(db)
+    other_setor = Setor(nome="outro", agricultor_id=setor.agricultor_id)
+    db.add(other_setor)
+    db.commit()
+    controladores = [
+        create_random_controlador(db, setor),
+        create_random_controlador(db, other_setor),
+    ]
+
+    r = client.post(
+        BROADCAST_URL,
+        headers=superuser_token_headers,
+        json={
+            "agricultor_id": str(setor.agricultor_id),
+            "comando": "fechar",
+            "param": "todas",
+        },
+    )
+    assert r.status_code == 200
+    assert {c["controlador_id"] for c in r.json()["data"]} == {
+        str(controlador.id) for controlador in controladores
+    }
+
+
+def test_broadcast_comando_needs_one_target(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    setor = create_random_setor(db)
+    for target in (
+        {},
+        {"setor_id": str(setor.id), "agricultor_id": str(setor.agricultor_id)},
+    ):
+        r = client.post(
+            BROADCAST_URL,
+            headers=superuser_token_headers,
+            json={**target, "comando": "fechar", "param": "todas"},
+        )
+        assert r.status_code == 400
+
+
+def test_create_comando_retry_is_not_queued_twice(
+    client: TestClient, db: Session
+) -> None:
+    controlador = create_random_controlador(db)
+    data = {"controlador_id": str(controlador.id), "comando": "abrir", "param": "1"}
+    ids = [
+        client.post(f"{settings.API_V1_STR}/comandos/", json=data).json()["id"]
+        for _ in range(2)
+    ]
+    assert ids[0] == ids[1]
+    pending = crud.get_pending_comandos(session=db, controlador_id=controlador.id)
+    assert [str(comando.id) for comando in pending] == ids[:1]
+
+
+def test_broadcast_scheduled_comando(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    setor = create_random_setor(db)
+    controlador = create_random_controlador(db, setor)
+    due = datetime.now(timezone.utc) + timedelta(hours=1)
+
+    r = client.post(
+        BROADCAST_URL,
+        headers=superuser_token_headers,
+        json={
+            "setor_id": str(setor.id),
+            "comando": "abrir_valvula",
+            "param": "1",
+            "agendado_para": due.isoformat(),
+        },
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert [c["status"] for c in content["data"]] == ["agendado"]
+    assert datetime.fromisoformat(content["data"][0]["agendado_para"]) == due
+    # Not visible to the controlador until it comes due
+    assert crud.get_pending_comandos(session=db, controlador_id=controlador.id) == []
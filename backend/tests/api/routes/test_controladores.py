@@ -0,0 +1,103 @@
+import json
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app import crud
+from app.core import heartbeats
+from app.core.cache import entity_cache
+from app.core.config import settings
+from app.models import Aparelho, AparelhoPublic, Controlador
+from tests.core.test_cache import DictBackend
+from tests.utils.comando import controlador_auth_headers, create_random_controlador
+
+
+def heartbeat_url(controlador: Controlador) -> str:
+    return f"{settings.API_V1_STR}/controladores/{controlador.id}/heartbeat"
+
+
+def send_heartbeat(
+    client: TestClient, controlador: Controlador, status: str | None = None
+) -> int:
+    url = heartbeat_url(controlador)
+    body = json.dumps({"status": status}).encode() if status is not None else b""
+    headers = controlador_auth_headers(controlador, "POST", url, body)
+    if body:
+        headers["Content-Type"] = "application/json"
+    r = client.post(url, headers=headers, content=body)
+    return r.status_code
+
+
+def test_heartbeats_update_aparelhos_on_flush(client: TestClient, db: Session) -> None:
+    first = create_random_controlador(db)
+    second = create_random_controlador(db)
+
+    assert send_heartbeat(client, first, "manutencao") == 204
+    assert send_heartbeat(client, second) == 204
+    assert send_heartbeat(client, first, "online") == 204
+    # Also flushed by the buffer's own thread every HEARTBEAT_FLUSH_SECONDS
+    heartbeats.buffer.flush()
+
+    for controlador, status in ((first, "online"), (second, "online")):
+        aparelho = db.get(Aparelho, controlador.aparelho_id)
+        assert aparelho
+        db.refresh(aparelho)
+        assert aparelho.status == status
+        assert aparelho.ultima_conexao is not None
+
+
+def test_heartbeat_flush_clears_shared_cache(client: TestClient, db: Session) -> None:
+    controlador = create_random_controlador(db)
+    key = entity_cache.key("aparelho", controlador.aparelho_id)
+    with patch.object(entity_cache, "shared", DictBackend()):
+        entity_cache.get_or_load(
+            AparelhoPublic,
+            "aparelho",
+            controlador.aparelho_id,
+            lambda: db.get(Aparelho, controlador.aparelho_id),
+        )
+        assert entity_cache.shared.get(key) is not None
+
+        assert send_heartbeat(client, controlador, "manutencao") == 204
+        heartbeats.buffer.flush()
+        assert entity_cache.local.get(key) is None
+        assert entity_cache.shared.get(key) is None
+
+
+def test_heartbeat_requires_signature(client: TestClient, db: Session) -> None:
+    controlador = create_random_controlador(db)
+    r = client.post(heartbeat_url(controlador))
+    assert r.status_code == 401
+
+
+def test_read_controlador_does_not_expose_assinatura(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    controlador = create_random_controlador(db)
+    r = client.get(
+        f"{settings.API_V1_STR}/controladores/{controlador.id}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    assert r.json()["id"] == str(controlador.id)
+    assert "assinatura" not in r.json()
+
+
+def test_older_heartbeat_does_not_overwrite_newer(db: Session) -> None:
+    controlador = create_random_controlador(db)
+    newer = datetime(2026, 1, 1, 12, 0, 5, tzinfo=timezone.utc)
+    older = datetime(2026, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+    crud.record_heartbeats(session=db, heartbeats=[(controlador.id, "online", newer)])
+    updated = crud.record_heartbeats(
+        session=db, heartbeats=[(controlador.id, "offline", older)]
+    )
+    db.commit()
+    assert updated == []
+
+    aparelho = db.get(Aparelho, controlador.aparelho_id)
+    assert aparelho
+    db.refresh(aparelho)
+    assert aparelho.ultima_conexao == newer
+    assert aparelho.status == "online"
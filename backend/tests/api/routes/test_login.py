@@ -1,12 +1,14 @@
 from unittest.mock import patch
 
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from passlib.context import CryptContext
+from sqlmodel import Session, select
 
+from app.core import security
 from app.core.config import settings
 from app.core.security import verify_password
 from app.crud import create_user
-from app.models import UserCreate
+from app.models import EmailOutbox, UserCreate
 from app.utils import generate_password_reset_token
 from tests.utils.user import user_authentication_headers
 from tests.utils.utils import random_email, random_lower_string
@@ -46,7 +48,7 @@ def test_use_access_token(
 
 
 def test_recovery_password(
-    client: TestClient, normal_user_token_headers: dict[str, str]
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
 ) -> None:
     with (
         patch("app.core.config.settings.SMTP_HOST", "smtp.example.com"),
@@ -59,6 +61,9 @@ def test_recovery_password(
         )
         assert r.status_code == 200
         assert r.json() == {"message": "Password recovery email sent"}
+        queued = db.exec(select(EmailOutbox).where(EmailOutbox.email_to == email)).all()
+        assert len(queued) == 1
+        assert "Password recovery" in queued[0].subject
 
 
 def test_recovery_password_user_not_exits(
@@ -116,3 +121,41 @@ def test_reset_password_invalid_token(
     assert "detail" in response
     assert r.status_code == 400
     assert response["detail"] == "Invalid token"
+
+
+def test_login_rehashes_password_with_other_cost_factor(
+    client: TestClient, db: Session
+) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user = create_user(
+        session=db, user_create=UserCreate(email=email, password=password)
+    )
+    user.hashed_password = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash(
+        password
+    )
+    db.add(user)
+    db.commit()
+
+    r = client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={"username": email, "password": password},
+    )
+    assert r.status_code == 200
+
+    db.refresh(user)
+    assert not user.hashed_password.startswith("$2b$04$")
+    assert verify_password(password, user.hashed_password)
+
+
+def test_login_returns_503_when_password_pool_is_full(client: TestClient) -> None:
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    with patch.object(
+        security.password_pool, "submit", side_effect=security.PasswordPoolFull
+    ):
+        r = client.post(f"{settings.API_V1_STR}/login/access-token", data=login_data)
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
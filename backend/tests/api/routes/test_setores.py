@@ -0,0 +1,136 @@
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import Session, col, func, select
+
+from app.core.cache import entity_cache
+from app.core.config import settings
+from app.models import Setor
+from tests.utils.comando import create_random_setor
+
+
+def test_read_setor_is_cached(client: TestClient, db: Session) -> None:
+    setor = create_random_setor(db)
+    hits = entity_cache.local.hits
+
+    for _ in range(2):
+        r = client.get(f"{settings.API_V1_STR}/setores/{setor.id}")
+        assert r.status_code == 200
+        assert r.json()["nome"] == setor.nome
+    assert entity_cache.local.hits == hits + 1
+
+
+def test_update_setor_invalidates_cache(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    setor = create_random_setor(db)
+    r = client.get(f"{settings.API_V1_STR}/setores/{setor.id}")
+    assert r.status_code == 200
+
+    r = client.patch(
+        f"{settings.API_V1_STR}/setores/{setor.id}",
+        headers=superuser_token_headers,
+        json={"nome": "Setor atualizado"},
+    )
+    assert r.status_code == 200
+    r = client.get(f"{settings.API_V1_STR}/setores/{setor.id}")
+    assert r.json()["nome"] == "Setor atualizado"
+
+
+def test_delete_setor_invalidates_cache(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    setor = create_random_setor(db)
+    r = client.get(f"{settings.API_V1_STR}/setores/{setor.id}")
+    assert r.status_code == 200
+
+    r = client.delete(
+        f"{settings.API_V1_STR}/setores/{setor.id}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    r = client.get(f"{settings.API_V1_STR}/setores/{setor.id}")
+    assert r.status_code == 404
+
+
+def test_read_metrics(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/metrics/", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    assert {"hits", "misses", "evictions"} <= r.json()["entity_cache"].keys()
+
+
+def test_list_reads_replica_until_user_writes(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    setor = create_random_setor(db)
+    # A second engine on the same database stands in for the replica
+    replica = create_async_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI), poolclass=NullPool
+    )
+    replica_connects = []
+    event.listen(
+        replica.sync_engine, "connect", lambda *_args: replica_connects.append(1)
+    )
+    with (
+        patch("app.core.db.async_replica_engine", replica),
+        patch("app.core.config.settings.POSTGRES_REPLICA_SERVER", "replica"),
+    ):
+        r = client.get(
+            f"{settings.API_V1_STR}/setores/", headers=superuser_token_headers
+        )
+        assert r.status_code == 200
+        assert len(replica_connects) == 1
+
+        r = client.patch(
+            f"{settings.API_V1_STR}/setores/{setor.id}",
+            headers=superuser_token_headers,
+            json={"nome": "Setor escrito"},
+        )
+        assert r.status_code == 200
+
+        # The user who wrote reads from the primary, anyone else from the replica
+        r = client.get(
+            f"{settings.API_V1_STR}/setores/", headers=superuser_token_headers
+        )
+        assert r.status_code == 200
+        assert len(replica_connects) == 1
+        r = client.get(f"{settings.API_V1_STR}/setores/")
+        assert r.status_code == 200
+        assert len(replica_connects) == 2
+
+
+def test_create_setor_replays_idempotency_key(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    agricultor_id = create_random_setor(db).agricultor_id
+    headers = {**superuser_token_headers, "Idempotency-Key": "criar-setor-1"}
+    data = {"nome": "Setor idempotente", "agricultor_id": str(agricultor_id)}
+
+    first = client.post(f"{settings.API_V1_STR}/setores/", headers=headers, json=data)
+    assert first.status_code == 200
+    assert "idempotent-replayed" not in first.headers
+    retry = client.post(f"{settings.API_V1_STR}/setores/", headers=headers, json=data)
+    assert retry.status_code == 200
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.json() == first.json()
+    count = db.exec(
+        select(func.count())
+        .select_from(Setor)
+        .where(col(Setor.agricultor_id) == agricultor_id)
+    ).one()
+    # The one from create_random_setor and the idempotent one
+    assert count == 2
+
+    r = client.post(
+        f"{settings.API_V1_STR}/setores/",
+        headers=headers,
+        json={**data, "nome": "Outro setor"},
+    )
+    assert r.status_code == 422
@@ -7,7 +7,16 @@ from sqlmodel import Session, delete
 from app.core.config import settings
 from app.core.db import engine, init_db
 from app.main import app
-from app.models import User
+from app.models import (
+    Agricultor,
+    Aparelho,
+    Comando,
+    Controlador,
+    EmailOutbox,
+    IdempotencyKey,
+    Setor,
+    User,
+)
 from tests.utils.user import authentication_token_from_email
 from tests.utils.utils import get_superuser_token_headers
 
@@ -17,8 +26,18 @@ def db() -> Generator[Session, None, None]:
     with Session(engine) as session:
         init_db(session)
         yield session
-        statement = delete(User)
-        session.execute(statement)
+        for model in (
+            EmailOutbox,
+            IdempotencyKey,
+            Comando,
+            Controlador,
+            Aparelho,
+            Setor,
+            Agricultor,
+            User,
+        ):
+            statement = delete(model)
+            session.execute(statement)
         session.commit()
 
 
@@ -0,0 +1,123 @@
+import time
+import uuid
+
+from app.core.cache import EntityCache, LRUCache
+from app.models import SetorPublic
+
+
+class DictBackend:
+    """Local stand-in for the shared (Redis) backend."""
+
+    def __init__(self) -> None:
+        self.data: dict[str, str] = {}
+
+    def get(self, key: str) -> str | None:
+        return self.data.get(key)
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        self.data[key] = value
+
+    def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.data.pop(key, None)
+
+
+class FailingBackend:
+    def get(self, key: str) -> str | None:
+        raise ConnectionError(key)
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        raise ConnectionError(key)
+
+    def delete(self, *keys: str) -> None:
+        raise ConnectionError(keys)
+
+
+def random_setor() -> SetorPublic:
+    return SetorPublic(id=uuid.uuid4(), nome="setor", agricultor_id=uuid.uuid4())
+
+
+def test_lru_cache_evicts_least_recently_used() -> None:
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+
+
+def test_lru_cache_expires_entries() -> None:
+    cache = LRUCache(maxsize=10, ttl=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_entity_cache_reads_through_once() -> None:
+    cache = EntityCache(LRUCache(maxsize=10, ttl=60))
+    setor = random_setor()
+    calls = 0
+
+    def loader() -> SetorPublic:
+        nonlocal calls
+        calls += 1
+        return setor
+
+    for _ in range(3):
+        assert cache.get_or_load(SetorPublic, "setor", setor.id, loader) == setor
+    assert calls == 1
+
+    cache.invalidate("setor", setor.id)
+    assert cache.get_or_load(SetorPublic, "setor", setor.id, loader) == setor
+    assert calls == 2
+
+
+def test_entity_cache_does_not_cache_missing_rows() -> None:
+    cache = EntityCache(LRUCache(maxsize=10, ttl=60))
+    id = uuid.uuid4()
+    assert cache.get_or_load(SetorPublic, "setor", id, lambda: None) is None
+    assert cache.local.stats()["size"] == 0
+
+
+def test_entity_cache_shared_backend() -> None:
+    shared = DictBackend()
+    setor = random_setor()
+    first = EntityCache(LRUCache(maxsize=10, ttl=60), shared)
+    second = EntityCache(LRUCache(maxsize=10, ttl=60), shared)
+
+    first.get_or_load(SetorPublic, "setor", setor.id, lambda: setor)
+    loaded = second.get_or_load(SetorPublic, "setor", setor.id, lambda: None)
+    assert loaded == setor
+    assert second.shared_hits == 1
+
+    second.invalidate("setor", setor.id)
+    assert shared.data == {}
+
+
+def test_entity_cache_invalidates_batches() -> None:
+    shared = DictBackend()
+    cache = EntityCache(LRUCache(maxsize=10, ttl=60), shared)
+    setores = [random_setor() for _ in range(3)]
+    for setor in setores:
+        cache.get_or_load(SetorPublic, "setor", setor.id, lambda setor=setor: setor)
+
+    cache.invalidate_many("setor", [setor.id for setor in setores[:2]])
+    assert list(shared.data) == [cache.key("setor", setores[2].id)]
+    assert cache.local.stats()["size"] == 1
+
+
+def test_entity_cache_survives_shared_backend_errors() -> None:
+    cache = EntityCache(LRUCache(maxsize=10, ttl=60), FailingBackend())
+    setor = random_setor()
+    assert cache.get_or_load(SetorPublic, "setor", setor.id, lambda: setor) == setor
+    cache.invalidate("setor", setor.id)
+    assert cache.stats()["shared_errors"] == 3
@@ -0,0 +1,59 @@
+import uuid
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine, exc
+
+from app.core.db import (
+    TimedQueuePool,
+    async_engine,
+    async_read_engine,
+    engine_options,
+    pool_stats,
+    recent_writers,
+)
+
+
+def test_pool_stats_count_waits_and_timeouts() -> None:
+    pool_engine = create_engine(
+        "sqlite://",
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    connection = pool_engine.connect()
+    with pytest.raises(exc.TimeoutError):
+        pool_engine.connect()
+
+    stats = pool_stats(pool_engine.pool)
+    assert stats["checked_out"] == 1
+    assert stats["saturation"] == 1.0
+    assert stats["checkouts"] == 1
+    assert stats["timeouts"] == 1
+    assert stats["max_wait_seconds"] >= 0.1
+
+    connection.close()
+    pool_engine.dispose()
+    # Counters survive the pool being replaced
+    stats = pool_stats(pool_engine.pool)
+    assert stats["checked_out"] == 0
+    assert stats["timeouts"] == 1
+
+
+def test_engine_options_pgbouncer_disables_prepared_statements() -> None:
+    assert "connect_args" not in engine_options()
+    with patch("app.core.config.settings.DB_PGBOUNCER", True):
+        assert engine_options()["connect_args"] == {"prepare_threshold": None}
+
+
+def test_async_read_engine_keeps_recent_writers_on_primary() -> None:
+    replica = object()
+    writer = str(uuid.uuid4())
+    with patch("app.core.db.async_replica_engine", replica):
+        assert async_read_engine(None) is replica
+        assert async_read_engine(writer) is replica
+        recent_writers.set(writer, True)
+        assert async_read_engine(writer) is async_engine
+        assert async_read_engine(str(uuid.uuid4())) is replica
+    recent_writers.delete(writer)
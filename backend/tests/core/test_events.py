@@ -0,0 +1,105 @@
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, func, select
+
+from app.core import events
+from app.core.cache import entity_cache
+from app.core.config import settings
+from app.core.db import recent_writers
+from tests.utils.comando import create_random_setor
+
+
+def test_event_encode_decode_roundtrip() -> None:
+    event = events.Event(
+        table="comando",
+        op=events.CREATED,
+        id=str(uuid.uuid4()),
+        ts=time.time(),
+        key=str(uuid.uuid4()),
+    )
+    decoded = events.Event.decode(event.encode())
+    assert decoded.table == event.table
+    assert decoded.op == event.op
+    assert decoded.id == event.id
+    assert decoded.key == event.key
+    assert abs(decoded.ts - event.ts) < 0.001
+
+
+def test_dispatch_routes_by_table_and_reports_lag() -> None:
+    bus = events.EventBus()
+    received: list[events.Event] = []
+    bus.subscribe("setor", received.append)
+
+    setor_event = events.Event(
+        table="setor", op=events.UPDATED, id=str(uuid.uuid4()), ts=time.time() - 2
+    )
+    bus._dispatch(setor_event.encode())
+    bus._dispatch(
+        events.Event(
+            table="aparelho", op=events.UPDATED, id=str(uuid.uuid4()), ts=time.time()
+        ).encode()
+    )
+
+    assert received == [events.Event.decode(setor_event.encode())]
+    stats = bus.stats()
+    assert stats["received"] == 2
+    assert stats["max_lag_seconds"] > 1.9
+
+
+def test_dispatch_survives_bad_payloads_and_subscribers() -> None:
+    bus = events.EventBus()
+
+    def fail(event: events.Event) -> None:
+        raise RuntimeError(event.id)
+
+    bus.subscribe("setor", fail)
+    bus._dispatch("not json")
+    bus._dispatch(
+        events.Event(
+            table="setor", op=events.DELETED, id=str(uuid.uuid4()), ts=time.time()
+        ).encode()
+    )
+    assert bus.received == 1
+    assert bus.dispatch_errors == 1
+
+
+def test_published_write_invalidates_cache_of_every_worker(
+    client: TestClient, db: Session
+) -> None:
+    assert events.bus.ready.wait(timeout=5)
+    setor = create_random_setor(db)
+    r = client.get(f"{settings.API_V1_STR}/setores/{setor.id}")
+    assert r.status_code == 200
+    key = entity_cache.key("setor", setor.id)
+    assert entity_cache.local.get(key) is not None
+
+    # A write made elsewhere, e.g. by another worker: only the bus can tell us
+    setor.nome = "Setor alterado"
+    db.add(setor)
+    events.publish(db, "setor", events.UPDATED, setor.id)
+    db.commit()
+
+    deadline = time.monotonic() + 5
+    while entity_cache.local.get(key) is not None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    r = client.get(f"{settings.API_V1_STR}/setores/{setor.id}")
+    assert r.json()["nome"] == "Setor alterado"
+
+
+def test_writer_announced_by_another_worker_reads_from_primary(db: Session) -> None:
+    assert events.bus.ready.wait(timeout=5)
+    sub = str(uuid.uuid4())
+
+    # What events.notify() sends from the worker that took the write
+    payload = events.Event(
+        table=events.WRITER, op=events.UPDATED, id=sub, ts=time.time()
+    ).encode()
+    db.exec(select(func.pg_notify(events.CHANNEL, payload)))
+    db.commit()
+
+    deadline = time.monotonic() + 5
+    while recent_writers.get(sub) is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert recent_writers.get(sub) is not None
@@ -0,0 +1,51 @@
+import time
+from collections.abc import Callable
+
+import pytest
+
+from app.core.leader import LeaderJob, Leadership, lock_key
+
+
+def wait_for(condition: Callable[[], bool], timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_lock_key_is_stable() -> None:
+    assert lock_key("api-irriga-leader") == lock_key("api-irriga-leader")
+    assert lock_key("api-irriga-leader") != lock_key("outro")
+    assert -(2**63) <= lock_key("api-irriga-leader") < 2**63
+
+
+def test_leader_job_without_run_once_fails_when_created() -> None:
+    class Incomplete(LeaderJob):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete(  # type: ignore[abstract]
+            leadership=Leadership("test-incomplete"), interval_seconds=60
+        )
+
+
+def test_one_leader_and_failover() -> None:
+    name = f"test-leader-{time.time()}"
+    first = Leadership(name, retry_seconds=0.1, check_seconds=0.1)
+    second = Leadership(name, retry_seconds=0.1, check_seconds=0.1)
+    first.start()
+    try:
+        assert wait_for(lambda: first.is_leader)
+        second.start()
+        time.sleep(0.5)
+        assert not second.is_leader
+
+        first.stop()
+        assert not first.is_leader
+        assert wait_for(lambda: second.is_leader)
+        assert second.elected == 1
+    finally:
+        first.stop()
+        second.stop()
@@ -0,0 +1,136 @@
+import socket
+from collections.abc import Generator
+from datetime import datetime, timezone
+from typing import Any
+from unittest.mock import patch
+
+import pytest
+from sqlmodel import Session, col, select
+
+from app.core.outbox import EmailDispatcher
+from app.models import EmailOutbox
+from app.utils import queue_email
+from tests.utils.utils import random_email
+
+controller = pytest.importorskip("aiosmtpd.controller")
+
+
+class Inbox:
+    """aiosmtpd handler keeping what it receives, and the sessions it came in."""
+
+    def __init__(self) -> None:
+        self.messages: list[tuple[list[str], bytes]] = []
+        self.sessions: set[int] = set()
+
+    async def handle_DATA(self, _server: Any, session: Any, envelope: Any) -> str:
+        self.messages.append((envelope.rcpt_tos, envelope.content))
+        self.sessions.add(id(session))
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def smtp_settings(port: int) -> Any:
+    return patch.multiple(
+        "app.core.config.settings",
+        SMTP_HOST="127.0.0.1",
+        SMTP_PORT=port,
+        SMTP_TLS=False,
+        SMTP_SSL=False,
+        SMTP_USER=None,
+        EMAILS_FROM_EMAIL="noreply@example.com",
+    )
+
+
+@pytest.fixture()
+def smtp_server() -> Generator[tuple[Inbox, int], None, None]:
+    inbox = Inbox()
+    port = free_port()
+    server = controller.Controller(inbox, hostname="127.0.0.1", port=port)
+    server.start()
+    with smtp_settings(port):
+        yield inbox, port
+    server.stop()
+
+
+def new_dispatcher(**kwargs: Any) -> EmailDispatcher:
+    options: dict[str, Any] = {
+        "batch_size": 50,
+        "poll_seconds": 0.1,
+        "max_attempts": 3,
+        "retry_base_seconds": 30,
+        "idle_seconds": 30,
+        "timeout": 2,
+    }
+    return EmailDispatcher(**{**options, **kwargs})
+
+
+def queued(db: Session, email_to: str) -> list[EmailOutbox]:
+    db.expire_all()
+    return list(
+        db.exec(select(EmailOutbox).where(col(EmailOutbox.email_to) == email_to)).all()
+    )
+
+
+def test_batch_is_sent_over_one_connection(
+    db: Session, smtp_server: tuple[Inbox, int]
+) -> None:
+    inbox, _port = smtp_server
+    email_to = random_email()
+    for n in range(3):
+        queue_email(
+            session=db, email_to=email_to, subject=f"Email {n}", html_content="<p/>"
+        )
+
+    dispatcher = new_dispatcher()
+    try:
+        while dispatcher.dispatch():
+            pass
+        queue_email(session=db, email_to=email_to, subject="Later", html_content="")
+        dispatcher.dispatch()
+    finally:
+        dispatcher.close()
+
+    received = [content for rcpt, content in inbox.messages if rcpt == [email_to]]
+    assert len(received) == 4
+    # The connection stays open between batches
+    assert dispatcher.connections == 1
+    assert len(inbox.sessions) == 1
+    rows = queued(db, email_to)
+    assert {row.status for row in rows} == {"enviado"}
+    assert all(row.sent_at is not None for row in rows)
+    # Sent content isn't kept
+    assert all(row.html_content is None for row in rows)
+
+
+def test_unreachable_server_is_retried_with_backoff(db: Session) -> None:
+    email_to = random_email()
+    with smtp_settings(free_port()):
+        queue_email(session=db, email_to=email_to, subject="Retry", html_content="")
+        dispatcher = new_dispatcher()
+        assert dispatcher.dispatch() >= 1
+
+    [row] = queued(db, email_to)
+    assert row.status == "pendente"
+    assert row.attempts == 1
+    assert row.last_error
+    next_attempt_at = row.next_attempt_at.replace(tzinfo=timezone.utc)
+    assert (next_attempt_at - datetime.now(timezone.utc)).total_seconds() > 20
+    assert dispatcher.retried >= 1
+
+
+def test_gives_up_after_max_attempts(db: Session) -> None:
+    email_to = random_email()
+    with smtp_settings(free_port()):
+        queue_email(session=db, email_to=email_to, subject="Fail", html_content="")
+        dispatcher = new_dispatcher(max_attempts=1)
+        dispatcher.dispatch()
+
+    [row] = queued(db, email_to)
+    assert row.status == "falhou"
+    assert row.attempts == 1
+    assert row.html_content is None
@@ -0,0 +1,102 @@
+import uuid
+from collections.abc import Callable, Generator
+from pathlib import Path
+
+import pytest
+
+from app.core.presence import PresenceTable
+
+NOW = 1_800_000_000.0
+
+
+@pytest.fixture()
+def make_table(
+    tmp_path: Path,
+) -> Generator[Callable[..., PresenceTable], None, None]:
+    tables: list[PresenceTable] = []
+
+    def make(**kwargs: object) -> PresenceTable:
+        options: dict[str, object] = {
+            "path": str(tmp_path / "presence"),
+            "snapshot_path": str(tmp_path / "presence.snapshot"),
+            "max_aparelhos": 100,
+            "window_seconds": 60,
+            "snapshot_seconds": 60.0,
+        }
+        options.update(kwargs)
+        table = PresenceTable(**options)  # type: ignore[arg-type]
+        tables.append(table)
+        return table
+
+    yield make
+    for table in tables:
+        table.close()
+
+
+def test_touch_and_lookup(make_table: Callable[..., PresenceTable]) -> None:
+    table = make_table()
+    aparelho_id = uuid.uuid4()
+    assert table.last_seen(aparelho_id) is None
+
+    table.touch_many([(aparelho_id, NOW - 5)], now=NOW)
+    assert table.last_seen(aparelho_id) == NOW - 5
+    assert table.is_online(aparelho_id, now=NOW)
+    assert not table.is_online(aparelho_id, now=NOW + 60)
+
+    # An older report doesn't move it back
+    table.touch_many([(aparelho_id, NOW - 30)], now=NOW)
+    assert table.last_seen(aparelho_id) == NOW - 5
+
+
+def test_count_expires_with_the_window(
+    make_table: Callable[..., PresenceTable],
+) -> None:
+    table = make_table()
+    first, second = uuid.uuid4(), uuid.uuid4()
+    table.touch_many([(first, NOW - 50), (second, NOW)], now=NOW)
+    assert table.count(now=NOW) == 2
+
+    # Seen again: moves to another bucket instead of counting twice
+    table.touch_many([(first, NOW + 5)], now=NOW + 5)
+    assert table.count(now=NOW + 5) == 2
+    assert table.count(now=NOW + 61) == 1
+    assert table.count(now=NOW + 66) == 0
+    # Long after a full turn of the wheel
+    table.touch_many([(first, NOW + 1000)], now=NOW + 1000)
+    assert table.count(now=NOW + 1000) == 1
+
+
+def test_shared_between_workers(make_table: Callable[..., PresenceTable]) -> None:
+    worker, other_worker = make_table(), make_table()
+    aparelho_id = uuid.uuid4()
+    worker.touch_many([(aparelho_id, NOW)], now=NOW)
+
+    assert other_worker.last_seen(aparelho_id) == NOW
+    assert other_worker.count(now=NOW) == 1
+
+
+def test_restart_restores_snapshot(
+    make_table: Callable[..., PresenceTable], tmp_path: Path
+) -> None:
+    table = make_table()
+    aparelho_id = uuid.uuid4()
+    table.touch(aparelho_id)
+    table.snapshot()
+    table.close()
+    (tmp_path / "presence").unlink()
+
+    restarted = make_table(max_aparelhos=1000)
+    assert restarted.last_seen(aparelho_id) is not None
+    assert restarted.count() == 1
+
+
+def test_full_table_ignores_new_aparelhos(
+    make_table: Callable[..., PresenceTable],
+) -> None:
+    table = make_table(max_aparelhos=2)
+    ids = [uuid.uuid4() for _ in range(3)]
+    table.touch_many([(aparelho_id, NOW) for aparelho_id in ids], now=NOW)
+
+    assert table.count(now=NOW) == 2
+    assert table.last_seen(ids[2]) is None
+    assert table.full == 1
@@ -0,0 +1,112 @@
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from sqlmodel import Session
+
+from app import crud
+from app.core.cache import entity_cache
+from app.core.leader import Leadership
+from app.core.scheduler import ComandoScheduler
+from app.models import (
+    COMANDO_STATUS_AGENDADO,
+    COMANDO_STATUS_PENDENTE,
+    Comando,
+    ComandoPublic,
+)
+from tests.utils.comando import create_random_controlador
+
+
+def make_scheduler(leading: bool = True) -> ComandoScheduler:
+    leadership = Leadership("test-scheduler")
+    if leading:
+        leadership._leading.set()
+    return ComandoScheduler(
+        leadership=leadership,
+        interval_seconds=60,
+        horizon_seconds=3600,
+        batch_size=2,
+    )
+
+
+def test_heap_holds_one_entry_per_due_second() -> None:
+    scheduler = make_scheduler()
+    with patch("app.crud.get_scheduled_seconds", return_value=[]):
+        assert scheduler.run() == 0
+
+    second = math.floor(time.time()) + 100
+    # The same second, rounded up
+    scheduler.schedule(second + 0.2)
+    scheduler.schedule(second + 0.7)
+    scheduler.schedule(second + 10)
+    # Beyond the horizon, loaded later
+    scheduler.schedule(second + 7200)
+    assert scheduler.stats()["heap_size"] == 2
+
+    follower = make_scheduler(leading=False)
+    follower.schedule(second)
+    assert follower.stats()["heap_size"] == 0
+
+
+def test_schedule_during_a_load_is_kept() -> None:
+    scheduler = make_scheduler()
+    second = math.floor(time.time()) + 100
+
+    def scheduled_meanwhile(**_kwargs: object) -> list[int]:
+        # Committed after the load's query, announced before it finished
+        scheduler.schedule(second)
+        return []
+
+    with patch("app.crud.get_scheduled_seconds", side_effect=scheduled_meanwhile):
+        scheduler.run()
+    assert scheduler.stats()["heap_size"] == 1
+
+
+def test_overdue_comandos_are_queued(db: Session) -> None:
+    controlador = create_random_controlador(db)
+    # Came due while no worker was leading
+    comandos = [
+        Comando(
+            controlador_id=controlador.id,
+            comando="abrir_valvula",
+            param=str(i),
+            status=COMANDO_STATUS_AGENDADO,
+            agendado_para=datetime.now(timezone.utc) - timedelta(seconds=30),
+        )
+        for i in range(3)
+    ]
+    later = Comando(
+        controlador_id=controlador.id,
+        comando="fechar_valvula",
+        param="1",
+        status=COMANDO_STATUS_AGENDADO,
+        agendado_para=datetime.now(timezone.utc) + timedelta(minutes=10),
+    )
+    db.add_all([*comandos, later])
+    db.commit()
+    entity_cache.get_or_load(
+        ComandoPublic,
+        "comando",
+        comandos[0].id,
+        lambda: db.get(Comando, comandos[0].id),
+    )
+    scheduler = make_scheduler()
+
+    # Two batches of two, until one comes back short
+    assert scheduler.run() >= 3
+    pending = crud.get_pending_comandos(session=db, controlador_id=controlador.id)
+    assert {comando.param for comando in pending} == {"0", "1", "2"}
+    db.refresh(later)
+    assert later.status == COMANDO_STATUS_AGENDADO
+    assert scheduler.reloads == 1
+    assert all(comando.status == COMANDO_STATUS_PENDENTE for comando in pending)
+    # The agendado copy isn't served anymore
+    cached = entity_cache.get_or_load(
+        ComandoPublic,
+        "comando",
+        comandos[0].id,
+        lambda: db.get(Comando, comandos[0].id),
+    )
+    assert cached is not None
+    assert cached.status == COMANDO_STATUS_PENDENTE
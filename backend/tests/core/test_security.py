@@ -0,0 +1,47 @@
+import asyncio
+import threading
+
+import pytest
+from passlib.context import CryptContext
+
+from app.core import security
+
+
+def test_password_pool_rejects_when_full() -> None:
+    pool = security.PasswordPool(workers=1, queue_size=1)
+    release = threading.Event()
+    running = pool.submit(release.wait, 5)
+    queued = pool.submit(release.wait, 5)
+
+    with pytest.raises(security.PasswordPoolFull):
+        pool.submit(release.wait, 5)
+    assert pool.stats()["rejected"] == 1
+
+    release.set()
+    assert running.result(timeout=5)
+    assert queued.result(timeout=5)
+    # Slots are given back once the work is done
+    assert pool.call(lambda: "ok") == "ok"
+    assert pool.stats()["in_flight"] == 0
+
+
+def test_verify_and_update_password_rehashes_other_cost_factor() -> None:
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret")
+    verified, new_hash = asyncio.run(
+        security.verify_and_update_password("secret", old_hash)
+    )
+    assert verified
+    assert new_hash is not None
+    assert security.verify_password("secret", new_hash)
+
+    verified, new_hash = asyncio.run(
+        security.verify_and_update_password("secret", new_hash)
+    )
+    assert verified
+    assert new_hash is None
+
+    verified, new_hash = asyncio.run(
+        security.verify_and_update_password("wrong", old_hash)
+    )
+    assert not verified
+    assert new_hash is None
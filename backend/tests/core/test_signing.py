@@ -0,0 +1,66 @@
+import time
+import uuid
+
+import pytest
+
+from app.core import signing
+
+
+def signed(key: str, **overrides: str) -> dict[str, str]:
+    request = {
+        "controlador_id": str(uuid.uuid4()),
+        "timestamp": str(int(time.time())),
+        "nonce": uuid.uuid4().hex,
+        "method": "POST",
+        "path": "/api/v1/comandos/confirmar",
+        "query": "",
+    }
+    request.update(overrides)
+    request["signature"] = signing.sign(key, body=b"[]", **request)
+    return request
+
+
+def test_verify_accepts_valid_signature() -> None:
+    keys = signing.ControladorKeys(current="segredo")
+    signing.verify(keys, body=b"[]", **signed("segredo"))
+
+
+def test_verify_rejects_tampered_body() -> None:
+    keys = signing.ControladorKeys(current="segredo")
+    with pytest.raises(signing.SignatureError, match="Invalid signature"):
+        signing.verify(keys, body=b"[{}]", **signed("segredo"))
+
+
+def test_verify_rejects_tampered_query() -> None:
+    keys = signing.ControladorKeys(current="segredo")
+    request = signed("segredo", query="limit=1")
+    with pytest.raises(signing.SignatureError, match="Invalid signature"):
+        signing.verify(keys, body=b"[]", **{**request, "query": "limit=100"})
+
+
+def test_verify_rejects_replay() -> None:
+    keys = signing.ControladorKeys(current="segredo")
+    request = signed("segredo")
+    signing.verify(keys, body=b"[]", **request)
+    with pytest.raises(signing.SignatureError, match="already used"):
+        signing.verify(keys, body=b"[]", **request)
+
+
+def test_verify_rejects_old_timestamp() -> None:
+    keys = signing.ControladorKeys(current="segredo")
+    request = signed("segredo", timestamp=str(int(time.time()) - 3600))
+    with pytest.raises(signing.SignatureError, match="expired"):
+        signing.verify(keys, body=b"[]", **request)
+
+
+def test_previous_key_only_during_grace_period() -> None:
+    recent = signing.ControladorKeys(
+        current="nova", previous="antiga", rotated_at=time.time()
+    )
+    signing.verify(recent, body=b"[]", **signed("antiga"))
+
+    expired = signing.ControladorKeys(
+        current="nova", previous="antiga", rotated_at=time.time() - 10**7
+    )
+    with pytest.raises(signing.SignatureError, match="Invalid signature"):
+        signing.verify(expired, body=b"[]", **signed("antiga"))
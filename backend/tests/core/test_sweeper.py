@@ -0,0 +1,208 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlmodel import Session
+
+from app.core.cache import entity_cache
+from app.core.leader import Leadership
+from app.core.sweeper import (
+    ComandoExpirySweeper,
+    EmailOutboxPurger,
+    IdempotencyKeyPurger,
+    OfflineSweeper,
+)
+from app.models import (
+    APARELHO_STATUS_OFFLINE,
+    APARELHO_STATUS_ONLINE,
+    COMANDO_STATUS_AGENDADO,
+    COMANDO_STATUS_EXPIRADO,
+    COMANDO_STATUS_PENDENTE,
+    COMANDO_STATUS_RESERVADO,
+    EMAIL_STATUS_ENVIADO,
+    EMAIL_STATUS_PENDENTE,
+    Aparelho,
+    Comando,
+    ComandoPublic,
+    EmailOutbox,
+    IdempotencyKey,
+)
+from tests.utils.comando import create_random_controlador
+
+
+def create_aparelho(db: Session, status: str, seconds_ago: float) -> Aparelho:
+    controlador = create_random_controlador(db)
+    aparelho = db.get(Aparelho, controlador.aparelho_id)
+    assert aparelho
+    aparelho.status = status
+    aparelho.ultima_conexao = datetime.now(timezone.utc) - timedelta(
+        seconds=seconds_ago
+    )
+    db.add(aparelho)
+    db.commit()
+    return aparelho
+
+
+def test_sweep_sets_silent_aparelhos_offline(db: Session) -> None:
+    silent = create_aparelho(db, APARELHO_STATUS_ONLINE, 600)
+    recent = create_aparelho(db, APARELHO_STATUS_ONLINE, 10)
+    sweeper = OfflineSweeper(
+        leadership=Leadership("test-sweeper"),
+        interval_seconds=60,
+        offline_after=300,
+        batch_size=10_000,
+    )
+
+    assert sweeper.run() >= 1
+    assert sweeper.runs == 1
+    assert sweeper.last_processed == sweeper.processed
+    assert sweeper.last_run_seconds is not None
+
+    for aparelho in (silent, recent):
+        db.refresh(aparelho)
+    assert silent.status == APARELHO_STATUS_OFFLINE
+    assert recent.status == APARELHO_STATUS_ONLINE
+    # Nothing left to flip
+    processed = sweeper.processed
+    sweeper.run()
+    db.refresh(silent)
+    assert silent.status == APARELHO_STATUS_OFFLINE
+    assert sweeper.processed >= processed
+
+
+def test_purger_deletes_expired_idempotency_keys(db: Session) -> None:
+    now = datetime.now(timezone.utc)
+    keys = [
+        IdempotencyKey(
+            key_hash=os.urandom(32),
+            request_hash=os.urandom(32),
+            status_code=200,
+            body=b"{}",
+            expires_at=now + timedelta(seconds=seconds),
+        )
+        for seconds in (-60, -60, -60, 3600)
+    ]
+    db.add_all(keys)
+    db.commit()
+    purger = IdempotencyKeyPurger(
+        leadership=Leadership("test-purger"), interval_seconds=60, batch_size=2
+    )
+
+    # Two batches, until one comes back short
+    assert purger.run() >= 3
+    for key in keys[:3]:
+        assert db.get(IdempotencyKey, key.key_hash, populate_existing=True) is None
+    assert db.get(IdempotencyKey, keys[3].key_hash) is not None
+
+
+def test_purger_deletes_old_sent_emails(db: Session) -> None:
+    now = datetime.now(timezone.utc)
+    emails = [
+        EmailOutbox(
+            email_to="purge@example.com",
+            subject="Purge",
+            status=status,
+            sent_at=sent_at,
+        )
+        for status, sent_at in [
+            (EMAIL_STATUS_ENVIADO, now - timedelta(days=30)),
+            (EMAIL_STATUS_ENVIADO, now - timedelta(days=30)),
+            (EMAIL_STATUS_ENVIADO, now - timedelta(days=30)),
+            (EMAIL_STATUS_ENVIADO, now),
+            (EMAIL_STATUS_PENDENTE, None),
+        ]
+    ]
+    db.add_all(emails)
+    db.commit()
+    purger = EmailOutboxPurger(
+        leadership=Leadership("test-email-purger"),
+        interval_seconds=60,
+        retention_seconds=86_400,
+        batch_size=2,
+    )
+
+    assert purger.run() >= 3
+    for email in emails[:3]:
+        assert db.get(EmailOutbox, email.id, populate_existing=True) is None
+    for email in emails[3:]:
+        assert db.get(EmailOutbox, email.id, populate_existing=True) is not None
+
+
+def test_expiry_sweeper_expires_waiting_comandos(db: Session) -> None:
+    controlador = create_random_controlador(db)
+    now = datetime.now(timezone.utc)
+    comandos = [
+        Comando(
+            controlador_id=controlador.id,
+            comando="abrir_valvula",
+            param=str(i),
+            status=status,
+            expira_em=now + timedelta(seconds=seconds),
+        )
+        for i, (status, seconds) in enumerate(
+            [
+                (COMANDO_STATUS_PENDENTE, -60),
+                (COMANDO_STATUS_PENDENTE, -30),
+                (COMANDO_STATUS_AGENDADO, -30),
+                (COMANDO_STATUS_PENDENTE, 3600),
+            ]
+        )
+    ]
+    db.add_all(comandos)
+    db.commit()
+    entity_cache.get_or_load(
+        ComandoPublic,
+        "comando",
+        comandos[0].id,
+        lambda: db.get(Comando, comandos[0].id),
+    )
+    sweeper = ComandoExpirySweeper(
+        leadership=Leadership("test-expiry"), interval_seconds=60, batch_size=2
+    )
+
+    # Two batches, until one comes back short
+    assert sweeper.run() >= 3
+    for comando in comandos:
+        db.refresh(comando)
+    assert [c.status for c in comandos] == [COMANDO_STATUS_EXPIRADO] * 3 + [
+        COMANDO_STATUS_PENDENTE
+    ]
+    cached = entity_cache.get_or_load(
+        ComandoPublic,
+        "comando",
+        comandos[0].id,
+        lambda: db.get(Comando, comandos[0].id),
+    )
+    assert cached is not None
+    assert cached.status == COMANDO_STATUS_EXPIRADO
+
+
+def test_expiry_sweeper_expires_reservado_comandos_with_lapsed_lease(
+    db: Session,
+) -> None:
+    controlador = create_random_controlador(db)
+    now = datetime.now(timezone.utc)
+    comandos = [
+        Comando(
+            controlador_id=controlador.id,
+            comando="abrir_valvula",
+            param=str(i),
+            status=COMANDO_STATUS_RESERVADO,
+            expira_em=now - timedelta(seconds=60),
+            reserva_expira_em=now + timedelta(seconds=seconds),
+        )
+        for i, seconds in enumerate([-30, 30])
+    ]
+    db.add_all(comandos)
+    db.commit()
+    sweeper = ComandoExpirySweeper(
+        leadership=Leadership("test-expiry"), interval_seconds=60, batch_size=10
+    )
+
+    # The one still leased may yet be acked by its controlador
+    assert sweeper.run() >= 1
+    for comando in comandos:
+        db.refresh(comando)
+    assert [c.status for c in comandos] == [
+        COMANDO_STATUS_EXPIRADO,
+        COMANDO_STATUS_RESERVADO,
+    ]
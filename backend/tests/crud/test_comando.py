@@ -0,0 +1,212 @@
+import math
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from sqlalchemy import text
+from sqlalchemy.sql import ClauseElement
+from sqlmodel import Session, col, func, select
+
+from app import crud
+from app.models import (
+    COMANDO_EXPIRAVEL_WHERE,
+    COMANDO_STATUS_AGENDADO,
+    COMANDO_STATUS_EXPIRADO,
+    COMANDO_STATUS_PENDENTE,
+    Comando,
+    ComandoCreate,
+)
+from tests.utils.comando import create_random_comando, create_random_controlador
+
+
+def explain(db: Session, statement: ClauseElement) -> str:
+    compiled = statement.compile(
+        dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True}
+    )
+    # The test tables are tiny, so a sequential scan would always win on cost;
+    # take it off the table to check that the planner *can* use an index.
+    db.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = "\n".join(db.execute(text(f"EXPLAIN {compiled}")).scalars().all())
+    db.rollback()
+    return plan
+
+
+def test_get_pending_comandos(db: Session) -> None:
+    controlador = create_random_controlador(db)
+    first = create_random_comando(db, controlador)
+    second = create_random_comando(db, controlador)
+    done = create_random_comando(db, controlador)
+    done.status = "executado"
+    db.add(done)
+    db.commit()
+
+    comandos = crud.get_pending_comandos(session=db, controlador_id=controlador.id)
+    assert [c.id for c in comandos] == [first.id, second.id]
+
+
+def test_pending_comandos_uses_partial_index(db: Session) -> None:
+    statement = crud.pending_comandos_statement(controlador_id=uuid.uuid4())
+    plan = explain(db, statement)
+    assert "ix_comando_pendente" in plan
+    assert "Seq Scan" not in plan
+
+
+def test_count_pending_comandos_uses_partial_index(db: Session) -> None:
+    statement = crud.count_pending_comandos_statement(controlador_id=uuid.uuid4())
+    plan = explain(db, statement)
+    assert "ix_comando_pendente" in plan
+    assert "Seq Scan" not in plan
+
+
+def test_comandos_by_status_uses_composite_index(db: Session) -> None:
+    statement = select(Comando).where(
+        Comando.controlador_id == uuid.uuid4(), Comando.status == "executado"
+    )
+    plan = explain(db, statement)
+    assert "ix_comando_controlador_id_status_timestamp_criado" in plan
+    assert "Seq Scan" not in plan
+
+
+def queue(
+    db: Session, controlador_id: uuid.UUID, comando: str, param: str
+) -> tuple[Comando, bool]:
+    queued = crud.create_comando(
+        session=db,
+        comando_in=ComandoCreate(
+            controlador_id=controlador_id, comando=comando, param=param
+        ),
+    )
+    db.commit()
+    return queued
+
+
+def test_create_comando_collapses_exact_duplicates(db: Session) -> None:
+    controlador = create_random_controlador(db)
+    first, created = queue(db, controlador.id, "abrir_valvula", "1")
+    assert created
+    again, created = queue(db, controlador.id, "abrir_valvula", "1")
+    assert not created
+    assert again.id == first.id
+    other, created = queue(db, controlador.id, "abrir_valvula", "2")
+    assert created
+
+    comandos = crud.get_pending_comandos(session=db, controlador_id=controlador.id)
+    assert [c.id for c in comandos] == [first.id, other.id]
+
+
+def test_create_comando_last_write_wins(db: Session) -> None:
+    controlador = create_random_controlador(db)
+    first, _ = queue(db, controlador.id, "setpoint", "20")
+    latest, created = queue(db, controlador.id, "setpoint", "25")
+    assert not created
+    assert latest.id == first.id
+    assert latest.param == "25"
+
+    comandos = crud.get_pending_comandos(session=db, controlador_id=controlador.id)
+    assert [(c.comando, c.param) for c in comandos] == [("setpoint", "25")]
+
+
+def test_create_comando_after_claim_is_queued_again(db: Session) -> None:
+    controlador = create_random_controlador(db)
+    first, _ = queue(db, controlador.id, "abrir_valvula", "1")
+    crud.claim_comandos(
+        session=db, controlador_id=controlador.id, limit=10, lease_seconds=60
+    )
+    db.commit()
+
+    second, created = queue(db, controlador.id, "abrir_valvula", "1")
+    assert created
+    assert second.id != first.id
+
+
+def test_not_coalesced_comandos_are_always_queued(db: Session) -> None:
+    controlador = create_random_controlador(db)
+    with patch("app.core.config.settings.COMANDOS_NOT_COALESCED", ["pulso"]):
+        queue(db, controlador.id, "pulso", "1")
+        queue(db, controlador.id, "pulso", "1")
+
+    comandos = crud.get_pending_comandos(session=db, controlador_id=controlador.id)
+    assert len(comandos) == 2
+
+
+def test_scheduled_comando_is_queued_when_due(db: Session) -> None:
+    controlador = create_random_controlador(db)
+    due = datetime.now(timezone.utc) + timedelta(seconds=60)
+    comando, created = crud.create_comando(
+        session=db,
+        comando_in=ComandoCreate(
+            controlador_id=controlador.id,
+            comando="abrir_valvula",
+            param="1",
+            agendado_para=due,
+        ),
+    )
+    db.commit()
+    assert created
+    assert comando.status == COMANDO_STATUS_AGENDADO
+    assert comando.chave_coalescencia is None
+    assert crud.get_pending_comandos(session=db, controlador_id=controlador.id) == []
+
+    seconds = crud.get_scheduled_seconds(session=db, until=due + timedelta(seconds=1))
+    assert math.ceil(due.timestamp()) in seconds
+
+    queued = crud.queue_due_comandos(
+        session=db, now=due + timedelta(seconds=1), limit=10_000
+    )
+    db.commit()
+    assert (comando.id, controlador.id) in queued
+    db.refresh(comando)
+    assert comando.status == COMANDO_STATUS_PENDENTE
+
+
+def test_scheduled_seconds_uses_partial_index(db: Session) -> None:
+    statement = select(Comando.id).where(
+        Comando.status == COMANDO_STATUS_AGENDADO,
+        col(Comando.agendado_para) < func.now(),
+    )
+    assert "ix_comando_agendado" in explain(db, statement)
+
+
+def test_expired_comandos_are_not_polled(db: Session) -> None:
+    controlador = create_random_controlador(db)
+    now = datetime.now(timezone.utc)
+    live, _ = crud.create_comando(
+        session=db,
+        comando_in=ComandoCreate(
+            controlador_id=controlador.id,
+            comando="abrir_valvula",
+            param="1",
+            expira_em=now + timedelta(hours=1),
+        ),
+    )
+    stale, _ = crud.create_comando(
+        session=db,
+        comando_in=ComandoCreate(
+            controlador_id=controlador.id,
+            comando="abrir_valvula",
+            param="2",
+            expira_em=now - timedelta(seconds=1),
+        ),
+    )
+    db.commit()
+
+    # Excluded before the sweeper gets to it
+    comandos = crud.get_pending_comandos(session=db, controlador_id=controlador.id)
+    assert [c.id for c in comandos] == [live.id]
+    claimed = crud.claim_comandos(
+        session=db, controlador_id=controlador.id, limit=10, lease_seconds=60
+    )
+    db.commit()
+    assert [c.id for c in claimed] == [live.id]
+
+    assert stale.id in crud.expire_comandos(session=db, now=now, limit=10_000)
+    db.commit()
+    db.refresh(stale)
+    assert stale.status == COMANDO_STATUS_EXPIRADO
+
+
+def test_expire_comandos_uses_partial_index(db: Session) -> None:
+    statement = select(Comando.id).where(
+        text(COMANDO_EXPIRAVEL_WHERE), col(Comando.expira_em) <= func.now()
+    )
+    assert "ix_comando_expira" in explain(db, statement)
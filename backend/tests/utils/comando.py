@@ -0,0 +1,78 @@
+import time
+import uuid
+
+from sqlmodel import Session
+
+from app.core import signing
+from app.models import Agricultor, Aparelho, Comando, Controlador, Setor
+from tests.utils.user import create_random_user
+from tests.utils.utils import random_lower_string
+
+
+def create_random_setor(db: Session) -> Setor:
+    user = create_random_user(db)
+    agricultor = Agricultor(
+        nome=random_lower_string(), cpf=random_lower_string()[:14], user_id=user.id
+    )
+    db.add(agricultor)
+    db.flush()
+    setor = Setor(nome=random_lower_string(), agricultor_id=agricultor.id)
+    db.add(setor)
+    db.commit()
+    db.refresh(setor)
+    return setor
+
+
+def create_random_controlador(db: Session, setor: Setor | None = None) -> Controlador:
+    setor = setor or create_random_setor(db)
+    aparelho = Aparelho(setor_id=setor.id, agricultor_id=setor.agricultor_id)
+    db.add(aparelho)
+    db.flush()
+    controlador = Controlador(aparelho_id=aparelho.id, assinatura=random_lower_string())
+    db.add(controlador)
+    db.commit()
+    db.refresh(controlador)
+    return controlador
+
+
+def create_random_comando(db: Session, controlador: Controlador) -> Comando:
+    comando = Comando(
+        controlador_id=controlador.id,
+        comando=random_lower_string(),
+        param=random_lower_string(),
+    )
+    db.add(comando)
+    db.commit()
+    db.refresh(comando)
+    return comando
+
+
+def controlador_auth_headers(
+    controlador: Controlador,
+    method: str,
+    path: str,
+    body: bytes = b"",
+    *,
+    query: str = "",
+    key: str | None = None,
+    timestamp: int | None = None,
+) -> dict[str, str]:
+    controlador_id = str(controlador.id)
+    signed_at = str(int(time.time()) if timestamp is None else timestamp)
+    nonce = uuid.uuid4().hex
+    signature = signing.sign(
+        key if key is not None else controlador.assinatura,
+        controlador_id=controlador_id,
+        timestamp=signed_at,
+        nonce=nonce,
+        method=method,
+        path=path,
+        query=query,
+        body=body,
+    )
+    return {
+        signing.CONTROLADOR_HEADER: controlador_id,
+        signing.TIMESTAMP_HEADER: signed_at,
+        signing.NONCE_HEADER: nonce,
+        signing.SIGNATURE_HEADER: signature,
+    }